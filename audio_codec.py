@@ -0,0 +1,48 @@
+# audio_codec.py
+
+import io
+import wave
+import subprocess
+
+# Formatos de subida: extensión, tipo MIME y argumentos de salida de ffmpeg
+FORMATS = {
+    "wav": ("wav", "audio/wav", None),
+    "flac": ("flac", "audio/flac", ["-c:a", "flac", "-f", "flac"]),
+    "opus": ("ogg", "audio/ogg", ["-c:a", "libopus", "-b:a", "24k", "-application", "voip", "-f", "ogg"]),
+}
+
+
+def encode_wav(pcm, sample_rate, sample_width=2, channels=1):
+    """Empaqueta PCM en un WAV en memoria."""
+    buffer = io.BytesIO()
+    with wave.open(buffer, "wb") as wav:
+        wav.setnchannels(channels)
+        wav.setsampwidth(sample_width)
+        wav.setframerate(sample_rate)
+        wav.writeframes(pcm)
+    return buffer.getvalue()
+
+
+def encode(pcm, sample_rate, fmt="wav"):
+    """
+    Codifica PCM int16 mono para subirlo, sin pasar por disco. WAV se arma en el proceso;
+    los formatos comprimidos (opcionales) pasan por un ffmpeg por llamada que lee y
+    escribe por tuberías. Devuelve (datos, nombre de archivo, tipo MIME). Si el formato
+    no existe o ffmpeg falla se usa WAV.
+    """
+    if fmt not in FORMATS:
+        print(f"Formato de audio desconocido '{fmt}'; se usa wav.")
+        fmt = "wav"
+    extension, mime, output_args = FORMATS[fmt]
+    if output_args is not None:
+        try:
+            result = subprocess.run(
+                ["ffmpeg", "-hide_banner", "-loglevel", "error",
+                 "-f", "s16le", "-ar", str(sample_rate), "-ac", "1", "-i", "pipe:0", *output_args, "pipe:1"],
+                input=pcm, capture_output=True, check=True,
+            )
+            return result.stdout, f"audio.{extension}", mime
+        except (OSError, subprocess.CalledProcessError) as e:
+            print(f"No se pudo codificar en {fmt} ({e}); se usa wav.")
+            extension, mime, _ = FORMATS["wav"]
+    return encode_wav(pcm, sample_rate), f"audio.{extension}", mime
@@ -0,0 +1,179 @@
+# audio_sink.py
+
+import os
+import time
+import queue
+import threading
+import collections
+import pyaudio
+from pydub import AudioSegment
+from metrics import Histogram
+
+try:
+    import miniaudio  # Decodificador dentro del proceso (mp3, wav, flac y ogg) con remuestreo
+except ImportError:  # Opcional: sin él se decodifica con pydub, que arranca ffmpeg por archivo
+    miniaudio = None
+
+SINK_SAMPLE_RATE = 24000  # La frecuencia de los mp3 de gTTS: sus audios no necesitan remuestreo
+SINK_FRAMES_PER_BUFFER = 1024
+SOUND_EXTENSIONS = ('.wav', '.mp3', '.ogg', '.flac')
+
+SINK_START_SECONDS = Histogram("sayfi_audio_sink_start_seconds",
+                               "Tiempo desde que se pide un audio hasta que empieza a sonar (incluye la latencia de salida).",
+                               buckets=(0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5))
+
+
+class Clip:
+    """
+    Audio PCM en la cola de la salida. done se activa cuando terminó de sonar o se cortó.
+    """
+
+    def __init__(self, pcm, name="", on_done=None):
+        self.data = memoryview(pcm)
+        self.offset = 0
+        self.name = name
+        self.on_done = on_done
+        self.submitted = time.perf_counter()
+        self.started = None
+        self.interrupted = False
+        self.done = threading.Event()
+
+    def wait(self, timeout=None):
+        return self.done.wait(timeout)
+
+
+class AudioSink:
+    """
+    Salida de audio persistente: un único stream de PyAudio que se abre al arrancar.
+
+    Los audios se decodifican a PCM (mono, 16 bits, SINK_SAMPLE_RATE) y se encolan; el
+    callback del stream los va copiando uno detrás de otro, así dos audios seguidos
+    suenan sin hueco y cada uno empieza en cuanto se pide, sin abrir un reproductor
+    por audio. Con miniaudio instalado la decodificación también ocurre en el proceso;
+    si no, pydub arranca ffmpeg para cada archivo que no esté precargado. Los sonidos
+    cortos (avisos) se precargan en memoria.
+    """
+
+    def __init__(self, sample_rate=SINK_SAMPLE_RATE, frames_per_buffer=SINK_FRAMES_PER_BUFFER, device_index=None):
+        self.sample_rate = sample_rate
+        self.frames_per_buffer = frames_per_buffer
+        self.device_index = device_index
+        self.clips = collections.deque()
+        self.lock = threading.Lock()
+        self.finished = queue.Queue()
+        self.cache = {}
+        self.audio = None
+        self.stream = None
+        self.output_latency = 0.0
+        self.finisher = threading.Thread(target=self._finish_worker, daemon=True)
+
+    def start(self):
+        self.audio = pyaudio.PyAudio()
+        self.stream = self.audio.open(format=pyaudio.paInt16, channels=1, rate=self.sample_rate, output=True,
+                                      output_device_index=self.device_index,
+                                      frames_per_buffer=self.frames_per_buffer,
+                                      stream_callback=self._callback)
+        self.output_latency = self.stream.get_output_latency()
+        self.stream.start_stream()
+        self.finisher.start()
+        print(f"Salida de audio persistente iniciada ({self.sample_rate} Hz, latencia {self.output_latency * 1000:.0f} ms).")
+        if miniaudio is None:
+            print("miniaudio no está instalado: cada audio se decodificará con ffmpeg.")
+
+    def close(self):
+        self.interrupt()
+        if self.stream is not None:
+            self.stream.stop_stream()
+            self.stream.close()
+            self.audio.terminate()
+            self.stream = None
+
+    def decode(self, path):
+        """
+        Decodifica un archivo al formato de la salida; los precargados salen de memoria.
+        """
+        pcm = self.cache.get(os.path.abspath(path))
+        if pcm is not None:
+            return pcm
+        if miniaudio is not None:
+            try:
+                decoded = miniaudio.decode_file(path, output_format=miniaudio.SampleFormat.SIGNED16,
+                                                nchannels=1, sample_rate=self.sample_rate)
+                return decoded.samples.tobytes()
+            except miniaudio.DecodeError as e:
+                print(f"miniaudio no pudo decodificar {os.path.basename(path)} ({e}); se usará ffmpeg.")
+        segment = AudioSegment.from_file(path)
+        return segment.set_frame_rate(self.sample_rate).set_channels(1).set_sample_width(2).raw_data
+
+    def preload(self, directory):
+        """Decodifica y guarda en memoria todos los sonidos de la carpeta."""
+        for filename in sorted(os.listdir(directory)):
+            if filename.lower().endswith(SOUND_EXTENSIONS):
+                path = os.path.abspath(os.path.join(directory, filename))
+                try:
+                    self.cache[path] = self.decode(path)
+                except Exception as e:
+                    print(f"No se pudo precargar {filename}: {e}")
+        print(f"{len(self.cache)} sonidos precargados desde {directory}.")
+
+    def play(self, pcm, name="", on_done=None):
+        """
+        Encola PCM para reproducir tras lo que ya está sonando. No bloquea: devuelve el Clip.
+        """
+        clip = Clip(pcm, name, on_done)
+        with self.lock:
+            self.clips.append(clip)
+        return clip
+
+    def play_file(self, path, on_done=None):
+        return self.play(self.decode(path), os.path.basename(path), on_done)
+
+    def interrupt(self, flush=True):
+        """
+        Corta el audio que está sonando y, con flush, descarta también los encolados;
+        sin flush, un audio que todavía no empezó se deja en la cola.
+        Devuelve (si algo estaba sonando, cuántos encolados se descartaron sin sonar).
+        """
+        with self.lock:
+            playing = bool(self.clips) and self.clips[0].started is not None
+            if flush:
+                cut = list(self.clips)
+            else:
+                cut = [self.clips[0]] if playing else []
+            for clip in cut:
+                clip.interrupted = True
+                self.clips.popleft()
+                self.finished.put(clip)
+        dropped = sum(1 for clip in cut if clip.started is None)
+        return playing, dropped
+
+    def _callback(self, in_data, frame_count, time_info, status):
+        needed = frame_count * 2
+        out = bytearray(needed)  # Silencio si no hay nada que reproducir
+        filled = 0
+        with self.lock:
+            while filled < needed and self.clips:
+                clip = self.clips[0]
+                if clip.started is None:
+                    clip.started = time.perf_counter()
+                chunk = clip.data[clip.offset:clip.offset + needed - filled]
+                out[filled:filled + len(chunk)] = chunk
+                filled += len(chunk)
+                clip.offset += len(chunk)
+                if clip.offset >= len(clip.data):
+                    self.clips.popleft()
+                    self.finished.put(clip)
+        return (bytes(out), pyaudio.paContinue)
+
+    def _finish_worker(self):
+        # Fuera del callback de audio: avisar del final de cada clip sin retrasar la salida
+        while True:
+            clip = self.finished.get()
+            if clip.started is not None:
+                SINK_START_SECONDS.observe(clip.started - clip.submitted + self.output_latency)
+            clip.done.set()
+            if clip.on_done:
+                try:
+                    clip.on_done(clip)
+                except Exception as e:
+                    print(f"Error al notificar el fin del audio {clip.name}: {e}")
@@ -0,0 +1,158 @@
+# audio_stream.py
+
+import threading
+import numpy as np
+import pyaudio
+
+SAMPLE_RATE = 16000
+SAMPLE_WIDTH = 2  # int16
+FRAME_MS = 30
+BUFFER_SECONDS = 30  # Audio que se conserva en el buffer circular
+
+# Seguimiento del ruido de fondo: baja rápido cuando hay silencio y sube muy despacio,
+# así la voz no lo arrastra hacia arriba pero un ruido constante nuevo sí se aprende.
+NOISE_FALL = 0.3
+NOISE_RISE = 0.002
+SPEECH_FACTOR = 3.0  # Energía sobre el ruido de fondo para considerar que hay voz (~+9.5 dB)
+MIN_ENERGY_THRESHOLD = 100
+
+
+def frame_rms(frame):
+    """RMS de un frame PCM int16."""
+    samples = np.frombuffer(frame, dtype=np.int16).astype(np.float32)
+    if not samples.size:
+        return 0.0
+    return float(np.sqrt(np.mean(samples * samples)))
+
+
+class AudioStream:
+    """
+    Captura continua del micrófono en un buffer circular de PCM de tamaño fijo.
+
+    El stream de PyAudio se abre una sola vez y escribe desde su callback. Las
+    posiciones son absolutas (bytes escritos desde el arranque), así un lector puede
+    empezar exactamente donde se detectó la palabra clave aunque el audio ya se haya
+    capturado. Mientras tanto se sigue el nivel de ruido de fondo, que sustituye a
+    adjust_for_ambient_noise.
+    """
+
+    def __init__(self, sample_rate=SAMPLE_RATE, frame_ms=FRAME_MS, seconds=BUFFER_SECONDS, device_index=None):
+        self.sample_rate = sample_rate
+        self.frame_samples = int(sample_rate * frame_ms / 1000)
+        self.frame_bytes = self.frame_samples * SAMPLE_WIDTH
+        self.capacity = self.frame_bytes * int(seconds * 1000 / frame_ms)
+        self.buffer = bytearray(self.capacity)
+        self.written = 0
+        self.device_index = device_index
+        self.condition = threading.Condition()
+        self.noise_floor = None
+        self.audio = None
+        self.stream = None
+        self.closed = False
+
+    def start(self):
+        self.audio = pyaudio.PyAudio()
+        self.stream = self.audio.open(format=pyaudio.paInt16, channels=1, rate=self.sample_rate, input=True,
+                                      input_device_index=self.device_index,
+                                      frames_per_buffer=self.frame_samples,
+                                      stream_callback=self._callback)
+        self.stream.start_stream()
+        print(f"Captura continua iniciada ({self.capacity // (self.sample_rate * SAMPLE_WIDTH)} s de buffer).")
+
+    def close(self):
+        if self.stream is not None:
+            self.stream.stop_stream()
+            self.stream.close()
+            self.audio.terminate()
+            self.stream = None
+        with self.condition:
+            self.closed = True
+            self.condition.notify_all()
+
+    def _callback(self, in_data, frame_count, time_info, status):
+        self.write(in_data)
+        return (None, pyaudio.paContinue)
+
+    def write(self, data):
+        self._track_noise(data)
+        with self.condition:
+            start = self.written % self.capacity
+            end = start + len(data)
+            if end <= self.capacity:
+                self.buffer[start:end] = data
+            else:
+                split = self.capacity - start
+                self.buffer[start:] = data[:split]
+                self.buffer[:end - self.capacity] = data[split:]
+            self.written += len(data)
+            self.condition.notify_all()
+
+    def _track_noise(self, frame):
+        rms = frame_rms(frame)
+        if self.noise_floor is None:
+            self.noise_floor = rms
+        elif rms < self.noise_floor:
+            self.noise_floor += (rms - self.noise_floor) * NOISE_FALL
+        else:
+            self.noise_floor += (rms - self.noise_floor) * NOISE_RISE
+
+    @property
+    def energy_threshold(self):
+        """Energía mínima (RMS) para considerar que un frame tiene voz."""
+        return max(MIN_ENERGY_THRESHOLD, (self.noise_floor or 0) * SPEECH_FACTOR)
+
+    @property
+    def position(self):
+        return self.written
+
+    def read(self, position, size, timeout=None):
+        """
+        Lee size bytes desde la posición absoluta dada. Espera hasta timeout segundos
+        a que se capturen; devuelve (datos, posición siguiente) o (None, posición).
+        Si el lector se quedó atrás más que la capacidad del buffer, salta al audio
+        más antiguo disponible.
+        """
+        with self.condition:
+            if not self.condition.wait_for(lambda: self.written >= position + size or self.closed, timeout):
+                return None, position
+            if self.written < position + size:
+                return None, position
+            oldest = self.written - self.capacity
+            if position < oldest:
+                print(f"Lector atrasado {(oldest - position) / (self.sample_rate * SAMPLE_WIDTH):.1f} s; se descarta audio antiguo.")
+                position = oldest
+            start = position % self.capacity
+            end = start + size
+            if end <= self.capacity:
+                data = bytes(self.buffer[start:end])
+            else:
+                data = bytes(self.buffer[start:]) + bytes(self.buffer[:end - self.capacity])
+            return data, position + size
+
+    def reader(self, position=None):
+        """
+        Crea un cursor de lectura; por defecto desde el audio más reciente.
+        """
+        return StreamReader(self, self.written if position is None else position)
+
+
+class StreamReader:
+    """
+    Cursor independiente sobre el buffer compartido de un AudioStream.
+    """
+
+    def __init__(self, stream, position):
+        self.stream = stream
+        self.position = position
+
+    def read(self, size=None, timeout=None):
+        """
+        Devuelve el siguiente bloque (un frame por defecto) o None si no llegó audio a tiempo.
+        """
+        data, self.position = self.stream.read(self.position, size or self.stream.frame_bytes, timeout)
+        return data
+
+    @property
+    def lag(self):
+        """Segundos de audio capturado que este lector todavía no ha leído."""
+        return (self.stream.written - self.position) / (self.stream.sample_rate * SAMPLE_WIDTH)
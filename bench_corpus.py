@@ -0,0 +1,160 @@
+# bench_corpus.py
+"""
+Genera el corpus de audios de prueba de Transcriber: palabra clave, órdenes, stop,
+ruido y silencio, en WAV mono de 16 bits a 16 kHz, más su manifiesto.
+
+Las frases se sintetizan con gTTS (hace falta red y ffmpeg para decodificar el mp3) y
+cada una se guarda limpia y mezclada con ruido de fondo a NOISY_SNR_DB; el ruido y el
+silencio se generan en local. El manifiesto es un JSON por línea, compatible con
+bench_stt.py, con dos campos más para bench_transcriber.py:
+    {"audio": "command_01_limpio.wav", "text": "pausa la impresión", "kind": "command", "keyword": null}
+kind es wake, wake_command, command, stop, noise o silence; keyword es el resultado que
+debe dar la detección de palabra clave (el nombre del asistente, "Stop" o null).
+También se pueden añadir grabaciones propias al manifiesto con el mismo formato.
+Uso: python bench_corpus.py [--output fixtures/stt] [--keyword Asistente] [--seed 0]
+"""
+
+import io
+import os
+import sys
+import json
+import wave
+import argparse
+import numpy as np
+from gtts import gTTS
+from pydub import AudioSegment
+from dotenv import load_dotenv
+
+load_dotenv()  # El nombre del asistente sale de ASSISTANT, igual que en transcriber.py
+
+SAMPLE_RATE = 16000
+PADDING_SECONDS = 0.3  # Silencio antes y después de cada frase
+NOISE_SECONDS = 3.0
+NOISY_SNR_DB = 10  # Relación señal/ruido de las variantes con ruido
+ROOM_TONE_RMS = 30  # Ruido eléctrico de fondo de un micrófono en reposo
+
+COMMANDS = [
+    "¿cuál es la temperatura del extrusor?",
+    "pausa la impresión",
+    "¿cuánto le falta a la impresión?",
+    "calienta la cama a sesenta grados",
+    "sube el volumen",
+    "cancela la impresión actual",
+    "lleva el cabezal a casa",
+    "¿qué archivo se está imprimiendo?",
+]
+WAKE_PHRASES = ["{keyword}", "oye {keyword}"]
+WAKE_COMMANDS = ["{keyword}, ¿cuál es la temperatura de la cama?", "{keyword}, reanuda la impresión"]
+STOP_PHRASES = ["stop", "stop por favor"]
+
+
+def synthesize(text, lang="es", tld="com.mx"):
+    """Texto a PCM int16 mono a 16 kHz con la misma voz que usa tts.py."""
+    mp3 = io.BytesIO()
+    gTTS(text=text, lang=lang, tld=tld).write_to_fp(mp3)
+    mp3.seek(0)
+    segment = AudioSegment.from_file(mp3, format="mp3")
+    segment = segment.set_frame_rate(SAMPLE_RATE).set_channels(1).set_sample_width(2)
+    return np.frombuffer(segment.raw_data, dtype=np.int16).astype(np.float32)
+
+
+def room_tone(rng, seconds):
+    return rng.normal(0, ROOM_TONE_RMS, int(seconds * SAMPLE_RATE)).astype(np.float32)
+
+
+def pad(rng, samples):
+    return np.concatenate([room_tone(rng, PADDING_SECONDS), samples, room_tone(rng, PADDING_SECONDS)])
+
+
+def rms(samples):
+    return float(np.sqrt(np.mean(samples * samples))) if samples.size else 0.0
+
+
+def fan_noise(rng, seconds):
+    """Ventilador: zumbido grave de la red y sus armónicos más ruido ancho filtrado."""
+    t = np.arange(int(seconds * SAMPLE_RATE)) / SAMPLE_RATE
+    hum = np.sin(2 * np.pi * 50 * t) + 0.5 * np.sin(2 * np.pi * 100 * t) + 0.25 * np.sin(2 * np.pi * 150 * t)
+    broadband = np.convolve(rng.normal(0, 1, t.size), np.ones(8) / 8, mode="same")
+    return (hum + 2 * broadband).astype(np.float32)
+
+
+def stepper_noise(rng, seconds):
+    """Motores paso a paso: pitidos que cambian de tono con cada movimiento."""
+    t = np.arange(int(seconds * SAMPLE_RATE)) / SAMPLE_RATE
+    samples = np.zeros(t.size, dtype=np.float32)
+    move = int(0.25 * SAMPLE_RATE)
+    for start in range(0, t.size, move):
+        frequency = rng.uniform(400, 2500)
+        end = min(t.size, start + move)
+        samples[start:end] = np.sign(np.sin(2 * np.pi * frequency * t[start:end]))
+    return samples + rng.normal(0, 0.1, t.size).astype(np.float32)
+
+
+def mix(speech, noise, snr_db):
+    """Mezcla el ruido (repetido o recortado a la longitud de la voz) con la SNR dada."""
+    noise = np.resize(noise, speech.size)
+    scale = rms(speech) / (rms(noise) * 10 ** (snr_db / 20)) if rms(noise) else 0.0
+    return speech + noise * scale
+
+
+def write_wav(path, samples):
+    pcm = np.clip(np.round(samples), -32768, 32767).astype(np.int16)
+    with wave.open(path, "wb") as wav:
+        wav.setnchannels(1)
+        wav.setsampwidth(2)
+        wav.setframerate(SAMPLE_RATE)
+        wav.writeframes(pcm.tobytes())
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--output", default="fixtures/stt")
+    parser.add_argument("--keyword", default=os.getenv("ASSISTANT", "Asistente"), help="Nombre del asistente")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+    os.makedirs(args.output, exist_ok=True)
+    phrases = (
+        [("wake", phrase.format(keyword=args.keyword), args.keyword) for phrase in WAKE_PHRASES]
+        + [("wake_command", phrase.format(keyword=args.keyword), args.keyword) for phrase in WAKE_COMMANDS]
+        + [("command", phrase, None) for phrase in COMMANDS]
+        + [("stop", phrase, "Stop") for phrase in STOP_PHRASES]
+    )
+    noises = {"ventilador": fan_noise(rng, NOISE_SECONDS), "motores": stepper_noise(rng, NOISE_SECONDS)}
+
+    entries = []
+    counts = {}
+
+    def add(kind, samples, text, keyword, variant):
+        index = counts.get(kind, 0)
+        counts[kind] = index + 1
+        filename = f"{kind}_{index:02d}_{variant}.wav"
+        write_wav(os.path.join(args.output, filename), samples)
+        entries.append({"audio": filename, "text": text, "kind": kind, "keyword": keyword})
+
+    noise_names = list(noises)
+    for index, (kind, text, keyword) in enumerate(phrases):
+        try:
+            speech = pad(rng, synthesize(text))
+        except Exception as e:
+            sys.exit(f"No se pudo sintetizar '{text}': {e}")
+        add(kind, speech, text, keyword, "limpio")
+        name = noise_names[index % len(noise_names)]
+        add(kind, mix(speech, noises[name], NOISY_SNR_DB), text, keyword, name)
+        print(f"{kind}: {text}")
+
+    # Sin voz: la detección no debe dispararse y el VAD no debe devolver segmentos
+    for name, noise in noises.items():
+        add("noise", noise / rms(noise) * 1000, "", None, name)
+    add("silence", room_tone(rng, NOISE_SECONDS), "", None, "ambiente")
+    add("silence", np.zeros(int(NOISE_SECONDS * SAMPLE_RATE), dtype=np.float32), "", None, "digital")
+
+    with open(os.path.join(args.output, "manifest.jsonl"), "w", encoding="utf-8") as f:
+        for entry in entries:
+            f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+    print(f"{len(entries)} audios escritos en {args.output}")
+
+
+if __name__ == "__main__":
+    main()
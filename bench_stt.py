@@ -0,0 +1,99 @@
+# bench_stt.py
+"""
+Compara los backends de voz a texto (WER y latencia) sobre un corpus de audios.
+
+El manifiesto es un JSON por línea: {"audio": "ruta.wav", "text": "transcripción de referencia"};
+las rutas son relativas al manifiesto y los WAV deben ser mono, 16 bits y 16 kHz.
+Uso: python bench_stt.py [--manifest fixtures/stt/manifest.jsonl] [--backends groq,whisper,google]
+"""
+
+import os
+import re
+import sys
+import json
+import time
+import wave
+import argparse
+import requests
+from dotenv import load_dotenv
+from rapidfuzz.distance import Levenshtein
+from stt_backends import build_backends
+
+DEFAULT_MANIFEST = "fixtures/stt/manifest.jsonl"
+
+
+def load_manifest(path):
+    base = os.path.dirname(os.path.abspath(path))
+    fixtures = []
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            if not line.strip():
+                continue
+            entry = json.loads(line)
+            with wave.open(os.path.join(base, entry["audio"]), "rb") as wav:
+                if wav.getframerate() != 16000 or wav.getsampwidth() != 2 or wav.getnchannels() != 1:
+                    sys.exit(f"{entry['audio']}: el WAV debe ser mono, 16 bits y 16 kHz.")
+                pcm = wav.readframes(wav.getnframes())
+            fixtures.append((entry["audio"], pcm, entry.get("text", "")))
+    return fixtures
+
+
+def normalize(text):
+    return re.sub(r"[^\w\s]", " ", text.lower()).split()
+
+
+def word_error_rate(reference, hypothesis):
+    """WER = distancia de edición entre palabras / palabras de la referencia."""
+    reference, hypothesis = normalize(reference), normalize(hypothesis)
+    if not reference:
+        return 0.0 if not hypothesis else 1.0
+    return Levenshtein.distance(reference, hypothesis) / len(reference)
+
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--manifest", default=DEFAULT_MANIFEST)
+    parser.add_argument("--backends", default="groq,whisper,google")
+    parser.add_argument("--verbose", action="store_true", help="Mostrar cada transcripción")
+    args = parser.parse_args()
+
+    load_dotenv()  # GROQ_API_KEY y WHISPER_* como en transcriber.py
+    if not os.path.exists(args.manifest):
+        sys.exit(f"No existe el manifiesto {args.manifest}.")
+    fixtures = load_manifest(args.manifest)
+    audio_seconds = sum(len(pcm) for _, pcm, _ in fixtures) / 32000
+    print(f"{len(fixtures)} audios, {audio_seconds:.1f} s en total")
+
+    results = []
+    for backend in build_backends(args.backends, requests.Session()):
+        latencies, errors, words, failures = [], 0.0, 0, 0
+        for name, pcm, reference in fixtures:
+            start = time.perf_counter()
+            try:
+                text = backend.transcribe(pcm, 16000)
+            except Exception as e:
+                failures += 1
+                print(f"{backend.name} {name}: error {e}")
+                continue
+            latencies.append(time.perf_counter() - start)
+            reference_words = max(1, len(normalize(reference)))
+            errors += word_error_rate(reference, text) * reference_words
+            words += reference_words
+            if args.verbose:
+                print(f"{backend.name} {name}: {text!r}")
+        if latencies:
+            results.append((backend.name, errors / words, percentile(latencies, 0.5), percentile(latencies, 0.95),
+                            sum(latencies) / audio_seconds, failures))
+
+    print(f"\n{'backend':<10}{'WER':>8}{'p50 s':>9}{'p95 s':>9}{'RTF':>7}{'fallos':>8}")
+    for name, wer, p50, p95, rtf, failures in results:
+        print(f"{name:<10}{wer * 100:>7.1f}%{p50:>9.2f}{p95:>9.2f}{rtf:>7.2f}{failures:>8}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,354 @@
+# bench_transcriber.py
+"""
+Mide el recorrido palabra clave -> orden de Transcriber sin hablarle al micrófono.
+
+Los audios del corpus (bench_corpus.py) pasan por los mismos métodos que usa
+Transcriber: vad_collector, el análisis de silencio, la detección de palabra clave
+(Vosk en local si hay modelo, si no detect_keyword_in_segment), el STT y, con un
+micrófono simulado que los reproduce sobre el buffer compartido, listen_for_command
+completo. El STT en la nube se sustituye por un backend local que devuelve la
+transcripción de referencia tras una latencia simulada; también se pueden medir los
+backends reales (p. ej. --stt whisper).
+
+Informa de los percentiles de latencia de cada etapa y de la precisión de la
+detección: voz encontrada, palabra clave acertada, falsas activaciones y órdenes.
+Uso: python bench_transcriber.py [--manifest fixtures/stt/manifest.jsonl] [--stt referencia]
+                                 [--speed 1] [--cloud-latency 0.4] [--cloud-keyword] [--verbose]
+"""
+
+import io
+import os
+import sys
+import json
+import time
+import wave
+import queue
+import random
+import argparse
+import threading
+import contextlib
+import collections
+import numpy as np
+import requests
+import speech_recognition as sr
+import silence
+from audio_stream import AudioStream, SAMPLE_RATE, SAMPLE_WIDTH, FRAME_MS
+from audio_sink import Clip
+from stt_backends import STTBackend, STTRouter, build_backends
+from bench_stt import DEFAULT_MANIFEST, word_error_rate, percentile
+from transcriber import Transcriber
+
+SPEECH_KINDS = ("wake", "wake_command", "command", "stop")
+AFTER_WAKE_KINDS = ("wake_command", "command", "noise", "silence")  # Lo que se graba como orden tras la palabra clave
+ROOM_TONE_RMS = 30
+STAGES = ["vad", "silencio", "palabra clave", "stt", "orden"]
+
+
+class ReferenceBackend(STTBackend):
+    """
+    Sustituto local de un STT en la nube: espera una latencia simulada (fija, más una
+    parte proporcional a la duración del audio, con variación aleatoria) y devuelve la
+    transcripción de referencia del audio en curso. La frase se entrega entera en la
+    primera petición; el resto de segmentos del mismo audio devuelven ''.
+    """
+
+    name = "referencia"
+    initial_rate = 0.5
+
+    def __init__(self, latency=0.4, rtf=0.05, jitter=0.1, seed=0):
+        super().__init__()
+        self.latency = latency
+        self.rtf = rtf
+        self.jitter = jitter
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.reference = ""
+
+    def expect(self, text):
+        with self.lock:
+            self.reference = text
+
+    def transcribe(self, pcm, sample_rate):
+        duration = len(pcm) / (sample_rate * SAMPLE_WIDTH)
+        with self.lock:
+            delay = self.latency + self.rtf * duration + self.random.uniform(-self.jitter, self.jitter)
+            text, self.reference = self.reference, ""
+        time.sleep(max(0.0, delay))
+        return text
+
+
+class Playback:
+    def __init__(self, pcm):
+        self.pcm = pcm
+        self.start_position = None
+        self.end_time = None
+        self.started = threading.Event()
+        self.finished = threading.Event()
+
+
+class FakeMicrophone(AudioStream):
+    """
+    AudioStream sin PyAudio: un hilo escribe los audios del corpus frame a frame, a speed
+    veces tiempo real, y ruido de sala entre uno y otro, como un micrófono que nunca
+    deja de capturar.
+    """
+
+    def __init__(self, speed=1.0, seed=0):
+        super().__init__()
+        self.speed = speed
+        self.rng = np.random.default_rng(seed)
+        self.playbacks = queue.Queue()
+        self.thread = threading.Thread(target=self._run, daemon=True)
+
+    def start(self):
+        self.thread.start()
+
+    def play(self, pcm):
+        """Encola un audio y espera a que empiece a sonar. Devuelve su Playback."""
+        playback = Playback(pcm)
+        self.playbacks.put(playback)
+        playback.started.wait()
+        return playback
+
+    def room_tone(self, size):
+        samples = self.rng.normal(0, ROOM_TONE_RMS, size // SAMPLE_WIDTH)
+        return samples.astype(np.int16).tobytes()
+
+    def _run(self):
+        frame_seconds = self.frame_samples / self.sample_rate
+        start = time.perf_counter()
+        frames = 0
+        playback, data, offset = None, b'', 0
+        while not self.closed:
+            if playback is None:
+                try:
+                    playback = self.playbacks.get_nowait()
+                    # Completar el último frame con ruido de sala
+                    data = playback.pcm + self.room_tone(-len(playback.pcm) % self.frame_bytes)
+                    offset = 0
+                    playback.start_position = self.position
+                    playback.started.set()
+                except queue.Empty:
+                    pass
+            if playback is not None:
+                frame = data[offset:offset + self.frame_bytes]
+                offset += self.frame_bytes
+            else:
+                frame = self.room_tone(self.frame_bytes)
+            self.write(frame)
+            if playback is not None and offset >= len(data):
+                playback.end_time = time.perf_counter()
+                playback.finished.set()
+                playback = None
+            frames += 1
+            delay = start + frames * frame_seconds / self.speed - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+
+
+class NullServer:
+    """Servidor que acepta todo sin red: el harness no mide la respuesta del LLM."""
+
+    def send(self, action, **fields):
+        return True
+
+    def process_text(self, text):
+        return {"message": ""}
+
+
+class MutedSink:
+    """Salida de audio que da cada aviso por reproducido al instante."""
+
+    def play_file(self, path, on_done=None):
+        clip = Clip(b'', os.path.basename(path), on_done)
+        clip.done.set()
+        return clip
+
+    def interrupt(self, flush=True):
+        return False, 0
+
+
+def load_corpus(path):
+    base = os.path.dirname(os.path.abspath(path))
+    fixtures = []
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            if not line.strip():
+                continue
+            entry = json.loads(line)
+            with wave.open(os.path.join(base, entry["audio"]), "rb") as wav:
+                if wav.getframerate() != SAMPLE_RATE or wav.getsampwidth() != SAMPLE_WIDTH or wav.getnchannels() != 1:
+                    sys.exit(f"{entry['audio']}: el WAV debe ser mono, 16 bits y 16 kHz.")
+                entry["pcm"] = wav.readframes(wav.getnframes())
+            entry.setdefault("text", "")
+            entry.setdefault("kind", "command" if entry["text"] else "noise")
+            entry.setdefault("keyword", None)
+            fixtures.append(entry)
+    return fixtures
+
+
+def build_router(names, reference):
+    backends = []
+    for name in dict.fromkeys(name.strip().lower() for name in names.split(",") if name.strip()):
+        if name == ReferenceBackend.name:
+            backends.append(reference)
+        else:
+            backends.extend(build_backends(name, requests.Session()))
+    return STTRouter(backends)
+
+
+def detect_keyword(transcriber, pcm):
+    """
+    Detección como en detect_keyword_in_buffer. Devuelve el nombre de la palabra clave
+    ("Stop" o el del asistente) o None.
+    """
+    if transcriber.wakeword is not None:
+        detector = transcriber.wakeword
+        detector.reset()
+        # Un segundo de silencio detrás para que el reconocedor cierre la frase
+        audio = pcm + bytes(SAMPLE_RATE * SAMPLE_WIDTH)
+        for offset in range(0, len(audio) - detector.frame_bytes + 1, detector.frame_bytes):
+            detected = detector.process(audio[offset:offset + detector.frame_bytes])
+            if detected:
+                return detected
+        return None
+    detected = transcriber.detect_keyword_in_segment(sr.AudioData(pcm, SAMPLE_RATE, SAMPLE_WIDTH))
+    if detected is None:
+        return None
+    # transcribe() trata cualquier resultado distinto de "stop" como palabra clave
+    return "Stop" if detected.lower().strip() == "stop" else transcriber.keyword
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--manifest", default=DEFAULT_MANIFEST)
+    parser.add_argument("--keyword", default=os.getenv("ASSISTANT", "Asistente"), help="Nombre del asistente del corpus")
+    parser.add_argument("--stt", default="referencia", help="Backends de las órdenes, p. ej. referencia o whisper")
+    parser.add_argument("--keyword-stt", default="referencia", help="Backends de la palabra clave sin Vosk")
+    parser.add_argument("--cloud-keyword", action="store_true", help="Ignorar Vosk y detectar la palabra clave por STT")
+    parser.add_argument("--speed", type=float, default=1.0, help="Velocidad del micrófono simulado (1 = tiempo real)")
+    parser.add_argument("--cloud-latency", type=float, default=0.4, help="Latencia fija del STT simulado (s)")
+    parser.add_argument("--cloud-rtf", type=float, default=0.05, help="Segundos de STT simulado por segundo de audio")
+    parser.add_argument("--cloud-jitter", type=float, default=0.1)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--verbose", action="store_true", help="Mostrar la salida de Transcriber y cada resultado")
+    args = parser.parse_args()
+
+    if not os.path.exists(args.manifest):
+        sys.exit(f"No existe el manifiesto {args.manifest}; genéralo con bench_corpus.py.")
+    fixtures = load_corpus(args.manifest)
+    audio_seconds = sum(len(entry["pcm"]) for entry in fixtures) / (SAMPLE_RATE * SAMPLE_WIDTH)
+    print(f"{len(fixtures)} audios, {audio_seconds:.1f} s en total")
+
+    os.environ["ASSISTANT"] = args.keyword  # Transcriber lo lee al crearse
+    reference = ReferenceBackend(args.cloud_latency, args.cloud_rtf, args.cloud_jitter, args.seed)
+    microphone = FakeMicrophone(args.speed, args.seed)
+    output = contextlib.nullcontext() if args.verbose else contextlib.redirect_stdout(io.StringIO())
+    with output:
+        transcriber = Transcriber(audio_stream=microphone, server=NullServer(), sink=MutedSink(),
+                                  stt=build_router(args.stt, reference),
+                                  keyword_stt=build_router(args.keyword_stt, reference))
+    if args.cloud_keyword:
+        transcriber.wakeword = None
+    print(f"Palabra clave: {'Vosk local' if transcriber.wakeword is not None else 'STT'}; "
+          f"STT: {', '.join(backend.name for backend in transcriber.stt.backends)}")
+
+    latencies = collections.defaultdict(list)
+    counts = collections.Counter()
+    errors, words = 0.0, 0
+    for entry in fixtures:
+        pcm, kind, text, expected = entry["pcm"], entry["kind"], entry["text"], entry["keyword"]
+        has_speech = kind in SPEECH_KINDS
+        with (contextlib.nullcontext() if args.verbose else contextlib.redirect_stdout(io.StringIO())):
+            start = time.perf_counter()
+            segments = list(transcriber.vad_collector(SAMPLE_RATE, FRAME_MS, pcm))
+            latencies["vad"].append(time.perf_counter() - start)
+
+            accepted = 0
+            for segment in segments:
+                start = time.perf_counter()
+                ranges, proportion = silence.analyze(segment, SAMPLE_RATE)
+                latencies["silencio"].append(time.perf_counter() - start)
+                accepted += bool(ranges) and proportion > silence.VOICED_PROPORTION
+
+            reference.expect(text)
+            start = time.perf_counter()
+            detected = detect_keyword(transcriber, pcm)
+            latencies["palabra clave"].append(time.perf_counter() - start)
+
+            hypothesis = None
+            if has_speech:
+                reference.expect(text)
+                start = time.perf_counter()
+                try:
+                    hypothesis = transcriber.stt.transcribe(pcm, SAMPLE_RATE)
+                    latencies["stt"].append(time.perf_counter() - start)
+                except Exception as e:
+                    counts["stt_fallos"] += 1
+                    hypothesis = f"error: {e}"
+
+            command = None
+            if kind in AFTER_WAKE_KINDS:
+                # Como tras la palabra clave: el comando se lee desde el inicio del audio
+                reference.expect(text)
+                playback = microphone.play(pcm)
+                transcriber.wake_position = playback.start_position
+                command = transcriber.listen_for_command()
+                ready = time.perf_counter()
+                playback.finished.wait()
+                if command:
+                    latencies["orden"].append(ready - playback.end_time)
+
+        counts["voz"] += has_speech
+        counts["voz_ok"] += has_speech and accepted > 0
+        counts["sin_voz"] += not has_speech
+        counts["sin_voz_ok"] += not has_speech and accepted == 0
+        if expected:
+            counts["clave"] += 1
+            counts["clave_ok"] += bool(detected) and detected.lower() == expected.lower()
+        else:
+            counts["no_clave"] += 1
+            counts["falsas_activaciones"] += detected is not None
+        if kind in AFTER_WAKE_KINDS:
+            wanted = kind in SPEECH_KINDS
+            counts["ordenes"] += wanted
+            counts["ordenes_ok"] += wanted and bool(command)
+            counts["falsas_ordenes"] += not wanted and bool(command)
+        if has_speech and text:
+            reference_words = max(1, len(text.split()))
+            errors += word_error_rate(text, hypothesis or "") * reference_words
+            words += reference_words
+        if args.verbose:
+            print(f"{entry['audio']}: {len(segments)} segmentos ({accepted} con voz), clave {detected!r}, "
+                  f"stt {hypothesis!r}, orden {command!r}")
+
+    microphone.close()
+    transcriber.stt_pool.shutdown(wait=False)
+
+    print(f"\n{'etapa':<16}{'n':>5}{'p50 ms':>10}{'p95 ms':>10}{'máx ms':>10}")
+    for stage in STAGES:
+        values = latencies[stage]
+        if values:
+            print(f"{stage:<16}{len(values):>5}{percentile(values, 0.5) * 1000:>10.1f}"
+                  f"{percentile(values, 0.95) * 1000:>10.1f}{max(values) * 1000:>10.1f}")
+    print("(orden: desde el final del audio hasta tener el texto; incluye el silencio de cierre "
+          f"a {args.speed:g}x tiempo real)")
+
+    def ratio(ok, total):
+        return f"{counts[ok]}/{counts[total]}" + (f" ({counts[ok] / counts[total] * 100:.0f}%)" if counts[total] else "")
+
+    print(f"\nVoz encontrada:              {ratio('voz_ok', 'voz')}")
+    print(f"Sin voz descartado:          {ratio('sin_voz_ok', 'sin_voz')}")
+    print(f"Palabra clave acertada:      {ratio('clave_ok', 'clave')}")
+    print(f"Falsas activaciones:         {ratio('falsas_activaciones', 'no_clave')}")
+    print(f"Órdenes transcritas:         {ratio('ordenes_ok', 'ordenes')}")
+    print(f"Órdenes con ruido o silencio: {counts['falsas_ordenes']}")
+    if words:
+        print(f"WER del STT:                 {errors / words * 100:.1f}%")
+    if counts["stt_fallos"]:
+        print(f"Fallos del STT:              {counts['stt_fallos']}")
+    print(f"Backends: {transcriber.stt.describe()}")
+
+
+if __name__ == "__main__":
+    main()
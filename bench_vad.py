@@ -0,0 +1,114 @@
+# bench_vad.py
+"""
+Mide cuántos frames por segundo procesa el VAD de Transcriber en esta máquina.
+
+Compara el colector anterior (lista por frame y print de depuración) con vad.VadCollector.
+Uso: python bench_vad.py [--wav archivo.wav] [--seconds 60] [--repeat 5]
+"""
+
+import io
+import sys
+import time
+import wave
+import argparse
+import collections
+import contextlib
+import numpy as np
+import webrtcvad
+from vad import VadCollector, FRAME_MS, PADDING_MS
+
+SAMPLE_RATE = 16000
+
+
+def synthetic_audio(seconds, seed=0):
+    """Alterna 1,5 s de ruido modulado tipo voz con 1,5 s de ruido de fondo bajo."""
+    rng = np.random.default_rng(seed)
+    samples = np.empty(int(seconds * SAMPLE_RATE), dtype=np.float32)
+    block = int(1.5 * SAMPLE_RATE)
+    t = np.arange(block) / SAMPLE_RATE
+    for start in range(0, len(samples), block):
+        size = min(block, len(samples) - start)
+        if (start // block) % 2:
+            samples[start:start + size] = rng.normal(0, 20, size)
+        else:
+            envelope = 0.5 + 0.5 * np.sin(2 * np.pi * 4 * t[:size])
+            voice = np.sin(2 * np.pi * 180 * t[:size]) + 0.5 * np.sin(2 * np.pi * 720 * t[:size])
+            samples[start:start + size] = 6000 * envelope * voice + rng.normal(0, 300, size)
+    return np.clip(samples, -32768, 32767).astype(np.int16).tobytes()
+
+
+def load_wav(path):
+    with wave.open(path, "rb") as wav:
+        if wav.getframerate() != SAMPLE_RATE or wav.getsampwidth() != 2 or wav.getnchannels() != 1:
+            sys.exit("El WAV debe ser mono, 16 bits y 16 kHz.")
+        return wav.readframes(wav.getnframes())
+
+
+def legacy_collector(vad, audio):
+    """Implementación anterior de Transcriber.frame_generator + vad_collector."""
+    frame_size = int(SAMPLE_RATE * (FRAME_MS / 1000.0) * 2)
+    frames = (audio[offset:offset + frame_size] for offset in range(0, len(audio) - frame_size + 1, frame_size))
+    ring_buffer = collections.deque(maxlen=int(PADDING_MS / FRAME_MS))
+    triggered = False
+    voiced_frames = []
+    for frame in frames:
+        is_speech = vad.is_speech(frame, SAMPLE_RATE)
+        print(f"VAD decision for frame: {'Speech' if is_speech else 'Silence'}")
+        if not triggered:
+            ring_buffer.append((frame, is_speech))
+            num_voiced = len([f for f, speech in ring_buffer if speech])
+            if num_voiced > 0.9 * ring_buffer.maxlen:
+                triggered = True
+                voiced_frames.extend(f for f, s in ring_buffer)
+                ring_buffer.clear()
+        else:
+            voiced_frames.append(frame)
+            ring_buffer.append((frame, is_speech))
+            num_unvoiced = len([f for f, speech in ring_buffer if not speech])
+            if num_unvoiced > ring_buffer.maxlen:
+                triggered = False
+                yield b''.join(voiced_frames)
+                ring_buffer.clear()
+                voiced_frames = []
+    if voiced_frames:
+        yield b''.join(voiced_frames)
+
+
+def measure(name, run, frames, repeat):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        segments = run()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    print(f"{name:<10} {frames / best:>12,.0f} frames/s  ({best * 1000:.1f} ms, {len(segments)} segmentos)")
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--wav", help="Audio mono de 16 bits a 16 kHz; por defecto se genera uno sintético")
+    parser.add_argument("--seconds", type=float, default=60, help="Duración del audio sintético")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--aggressiveness", type=int, default=3)
+    args = parser.parse_args()
+
+    audio = load_wav(args.wav) if args.wav else synthetic_audio(args.seconds)
+    frames = len(audio) // (int(SAMPLE_RATE * FRAME_MS / 1000) * 2)
+    vad = webrtcvad.Vad(args.aggressiveness)
+    print(f"{frames} frames de {FRAME_MS} ms ({frames * FRAME_MS / 1000:.1f} s de audio)")
+
+    def run_legacy():
+        # Los print por frame iban a la consola; aquí se descartan para no ensuciar la salida
+        with contextlib.redirect_stdout(io.StringIO()):
+            return list(legacy_collector(vad, audio))
+
+    collector = VadCollector(vad, SAMPLE_RATE)
+    legacy = measure("anterior", run_legacy, frames, args.repeat)
+    current = measure("actual", lambda: list(collector.collect(audio)), frames, args.repeat)
+    gated = 1 - collector.vad_calls / (frames * args.repeat)
+    print(f"Aceleración: {legacy / current:.1f}x; {gated * 100:.0f}% de los frames descartados por energía")
+
+
+if __name__ == "__main__":
+    main()
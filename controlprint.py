@@ -8,16 +8,25 @@ import openai
 import os
 from dotenv import load_dotenv
 from printerfuntions import PrinterFunctions  # Asegúrate de que el nombre del archivo sea correcto
+from metrics import Histogram, record_timing
+from klippy_stats import KlippyStats, DEFAULT_KLIPPY_LOG
+from print_history import PrintHistory, PERIODS, HISTORY_PAGE_SIZE
 
 load_dotenv('.env')
 OPEN_AI_API_KEY = os.getenv("OPEN_AI_API_KEY")
 client = OpenAI(api_key=OPEN_AI_API_KEY)
 
+# Duración de cada ejecución del asistente y de cada herramienta que invoca
+LLM_RUN_SECONDS = Histogram("sayfi_llm_run_seconds", "Duración de LLM.run_assistant.")
+LLM_TOOL_SECONDS = Histogram("sayfi_llm_tool_seconds", "Duración de cada herramienta llamada por el asistente.", labels=("tool",))
+
 class LLM:
     def __init__(self, id=os.getenv("ASSISTANT", "Asistente")):
         self.id = id
         self.orm = SORM()
         self.printer = PrinterFunctions()  # Instancia de PrinterFunctions sin pasar parámetros
+        self.host_stats = KlippyStats(os.getenv("KLIPPY_LOG", DEFAULT_KLIPPY_LOG))  # Estadísticas de klippy.log
+        self.history = PrintHistory()  # Historial local de impresiones
         self.tools = [
             {"type": "function", "function": {"name": "printer_command", "description": "Enviar un comando GCODE o macro de Klipper a la impresora. Utiliza esta función para todas las acciones que requieren enviar comandos directos o macros predefinidos.", "parameters": {"type": "object", "properties": {"command": {"type": "string", "description": "El comando GCODE o macro de Klipper a enviar a la impresora."}}, "required": ["command"]}}},
             {"type": "function", "function": {"name": "print_file_by_name", "description": "Imprime un archivo con nombre específico en la impresora 3D.", "parameters": {"type": "object", "properties": {"file_name": {"type": "string", "description": "El nombre del archivo a imprimir (sin extensión .gcode)."}}, "required": ["file_name"]}}},
@@ -27,7 +36,10 @@ class LLM:
             {"type": "function", "function": {"name": "get_current_temperature", "description": "Obtiene las temperaturas actuales de la cama caliente y del extrusor de la impresora 3D.", "parameters": {"type": "object", "properties": {}}}},
             {"type": "function", "function": {"name": "get_filament_usage", "description": "Obtiene el consumo de filamento de la impresión actual en la impresora 3D.", "parameters": {"type": "object", "properties": {}}}},
             {"type": "function", "function": {"name": "search_files", "description": "Busca un archivo con nombre específico en la impresora 3D. Utiliza esta función para verificar la existencia de un archivo.Para imprimir un archivo con un nombre dado usar a print_file_by_name en vez de esta funcion ", "parameters": {"type": "object", "properties": {"file_name": {"type": "string", "description": "El nombre del archivo a buscar (sin extensión .gcode)."}}, "required": ["file_name"]}}},
-            {"type": "function", "function": {"name": "is_printing", "description": "Verifica si la impresora 3D está actualmente realizando una impresión.", "parameters": {"type": "object", "properties": {}}}}
+            {"type": "function", "function": {"name": "is_printing", "description": "Verifica si la impresora 3D está actualmente realizando una impresión.", "parameters": {"type": "object", "properties": {}}}},
+            {"type": "function", "function": {"name": "get_host_status", "description": "Obtiene el estado del host y de las MCU de Klipper en los últimos minutos: carga del sistema, uso de CPU, memoria disponible, carga de cada MCU, retransmisiones y PWM de los calentadores. Usar cuando pregunten cómo está el host, la Raspberry o la conexión con la placa.", "parameters": {"type": "object", "properties": {}}}},
+            {"type": "function", "function": {"name": "get_print_history_summary", "description": "Resume el historial de impresiones de un período: cantidad de impresiones, horas de impresión, filamento usado (metros y gramos), impresiones por estado y por material. Usar para preguntas como cuántas horas se imprimió esta semana o cuánto PLA se gastó este mes.", "parameters": {"type": "object", "properties": {"period": {"type": "string", "enum": PERIODS, "description": "Período a consultar."}, "filament_type": {"type": "string", "description": "Material a filtrar (PLA, PETG, ABS, TPU...). Omitir para todos."}, "status": {"type": "string", "enum": ["completed", "cancelled", "error"], "description": "Estado de los trabajos a filtrar. Omitir para todos."}}, "required": ["period"]}}},
+            {"type": "function", "function": {"name": "get_most_printed_files", "description": "Lista los archivos que más veces se imprimieron en un período.", "parameters": {"type": "object", "properties": {"period": {"type": "string", "enum": PERIODS, "description": "Período a consultar."}, "limit": {"type": "integer", "description": "Cantidad de archivos a listar (por defecto 5)."}}, "required": ["period"]}}}
         ]
         
         # Abre el archivo shelve
@@ -122,10 +134,21 @@ class LLM:
                     content=text,
                 )
 
-        function_name, args, message = self.run_assistant()
+        with LLM_RUN_SECONDS.time(timing="llm_run"):
+            function_name, args, message = self.run_assistant()
         print(message)
         return function_name, args, message
 
+    def sync_history(self):
+        """
+        Trae de Moonraker los trabajos nuevos o en curso antes de consultar el historial.
+        Si Moonraker no responde se contesta con lo que ya está guardado.
+        """
+        try:
+            self.history.sync(lambda start, since: self.printer.get_history_jobs(start, since, HISTORY_PAGE_SIZE))
+        except Exception as e:
+            print(f"Error al sincronizar el historial de impresiones: {e}")
+
     def run_assistant(self):
 
         run = client.beta.threads.runs.create(
@@ -175,7 +198,9 @@ class LLM:
                 for action in required_actions["tool_calls"]:
                     func_name = action['function']['name']
                     arguments = json.loads(action['function']['arguments'])
-                    
+                    # Medir cada herramienta por separado (incluye la llamada a Moonraker)
+                    tool_start = time.perf_counter()
+
                     # Manejo de funciones relacionadas con impresión 3D
                     if func_name == "printer_command":
                         command = arguments.get("command")
@@ -234,9 +259,33 @@ class LLM:
                             "tool_call_id": action['id'],
                             "output": str(output)  # Convertir booleano a string
                         })
+                    elif func_name == "get_print_history_summary":
+                        self.sync_history()
+                        output = self.history.describe(arguments.get("period", "semana"), arguments.get("filament_type"), arguments.get("status"))
+                        tool_outputs.append({
+                            "tool_call_id": action['id'],
+                            "output": output
+                        })
+                    elif func_name == "get_most_printed_files":
+                        self.sync_history()
+                        output = self.history.describe_top_files(arguments.get("period", "mes"), arguments.get("limit", 5))
+                        tool_outputs.append({
+                            "tool_call_id": action['id'],
+                            "output": output
+                        })
+                    elif func_name == "get_host_status":
+                        output = self.host_stats.describe()
+                        tool_outputs.append({
+                            "tool_call_id": action['id'],
+                            "output": output
+                        })
                     else:
                         raise ValueError(f"Unknown function: {func_name}")
 
+                    tool_elapsed = time.perf_counter() - tool_start
+                    LLM_TOOL_SECONDS.observe(tool_elapsed, tool=func_name)
+                    record_timing(f"tool_{func_name}", tool_elapsed)
+
                 # Enviar las salidas de las herramientas de vuelta al asistente
                 client.beta.threads.runs.submit_tool_outputs(
                     thread_id=self.thread_id,
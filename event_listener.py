@@ -1,20 +1,28 @@
 import os
 import sys
 import fcntl
+import signal
 import json
-import websocket
-import requests
 import time
-import threading
-import queue
+import asyncio
 import logging
-from collections import deque
 import subprocess
+import httpx
+import websockets
 from dotenv import load_dotenv
+from notification_filter import NotificationFilter
+from notification_outbox import NotificationOutbox, PRIORITY_CRITICAL, PRIORITY_STATE, PRIORITY_INFO
+from notification_rules import RuleEngine
+from moonraker_replay import SessionRecorder
+from reconnect import Backoff
+from log_follower import LogFollower
+from klippy_stats import KlippyStats
+from print_history import PrintHistory, HISTORY_PAGE_SIZE
+from metrics import REGISTRY, CONTENT_TYPE, Counter, Gauge, Histogram
 
 # Configurar el logging
 logging.basicConfig(
-    filename='/opt/Say-Fi-Print/event_listener.log',
+    filename=os.getenv("EVENT_LISTENER_LOG", '/opt/Say-Fi-Print/event_listener.log'),
     level=logging.INFO,
     format='%(asctime)s %(levelname)s:%(message)s'
 )
@@ -32,8 +40,6 @@ def create_lock():
         print("Otra instancia de event_listener.py ya está corriendo.")
         sys.exit(1)
 
-create_lock()
-
 # Cargar variables de entorno
 load_dotenv()
 EXPECTED_API_KEY = os.getenv("API_KEY")
@@ -45,623 +51,970 @@ if not EXPECTED_API_KEY:
 TEMPERATURE_TOLERANCE = 0.5
 TEMPERATURE_CHECK_TOLERANCE = 2.0  # Tolerancia para notificación de inicio de impresión
 
-# Variables globales
-prev_heater_bed_target = None
-bed_temp_reached = False
-
-prev_extruder_target = None
-extruder_temp_reached = False
-
-prev_print_state = None
-prev_filename = None
-
-prev_file_list = []
-
-prev_position = None
-has_started_printing = False
-print_started_notified = False  # Nueva bandera para notificación única
-
-monitoring_temperatures = False  # Indica si el monitoreo está activo
-
-notification_queue = queue.Queue()
-
-# Variables añadidas para el monitoreo de Klipper y MCU
-prev_klipper_state = None
-prev_mcu_state = None
+RECONNECTION_TIMEOUT = 60  # Tiempo máximo de espera para reconexión de Klipper en segundos
+# Espera entre intentos de conexión de los WebSocket: exponencial con jitter (ver reconnect.py)
+RECONNECT_INITIAL_DELAY = float(os.getenv("RECONNECT_INITIAL_DELAY", 1))
+RECONNECT_MAX_DELAY = float(os.getenv("RECONNECT_MAX_DELAY", 60))
 
-# Variables para manejo de reconexión de firmware
-reconnection_event = threading.Event()
-reconnection_watcher_active = False
-RECONNECTION_TIMEOUT = 60  # Tiempo máximo de espera para reconexión en segundos
+# Path for the running flag file (configurable para que una reproducción no toque el del servicio)
+RUNNING_FLAG = os.getenv("EVENT_LISTENER_RUNNING_FLAG", "/tmp/event_listener_running")
 
-# Path for the running flag file
-RUNNING_FLAG = "/tmp/event_listener_running"
+# Direcciones de Moonraker (HTTP y WebSocket); configurables para usar un Moonraker de reproducción
+MOONRAKER_URL = os.getenv("MOONRAKER_URL", "http://localhost:7125")
+MOONRAKER_WS_URL = MOONRAKER_URL.replace("http", "ws", 1) + "/websocket"
 
 # Dirección del servidor WebSocket (usar 127.0.0.1 en lugar de localhost)
-SERVER_WS_URL = "ws://127.0.0.1:6996/ws"
-
-# Configuración de la ventana de tiempo para filtrar duplicados (en segundos)
-DUPLICATE_WINDOW = 30
-recent_notifications = deque()
-
-server_ws = None  # WebSocket con el servidor
-
-def add_notification(message):
-    current_time = time.time()
-    # Normalizar el mensaje
-    normalized_message = message.strip().lower()
-
-    # Eliminar notificaciones que son más antiguas que DUPLICATE_WINDOW
-    while recent_notifications and current_time - recent_notifications[0][1] > DUPLICATE_WINDOW:
-        removed = recent_notifications.popleft()
-        logging.debug(f"Removiendo notificación antigua: {removed[0]}")
-
-    # Verificar si el mensaje ya existe en las notificaciones recientes
-    for msg, timestamp in recent_notifications:
-        if msg == normalized_message:
-            logging.debug(f"Notificación duplicada encontrada: {message}")
-            return  # No añadir duplicados
-
-    # Añadir la nueva notificación
-    recent_notifications.append((normalized_message, current_time))
-    # Añadir a la cola de notificaciones
-    formatted_message = f"Notify:{message}"
-    notification_queue.put(formatted_message)
-    logging.info(f"Notificación añadida a la cola: {message}")
-
-def initialize_file_list():
-    global prev_file_list
-    prev_file_list = get_file_list()
-
-def get_file_list():
-    try:
-        response = requests.get('http://localhost:7125/server/files/list')
-        files = response.json()['result']
-        # Usar 'display' en lugar de 'path'
-        file_list = [f['display'] for f in files]
-        logging.debug(f"File list retrieved: {file_list}")
-        return file_list
-    except Exception as e:
-        logging.error(f"Error al obtener la lista de archivos: {e}")
-        return []
-
-def check_initial_restart():
-    """
-    Verifica si el script se está iniciando.
-    Envía una notificación adecuada.
+SERVER_WS_URL = os.getenv("SERVER_WS_URL", "ws://127.0.0.1:6996/ws")
+
+# Si se define, se graba la sesión de Moonraker para reproducirla con moonraker_replay.py
+RECORD_PATH = os.getenv("MOONRAKER_RECORD_PATH")
+
+# Control del ritmo de envío basado en acuses del servidor ('processed' / 'played')
+NOTIFY_WINDOW = int(os.getenv("NOTIFY_WINDOW", 1))  # Notificaciones enviadas sin acuse 'played'
+MAX_QUEUE_LATENCY = float(os.getenv("NOTIFY_MAX_QUEUE_LATENCY", 60))  # Segundos máximos en cola de un mensaje informativo
+ACK_TIMEOUT = float(os.getenv("NOTIFY_ACK_TIMEOUT", 30))  # Segundos antes de liberar un envío sin acuse
+
+# Bandeja de salida persistente: las notificaciones sobreviven a caídas del servidor
+OUTBOX_PATH = os.getenv("NOTIFY_OUTBOX_PATH", "/opt/Say-Fi-Print/notification_outbox.db")
+OUTBOX_TTLS = {
+    PRIORITY_CRITICAL: 3600,
+    PRIORITY_STATE: 600,
+    PRIORITY_INFO: MAX_QUEUE_LATENCY,
+}
+
+# Segundos sin cambios de archivos antes de anunciar el lote acumulado
+FILE_BATCH_WINDOW = 2
+
+# Archivo de reglas de notificación para las actualizaciones de estado (ver notification_rules.py)
+RULES_PATH = os.getenv("NOTIFY_RULES_PATH", os.path.join(os.path.dirname(os.path.abspath(__file__)), "notification_rules.json"))
+
+# Log de Klipper que sigue el listener (ver log_follower.py)
+KLIPPY_LOG = os.getenv("KLIPPY_LOG", "/home/pi/printer_data/logs/klippy.log")
+# Patrones del log de Klipper y la reacción del listener a cada uno
+KLIPPY_LOG_PATTERNS = {
+    "firmware_restart": r"firmware_restart",
+}
+FIRMWARE_RESTART_DEBOUNCE = 10  # Segundos en que se ignoran coincidencias repetidas
+# Cada cuántos segundos se leen las líneas 'Stats' nuevas y se revisan los umbrales (ver klippy_stats.py)
+STATS_INTERVAL = float(os.getenv("STATS_INTERVAL", 15))
+
+# Estado final de print_stats -> estado del trabajo en el historial de Moonraker
+HISTORY_END_STATUSES = {
+    "complete": "completed",
+    "cancelled": "cancelled",
+    "cancelling": "cancelled",
+    "error": "error",
+}
+
+# Puerto local donde se exponen las métricas del listener (0 para desactivarlas)
+METRICS_PORT = int(os.getenv("LISTENER_METRICS_PORT", 7130))
+
+# Métricas del listener (ver metrics.py)
+MESSAGES_TOTAL = Counter("sayfi_listener_messages_total", "Mensajes recibidos de Moonraker por método.", labels=("method",))
+ON_MESSAGE_SECONDS = Histogram("sayfi_listener_on_message_seconds", "Tiempo de manejo de cada mensaje de Moonraker.", labels=("method",))
+HTTP_SECONDS = Histogram("sayfi_listener_http_seconds", "Duración de las consultas HTTP a Moonraker.", labels=("call",))
+HTTP_ERRORS_TOTAL = Counter("sayfi_listener_http_errors_total", "Consultas HTTP a Moonraker fallidas.", labels=("call",))
+QUEUE_DEPTH = Gauge("sayfi_listener_queue_depth", "Notificaciones pendientes en la bandeja de salida.")
+IN_FLIGHT = Gauge("sayfi_listener_in_flight", "Notificaciones enviadas esperando el acuse 'played'.")
+QUEUE_SECONDS = Histogram("sayfi_listener_queue_seconds", "Tiempo de cada notificación en la cola antes de enviarse.")
+ACK_SECONDS = Histogram("sayfi_listener_ack_seconds", "Tiempo desde el envío hasta cada acuse del servidor.", labels=("ack",))
+NOTIFICATIONS_TOTAL = Counter("sayfi_listener_notifications_total", "Notificaciones encoladas por categoría.", labels=("category",))
+DROPPED_TOTAL = Counter("sayfi_listener_dropped_total", "Notificaciones descartadas por el filtro.", labels=("reason",))
+RECONNECTS_TOTAL = Counter("sayfi_listener_reconnects_total", "Reconexiones de los WebSocket.", labels=("connection",))
+
+# Objetos de Klipper a los que se suscribe el listener (se suman los campos que usan las reglas)
+SUBSCRIBED_OBJECTS = {
+    "heater_bed": None,
+    "extruder": None,
+    "print_stats": ["state", "filename"],
+    "toolhead": ["position"],
+    "klipper": ["state", "state_message"],
+    "mcu": ["state"]
+}
+
+
+class EventListener:
     """
-    if os.path.exists(RUNNING_FLAG):
-        message = "El servicio de notificaciones ha sido reiniciado."
-        add_notification(message)
-    else:
-        message = "El servicio se ha iniciado por primera vez."
-        add_notification(message)
-    # Establecer el RUNNING_FLAG
-    with open(RUNNING_FLAG, 'w') as f:
-        f.write(str(time.time()))
+    Escucha los eventos de Moonraker y envía notificaciones al servidor.
 
-def clear_running_flag():
+    Todo corre en un único bucle de asyncio: la suscripción a Moonraker, la conexión
+    con el servidor, el envío de notificaciones y los temporizadores son tareas, y el
+    estado vive en esta instancia en lugar de en variables globales.
     """
-    Limpia el RUNNING_FLAG al finalizar el script.
-    """
-    if os.path.exists(RUNNING_FLAG):
-        os.remove(RUNNING_FLAG)
-
-def start_temperature_monitoring():
-    global monitoring_temperatures
-    if not monitoring_temperatures:
-        monitoring_temperatures = True
-        check_temperatures()
-
-def stop_temperature_monitoring():
-    global monitoring_temperatures
-    monitoring_temperatures = False
-
-def check_temperatures():
-    global bed_temp_reached, extruder_temp_reached
-    global prev_heater_bed_target, prev_extruder_target
-    global monitoring_temperatures
 
-    if not monitoring_temperatures or has_started_printing:
-        # Salir si no se debe monitorear o si hay una impresión en curso
-        threading.Timer(1, check_temperatures).start()
-        return
-
-    try:
-        # Realizar una solicitud HTTP para obtener el estado actual de la impresora
-        response = requests.get('http://localhost:7125/printer/objects/query?heater_bed&extruder')
-        data = response.json()['result']['status']
-
-        # Monitorear la temperatura de la cama
-        if 'heater_bed' in data:
-            heater_bed = data['heater_bed']
-            temp = heater_bed.get('temperature')
-            target = heater_bed.get('target')
-
-            if temp is not None and target is not None and target != 0:
-                if abs(temp - target) <= TEMPERATURE_TOLERANCE and not bed_temp_reached:
-                    message = f"La cama ha alcanzado la temperatura objetivo de {target}°C"
-                    add_notification(message)
-                    bed_temp_reached = True
-                    stop_temperature_monitoring()
-                elif abs(temp - target) > TEMPERATURE_TOLERANCE:
-                    bed_temp_reached = False  # Restablecer si se aleja del objetivo
-
-        # Monitorear la temperatura del extrusor
-        if 'extruder' in data:
-            extruder = data['extruder']
-            temp = extruder.get('temperature')
-            target = extruder.get('target')
-
-            if temp is not None and target is not None and target != 0:
-                if abs(temp - target) <= TEMPERATURE_TOLERANCE and not extruder_temp_reached:
-                    message = f"El extrusor ha alcanzado la temperatura objetivo de {target}°C"
-                    add_notification(message)
-                    extruder_temp_reached = True
-                    stop_temperature_monitoring()
-                elif abs(temp - target) > TEMPERATURE_TOLERANCE:
-                    extruder_temp_reached = False  # Restablecer si se aleja del objetivo
-
-    except Exception as e:
-        logging.error(f"Error al obtener las temperaturas: {e}")
-
-    # Programar la siguiente ejecución de la función
-    threading.Timer(1, check_temperatures).start()
-
-def process_notifications():
-    while True:
+    def __init__(self):
+        self.bed_temp_reached = False
+        self.extruder_temp_reached = False
+
+        self.file_set = set()  # Rutas de los archivos en la raíz 'gcodes'
+        self.pending_file_changes = {"created": [], "deleted": []}
+        self.last_file_change = 0
+        self.file_batch_task = None
+
+        self.has_started_printing = False
+        self.print_started_notified = False  # Bandera para notificación única
+
+        self.monitoring_temperatures = False  # Indica si el monitoreo está activo
+        self.temperature_task = None
+
+        # Reglas de notificación compiladas en una tabla de despacho por campo
+        self.rules = RuleEngine.from_file(RULES_PATH)
+        self.rule_guards = {
+            "temperatures_at_target": self.temperatures_at_target,
+        }
+        self.rule_actions = {
+            "start_printing": self.start_printing,
+            "stop_printing": self.stop_printing,
+            "start_temperature_monitoring": self.start_temperature_monitoring,
+            "mark_print_started_notified": self.mark_print_started_notified,
+            "record_print_start": self.record_print_start,
+            "record_print_end": self.record_print_end,
+        }
+        for rule in self.rules.rules:
+            if rule.guard and rule.guard not in self.rule_guards:
+                raise ValueError(f"Regla '{rule.id}': guarda desconocida '{rule.guard}'")
+            for action in rule.actions:
+                if action not in self.rule_actions:
+                    raise ValueError(f"Regla '{rule.id}': acción desconocida '{action}'")
+
+        # Manejo de reinicios del firmware: al volver Klipper se renueva la suscripción
+        self.klippy_restarting = False
+        self.klippy_restart_task = None
+        self.request_counter = 0
+        self.subscribe_id = None
+        self.snapshot_seeded = False  # La primera instantánea solo carga el estado
+        self.last_firmware_restart = 0
+
+        # Seguimiento del log de Klipper dentro del proceso
+        self.log_follower = LogFollower(KLIPPY_LOG, KLIPPY_LOG_PATTERNS, self.on_klippy_log)
+        self.log_handlers = {
+            "firmware_restart": self.on_firmware_restart,
+        }
+        self.klippy_stats = KlippyStats(KLIPPY_LOG)
+        self.history = PrintHistory()  # Historial local de impresiones (ver print_history.py)
+        self.history_task = None
+
+        # Filtro de duplicados con ventanas por categoría (ver notification_filter.py)
+        self.notification_filter = NotificationFilter()
+        self.outbox = NotificationOutbox(OUTBOX_PATH, ttls=OUTBOX_TTLS)
+        self.in_flight = {}  # id de la notificación -> instante de envío
+
+        self.recorder = SessionRecorder(RECORD_PATH) if RECORD_PATH else None
+        self.http = None
+        self.klipper_ws = None
+        self.server_ws = None
+        # Los eventos se crean dentro del bucle en run()
+        self.outbox_ready = None
+        self.slot_released = None
+
+    async def run(self):
+        self.outbox_ready = asyncio.Event()
+        self.slot_released = asyncio.Event()
+        # Un único cliente HTTP reutiliza la conexión con Moonraker
+        async with httpx.AsyncClient(base_url=MOONRAKER_URL, timeout=5) as http:
+            self.http = http
+            await self.initialize_file_list()
+            self.start_history_sync()
+            self.check_initial_restart()
+            tasks = [
+                self.process_notifications(),
+                self.connect_to_server_ws(),
+                self.connect_websocket(),
+                self.monitor_klippy_stats()
+            ]
+            if METRICS_PORT:
+                tasks.append(self.serve_metrics())
+            self.log_follower.start()
+            try:
+                await asyncio.gather(*tasks)
+            finally:
+                self.log_follower.stop()
+                if self.recorder:
+                    self.recorder.close()
+
+    async def serve_metrics(self):
+        """
+        Servidor HTTP mínimo en 127.0.0.1 que responde GET /metrics en formato Prometheus.
+        """
         try:
-            message = notification_queue.get(timeout=1)  # Usa timeout para evitar bloqueos
-            logging.info(message)
-
-            # Enviar la notificación al servidor FastAPI
-            send_notification_to_server(message)
-
-            # Esperar 2 segundos antes de procesar la siguiente notificación
-            time.sleep(2)
+            server = await asyncio.start_server(self.handle_metrics_request, "127.0.0.1", METRICS_PORT)
+        except OSError as e:
+            logging.error(f"No se pudo iniciar el servidor de métricas en el puerto {METRICS_PORT}: {e}")
+            return
+        logging.info(f"Métricas disponibles en http://127.0.0.1:{METRICS_PORT}/metrics")
+        async with server:
+            await server.serve_forever()
 
-            notification_queue.task_done()
-        except queue.Empty:
-            continue
+    async def handle_metrics_request(self, reader, writer):
+        try:
+            request_line = await asyncio.wait_for(reader.readline(), 5)
+            # Descartar los encabezados de la solicitud
+            while (await asyncio.wait_for(reader.readline(), 5)) not in (b"\r\n", b"\n", b""):
+                pass
+            parts = request_line.decode("latin-1").split()
+            if len(parts) >= 2 and parts[0] == "GET" and parts[1].split("?")[0] == "/metrics":
+                QUEUE_DEPTH.set(self.outbox.pending_count())
+                status, content_type, body = "200 OK", CONTENT_TYPE, REGISTRY.render().encode("utf-8")
+            else:
+                status, content_type, body = "404 Not Found", "text/plain", b"Not Found\n"
+            writer.write(
+                f"HTTP/1.1 {status}\r\nContent-Type: {content_type}\r\n"
+                f"Content-Length: {len(body)}\r\nConnection: close\r\n\r\n".encode("latin-1") + body
+            )
+            await writer.drain()
         except Exception as e:
-            logging.error(f"Error en process_notifications: {e}")
+            logging.debug(f"Error al responder la solicitud de métricas: {e}")
+        finally:
+            writer.close()
+
+    # Notificaciones
+
+    def add_notification(self, message, category=None, priority=None):
+        # Filtrar duplicados y condensar ráfagas según la categoría
+        ready = self.notification_filter.submit(message, category)
+        if (category, message) not in ready:
+            reason = "coalesced" if self.notification_filter.in_burst(category) else "duplicate"
+            DROPPED_TOTAL.inc(reason=reason)
+        # La prioridad explícita es solo del mensaje; los resúmenes usan la de su categoría
+        self.enqueue_notifications(
+            (ready_category, text, priority if (ready_category, text) == (category, message) else None)
+            for ready_category, text in ready
+        )
+
+    def flush_notification_bursts(self):
+        """
+        Encola los resúmenes de las ráfagas cuya ventana ya terminó, cada uno en su categoría.
+        """
+        self.enqueue_notifications((category, text, None) for category, text in self.notification_filter.flush())
+
+    def enqueue_notifications(self, notifications):
+        """
+        Guarda en la bandeja de salida los (categoría, mensaje, prioridad) dados; sin
+        prioridad explícita se deriva de la categoría.
+        """
+        notifications = list(notifications)
+        for category, message, priority in notifications:
+            self.outbox.put(message, category, priority)
+            NOTIFICATIONS_TOTAL.inc(category=category or "general")
+            logging.info(f"Notificación añadida a la cola: {message}")
+        if notifications:
+            QUEUE_DEPTH.set(self.outbox.pending_count())
+            self.outbox_ready.set()
+
+    async def process_notifications(self):
+        while True:
+            try:
+                # Encolar los resúmenes de ráfagas pendientes antes de esperar
+                self.flush_notification_bursts()
+
+                # Esperar a que haya lugar en la ventana de envíos sin acuse
+                await self.wait_for_send_slot()
+
+                # Sin conexión las notificaciones esperan en la bandeja de salida
+                if self.server_ws is None:
+                    await asyncio.sleep(1)
+                    continue
+
+                # Tomar la notificación pendiente de mayor prioridad (las expiradas se descartan)
+                self.outbox_ready.clear()
+                entry = self.outbox.next_pending()
+                if entry is None:
+                    await self.wait_event(self.outbox_ready, 1)  # Usa timeout para revisar las ráfagas
+                    continue
+
+                notification_id, message, created_at = entry
+                QUEUE_DEPTH.set(self.outbox.pending_count())
+                QUEUE_SECONDS.observe(time.time() - created_at)
+                formatted_message = f"Notify:{message}"
+                logging.info(f"{formatted_message} (en cola {time.time() - created_at:.1f}s)")
+
+                # Enviar la notificación al servidor FastAPI
+                if not await self.send_notification_to_server(notification_id, formatted_message):
+                    self.outbox.requeue(notification_id)
+                    await asyncio.sleep(1)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logging.error(f"Error en process_notifications: {e}")
+                await asyncio.sleep(1)
+
+    @staticmethod
+    async def wait_event(event, timeout):
+        try:
+            await asyncio.wait_for(event.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
 
-def send_notification_to_server(message):
-    """
-    Envía una notificación al servidor FastAPI a través de WebSocket.
-    """
-    try:
-        if server_ws and server_ws.sock and server_ws.sock.connected:
-            payload = {
-                "API_KEY": EXPECTED_API_KEY,
-                "action": "process_text",
-                "text": message
-            }
-            server_ws.send(json.dumps(payload))
-            logging.info(f"Notificación enviada al servidor: {message}")
+    async def wait_for_send_slot(self):
+        """
+        Espera hasta que haya menos de NOTIFY_WINDOW notificaciones pendientes de acuse 'played'.
+        Las notificaciones sin acuse después de ACK_TIMEOUT se dan por terminadas.
+        """
+        while True:
+            now = time.time()
+            for notification_id, sent_at in list(self.in_flight.items()):
+                if now - sent_at > ACK_TIMEOUT:
+                    logging.warning(f"Sin acuse del servidor para la notificación {notification_id}; liberando su lugar.")
+                    del self.in_flight[notification_id]
+                    IN_FLIGHT.set(len(self.in_flight))
+            if len(self.in_flight) < NOTIFY_WINDOW:
+                return
+            self.slot_released.clear()
+            await self.wait_event(self.slot_released, 1)
+
+    def release_in_flight(self, notification_id=None):
+        """
+        Libera el lugar de una notificación en la ventana de envíos, o de todas si no se indica el id.
+        """
+        if notification_id is None:
+            self.in_flight.clear()
         else:
+            self.in_flight.pop(notification_id, None)
+        IN_FLIGHT.set(len(self.in_flight))
+        self.slot_released.set()
+
+    async def send_notification_to_server(self, notification_id, message):
+        """
+        Envía una notificación al servidor FastAPI a través de WebSocket.
+        Retorna True si se envió.
+        """
+        server_ws = self.server_ws
+        if server_ws is None:
             logging.warning("No hay conexión WebSocket con el servidor. La notificación no se pudo enviar.")
-    except Exception as e:
-        logging.error(f"Error al enviar notificación al servidor: {e}")
-
-def get_current_temperatures():
-    """
-    Realiza una solicitud HTTP para obtener las temperaturas actuales de la cama y el extrusor.
-    Retorna un diccionario con las temperaturas actuales y los objetivos.
-    """
-    try:
-        response = requests.get('http://localhost:7125/printer/objects/query?heater_bed&extruder')
-        data = response.json()['result']['status']
-        temperatures = {}
+            return False
+        payload = {
+            "API_KEY": EXPECTED_API_KEY,
+            "action": "process_text",
+            "text": message,
+            "id": notification_id
+        }
+        self.in_flight[notification_id] = time.time()
+        IN_FLIGHT.set(len(self.in_flight))
+        try:
+            await server_ws.send(json.dumps(payload))
+            logging.info(f"Notificación enviada al servidor: {message}")
+            return True
+        except Exception as e:
+            logging.error(f"Error al enviar notificación al servidor: {e}")
+            self.release_in_flight(notification_id)
+            return False
 
-        if 'heater_bed' in data:
-            heater_bed = data['heater_bed']
-            temperatures['heater_bed_temp'] = heater_bed.get('temperature')
-            temperatures['heater_bed_target'] = heater_bed.get('target')
+    # Consultas HTTP a Moonraker
 
-        if 'extruder' in data:
-            extruder = data['extruder']
-            temperatures['extruder_temp'] = extruder.get('temperature')
-            temperatures['extruder_target'] = extruder.get('target')
+    async def moonraker_get(self, path, call):
+        """
+        Realiza una consulta GET a Moonraker y devuelve el JSON de la respuesta.
+        call identifica la consulta en las métricas.
+        """
+        try:
+            with HTTP_SECONDS.time(call=call):
+                response = await self.http.get(path)
+                data = response.json()
+        except Exception:
+            HTTP_ERRORS_TOTAL.inc(call=call)
+            raise
+        if self.recorder:
+            self.recorder.record_http(path, data)
+        return data
+
+    async def initialize_file_list(self):
+        file_list = await self.get_file_list()
+        if file_list is not None:
+            self.file_set = set(file_list)
+
+    async def get_file_list(self):
+        """
+        Descarga la lista completa de archivos. Retorna None si no se pudo obtener.
+        """
+        try:
+            files = (await self.moonraker_get('/server/files/list', "get_file_list"))['result']
+            # Usar la ruta relativa a 'gcodes', igual que en notify_filelist_changed
+            file_list = [f.get('path') or f['display'] for f in files]
+            logging.debug(f"File list retrieved: {file_list}")
+            return file_list
+        except Exception as e:
+            logging.error(f"Error al obtener la lista de archivos: {e}")
+            return None
+
+    async def get_current_temperatures(self):
+        """
+        Realiza una solicitud HTTP para obtener las temperaturas actuales de la cama y el extrusor.
+        Retorna un diccionario con las temperaturas actuales y los objetivos.
+        """
+        try:
+            data = (await self.moonraker_get('/printer/objects/query?heater_bed&extruder', "get_current_temperatures"))['result']['status']
+            temperatures = {}
 
-        return temperatures
+            if 'heater_bed' in data:
+                heater_bed = data['heater_bed']
+                temperatures['heater_bed_temp'] = heater_bed.get('temperature')
+                temperatures['heater_bed_target'] = heater_bed.get('target')
 
-    except Exception as e:
-        logging.error(f"Error al obtener las temperaturas actuales: {e}")
-        return {}
+            if 'extruder' in data:
+                extruder = data['extruder']
+                temperatures['extruder_temp'] = extruder.get('temperature')
+                temperatures['extruder_target'] = extruder.get('target')
 
-def restart_service():
-    """
-    Reinicia el servicio event_listener.service utilizando systemctl.
-    """
-    try:
-        subprocess.run(['sudo', 'systemctl', 'restart', 'event_listener.service'], check=True)
-        logging.info("Servicio event_listener.service reiniciado exitosamente.")
-    except subprocess.CalledProcessError as e:
-        logging.error(f"Error al reiniciar el servicio: {e}")
+            return temperatures
 
-def is_connection_successful():
-    """
-    Verifica si el estado de Klipper es 'ready' o 'standby' mediante el endpoint /server/info.
-    Retorna True si está en uno de estos estados, False de lo contrario.
-    """
-    try:
-        response = requests.get('http://localhost:7125/server/info')
-        data = response.json()['result']
-        klippy_state = data.get('klippy_state', '').lower()
-        if klippy_state in ['ready', 'standby']:
-            return True
-        return False
-    except Exception as e:
-        logging.error(f"Error al verificar el estado de Klipper: {e}")
-        return False
-
-def watcher_reconnection():
-    """
-    Espera a que se restablezca la conexión de Klipper dentro del tiempo de espera.
-    Envía notificaciones según el resultado.
-    """
-    global reconnection_watcher_active
-
-    start_time = time.time()
-    while time.time() - start_time < RECONNECTION_TIMEOUT:
-        if is_connection_successful():
-            # Reconexión exitosa
-            message_text = "Se ha reiniciado el firmware de la impresora y se ha reestablecido la conexión con éxito."
-            add_notification(message_text)
-            break
+        except Exception as e:
+            logging.error(f"Error al obtener las temperaturas actuales: {e}")
+            return {}
+
+    def check_initial_restart(self):
+        """
+        Verifica si el script se está iniciando.
+        Envía una notificación adecuada.
+        """
+        if os.path.exists(RUNNING_FLAG):
+            message = "El servicio de notificaciones ha sido reiniciado."
+            self.add_notification(message)
         else:
-            # Esperar antes de volver a intentar
-            time.sleep(2)
-    else:
-        # Tiempo de espera agotado, reconexión fallida
-        message_text = "Se ha reiniciado el firmware de la impresora pero no se ha establecido conexión."
-        add_notification(message_text)
-
-    reconnection_watcher_active = False  # Resetear la bandera
-
-def on_message(ws, message):
-    global prev_print_state, prev_filename
-    global prev_file_list
-    global prev_position, has_started_printing, print_started_notified
-    global prev_heater_bed_target, prev_extruder_target
-    global prev_klipper_state, prev_mcu_state
-    global reconnection_watcher_active
-
-    try:
-        data = json.loads(message)
-        method = data.get('method')
-        params = data.get('params', [])
-
-        # Manejo de notificaciones adicionales de Klipper
-        if method in ['notify_klippy_shutdown', 'notify_klippy_disconnected', 'notify_klippy_error']:
-            if method == 'notify_klippy_shutdown':
-                message_text = f"Se ha perdido conexión con la impresora: {method.replace('notify_', '').replace('_', ' ').title()}"
-                add_notification(message_text)
-            elif method == 'notify_klippy_disconnected':
-                # Iniciar proceso de monitoreo de reconexión
-                if not reconnection_watcher_active:
-                    reconnection_watcher_active = True
-                    reconnection_event.clear()
-                    watcher_thread = threading.Thread(target=watcher_reconnection, daemon=True)
-                    watcher_thread.start()
-                logging.info("Se ha reiniciado el firmware de la impresora y se está intentando reconectar.")
-            elif method == 'notify_klippy_error':
-                message_text = f"Error: {method.replace('notify_', '').replace('_', ' ').title()}"
-                add_notification(message_text)
-
-            # Opcional: Reiniciar el servicio
-            # restart_service()
-
-            # Alternativamente, cerrar el WebSocket para reconectar
-            if method == 'notify_klippy_disconnected':
-                logging.info("Cerrando la conexión WebSocket debido al reinicio del firmware.")
-                ws.close()
-            return
+            message = "El servicio se ha iniciado por primera vez."
+            self.add_notification(message)
+        # Establecer el RUNNING_FLAG
+        with open(RUNNING_FLAG, 'w') as f:
+            f.write(str(time.time()))
+
+    # Temporizadores
+
+    def start_temperature_monitoring(self):
+        if not self.monitoring_temperatures:
+            self.monitoring_temperatures = True
+            if self.temperature_task is None or self.temperature_task.done():
+                self.temperature_task = asyncio.create_task(self.check_temperatures())
+
+    def stop_temperature_monitoring(self):
+        self.monitoring_temperatures = False
+
+    async def check_temperatures(self):
+        while self.monitoring_temperatures:
+            # No consultar mientras hay una impresión en curso
+            if not self.has_started_printing:
+                await self.check_temperatures_once()
+            # Programar la siguiente verificación
+            await asyncio.sleep(1)
+
+    async def check_temperatures_once(self):
+        try:
+            # Realizar una solicitud HTTP para obtener el estado actual de la impresora
+            data = (await self.moonraker_get('/printer/objects/query?heater_bed&extruder', "check_temperatures"))['result']['status']
 
-        if method == 'notify_status_update':
-            status = params[0]
-
-            # Monitorear el estado de Klipper
-            if 'klipper' in status:
-                klipper = status['klipper']
-                klipper_state = klipper.get('state')
-                state_message = klipper.get('state_message')
-
-                if klipper_state != prev_klipper_state and klipper_state is not None:
-                    message_text = f"Estado de Klipper: {klipper_state}"
-                    add_notification(message_text)
-
-                    if state_message:
-                        message_text = f"Mensaje de estado: {state_message}"
-                        add_notification(message_text)
-
-                    if klipper_state.lower() in ['shutdown', 'error']:
-                        # Notificar que se ha perdido la conexión o se ha activado una parada de emergencia
-                        message_text = f"Se ha perdido conexión con la impresora: {klipper_state}"
-                        add_notification(message_text)
-
-                    prev_klipper_state = klipper_state
-
-            # Monitorear el estado de la MCU
-            if 'mcu' in status:
-                mcu = status['mcu']
-                mcu_state = mcu.get('state')
-
-                if mcu_state != prev_mcu_state and mcu_state is not None:
-                    message_text = f"Estado de la MCU: {mcu_state}"
-                    add_notification(message_text)
-
-                    if mcu_state.lower() in ['shutdown', 'error', 'offline']:
-                        # Notificar que se ha perdido la conexión con la MCU
-                        message_text = f"Se ha perdido conexión con la impresora, MCU ha entrado en estado {mcu_state}"
-                        add_notification(message_text)
-
-                    prev_mcu_state = mcu_state
-
-            # Monitorear print_stats
-            if 'print_stats' in status:
-                print_stats = status['print_stats']
-                state = print_stats.get('state')
-                filename = print_stats.get('filename')
-
-                # Notificar cambios en el estado de impresión
-                if state != prev_print_state and state is not None:
-                    if state == 'printing':
-                        has_started_printing = True  # Establecer como iniciado
-                        print_started_notified = False  # Restablecer la bandera de notificación
-                        if filename:
-                            file_no_ext = filename.replace(".gcode", "")
-                            message_text = f"Se va a imprimir: {file_no_ext}"
-                            add_notification(message_text)
-                        else:
-                            message_text = "Se ha iniciado una impresión."
-                            add_notification(message_text)
-                    elif state == 'paused':
-                        message_text = "La impresión ha sido pausada."
-                        add_notification(message_text)
-                        has_started_printing = False  # Restablecer bandera
-                        print_started_notified = False  # Restablecer la bandera de notificación
-                    elif state == 'error':
-                        message_text = "¡Se ha producido un error en la impresión!"
-                        add_notification(message_text)
-                        has_started_printing = False  # Restablecer bandera
-                        print_started_notified = False  # Restablecer la bandera de notificación
-                    elif state == 'complete':
-                        message_text = "La impresión ha finalizado normalmente."
-                        add_notification(message_text)
-                        has_started_printing = False  # Restablecer bandera
-                        print_started_notified = False  # Restablecer la bandera de notificación
-                    elif state == 'standby':
-                        message_text = "La impresora está en espera."
-                        add_notification(message_text)
-                        has_started_printing = False  # Restablecer bandera
-                        print_started_notified = False  # Restablecer la bandera de notificación
-                    elif state in ['cancelled', 'cancelling']:
-                        message_text = "La impresión ha sido cancelada."
-                        add_notification(message_text)
-                        has_started_printing = False  # Restablecer bandera
-                        print_started_notified = False  # Restablecer la bandera de notificación
-                    elif state == 'ready':
-                        message_text = "La impresora está lista."
-                        add_notification(message_text)
-                        # No cambiar has_started_printing
-                    else:
-                        message_text = f"Estado de impresión desconocido: {state}"
-                        add_notification(message_text)
-
-                    prev_print_state = state
-
-            # Monitorear heater_bed
-            if 'heater_bed' in status:
-                heater_bed = status['heater_bed']
+            # Monitorear la temperatura de la cama
+            if 'heater_bed' in data:
+                heater_bed = data['heater_bed']
+                temp = heater_bed.get('temperature')
                 target = heater_bed.get('target')
 
-                if target is not None and target != prev_heater_bed_target:
-                    prev_heater_bed_target = target
-                    if not has_started_printing:
-                        if target != 0:
-                            start_temperature_monitoring()
-                        else:
-                            message_text = "Enfriando la cama"
-                            add_notification(message_text)
-                        # Notificación de nuevo objetivo
-                        if target != 0:
-                            message_text = f"Nuevo objetivo de temperatura de la cama: {target}°C"
-                            add_notification(message_text)
-
-            # Monitorear extruder
-            if 'extruder' in status:
-                extruder = status['extruder']
+                if temp is not None and target is not None and target != 0:
+                    if abs(temp - target) <= TEMPERATURE_TOLERANCE and not self.bed_temp_reached:
+                        message = f"La cama ha alcanzado la temperatura objetivo de {target}°C"
+                        self.add_notification(message, "temperature")
+                        self.bed_temp_reached = True
+                        self.stop_temperature_monitoring()
+                    elif abs(temp - target) > TEMPERATURE_TOLERANCE:
+                        self.bed_temp_reached = False  # Restablecer si se aleja del objetivo
+
+            # Monitorear la temperatura del extrusor
+            if 'extruder' in data:
+                extruder = data['extruder']
+                temp = extruder.get('temperature')
                 target = extruder.get('target')
 
-                if target is not None and target != prev_extruder_target:
-                    prev_extruder_target = target
-                    if not has_started_printing:
-                        if target != 0:
-                            start_temperature_monitoring()
-                        else:
-                            message_text = "Enfriando el extrusor"
-                            add_notification(message_text)
-                        # Notificación de nuevo objetivo
-                        if target != 0:
-                            message_text = f"Nuevo objetivo de temperatura del extrusor: {target}°C"
-                            add_notification(message_text)
-
-            # Monitorear toolhead para detectar movimiento
-            if 'toolhead' in status:
-                toolhead = status['toolhead']
-                position = toolhead.get('position')
-
-                if position != prev_position and prev_position is not None:
-                    # Solo notificar si la impresión ha comenzado y aún no se ha notificado
-                    if has_started_printing and not print_started_notified:
-                        # Verificar las temperaturas actuales
-                        temperatures = get_current_temperatures()
-                        heater_bed_temp = temperatures.get('heater_bed_temp')
-                        heater_bed_target = temperatures.get('heater_bed_target')
-                        extruder_temp = temperatures.get('extruder_temp')
-                        extruder_target = temperatures.get('extruder_target')
-
-                        # Verificar que las temperaturas no sean None
-                        if (heater_bed_temp is not None and heater_bed_target is not None and
-                            extruder_temp is not None and extruder_target is not None):
-
-                            # Verificar si las temperaturas están dentro del rango de tolerancia
-                            bed_temp_ok = abs(heater_bed_temp - heater_bed_target) <= TEMPERATURE_CHECK_TOLERANCE
-                            extruder_temp_ok = abs(extruder_temp - extruder_target) <= TEMPERATURE_CHECK_TOLERANCE
-
-                            if bed_temp_ok and extruder_temp_ok:
-                                message_text = "La impresora ha comenzado a imprimir."
-                                add_notification(message_text)
-                                print_started_notified = True  # Establecer como notificado
-                        # Si alguna temperatura es None o no está dentro del rango, no hacer nada
-
-                prev_position = position
-
-        elif method == 'notify_filelist_changed':
-            # Obtener la nueva lista de archivos
-            new_file_list = get_file_list()
-            if new_file_list:
-                new_files = set(new_file_list) - set(prev_file_list)
-                deleted_files = set(prev_file_list) - set(new_file_list)
-
-                for filename in new_files:
-                    file_no_ext = filename.replace(".gcode", "")
-                    message_text = f"Se ha agregado un nuevo archivo a mainsail: {file_no_ext}"
-                    add_notification(message_text)
-
-                for filename in deleted_files:
-                    file_no_ext = filename.replace(".gcode", "")
-                    message_text = f"Se ha eliminado un archivo de mainsail: {file_no_ext}"
-                    add_notification(message_text)
-
-                prev_file_list = new_file_list
-            else:
-                logging.warning("No se pudo obtener la lista de archivos.")
-
-        elif method == 'notify_gcode_response':
-            response = params[0]
-            if "M118" in response:
-                # Asumiendo que las macros envían un mensaje con M118
-                macro_name = response.replace('M118 // Ejecutando macro:', '').strip()
-                message_text = f"Macro ejecutada: {macro_name}"
-                add_notification(message_text)
-
-    except Exception as e:
-        logging.error(f"Error en on_message: {e}")
+                if temp is not None and target is not None and target != 0:
+                    if abs(temp - target) <= TEMPERATURE_TOLERANCE and not self.extruder_temp_reached:
+                        message = f"El extrusor ha alcanzado la temperatura objetivo de {target}°C"
+                        self.add_notification(message, "temperature")
+                        self.extruder_temp_reached = True
+                        self.stop_temperature_monitoring()
+                    elif abs(temp - target) > TEMPERATURE_TOLERANCE:
+                        self.extruder_temp_reached = False  # Restablecer si se aleja del objetivo
+
+        except Exception as e:
+            logging.error(f"Error al obtener las temperaturas: {e}")
+
+    def start_klippy_restart_timer(self):
+        if self.klippy_restart_task is None or self.klippy_restart_task.done():
+            self.klippy_restart_task = asyncio.create_task(self.klippy_restart_timeout())
+
+    async def klippy_restart_timeout(self):
+        """
+        Anuncia el fallo si Klipper no vuelve a estar listo dentro del tiempo de espera.
+        El éxito lo anuncia on_klippy_restored al llegar la nueva instantánea.
+        """
+        await asyncio.sleep(RECONNECTION_TIMEOUT)
+        if self.klippy_restarting:
+            self.klippy_restarting = False
+            message_text = "Se ha reiniciado el firmware de la impresora pero no se ha establecido conexión."
+            self.add_notification(message_text)
+
+    def on_klippy_restored(self):
+        self.klippy_restarting = False
+        if self.klippy_restart_task is not None:
+            self.klippy_restart_task.cancel()
+        message_text = "Se ha reiniciado el firmware de la impresora y se ha reestablecido la conexión con éxito."
+        self.add_notification(message_text)
+
+    # Historial de impresiones
+
+    def start_history_sync(self):
+        if self.history_task is None or self.history_task.done():
+            self.history_task = asyncio.create_task(self.sync_print_history())
+
+    async def sync_print_history(self):
+        """
+        Trae de Moonraker los trabajos nuevos o en curso desde la última sincronización.
+        """
         try:
-            logging.error(f"Mensaje recibido: {message}")
-        except NameError:
-            pass
+            since = self.history.sync_cursor()
+            start = 0
+            total = 0
+            while True:
+                path = f"/server/history/list?start={start}&since={since}&limit={HISTORY_PAGE_SIZE}&order=asc"
+                jobs = (await self.moonraker_get(path, "sync_print_history"))['result']['jobs']
+                total += self.history.upsert_jobs(jobs)
+                if len(jobs) < HISTORY_PAGE_SIZE:
+                    break
+                start += len(jobs)
+            if total:
+                logging.info(f"Historial de impresiones: {total} trabajos sincronizados.")
+        except Exception as e:
+            logging.error(f"Error al sincronizar el historial de impresiones: {e}")
 
-def on_error(ws, error):
-    logging.error(f"Error en WebSocket: {error}")
-    # No cerramos la conexión aquí; se manejará en connect_websocket
-
-def on_close(ws, close_status_code, close_msg):
-    logging.warning("Conexión WebSocket cerrada")
-    # La reconexión se maneja en el bucle de connect_websocket
-
-def on_open(ws):
-    global reconnection_event
-    logging.info("Conexión WebSocket abierta")
-    # Suscribirse a los objetos necesarios y recuperar el estado inicial
-    subscribe_message = {
-        "jsonrpc": "2.0",
-        "method": "printer.objects.subscribe",
-        "params": {
-            "objects": {
-                "heater_bed": None,
-                "extruder": None,
-                "print_stats": ["state", "filename"],
-                "toolhead": ["position"],
-                "klipper": ["state", "state_message"],
-                "mcu": ["state"]
-            },
-            "retrieve_objects": True
-        },
-        "id": 1
-    }
-    try:
-        ws.send(json.dumps(subscribe_message))
-    except Exception as e:
-        logging.error(f"Error al enviar mensaje de suscripción: {e}")
+    # Log de Klipper
 
-    # Si está esperando una reconexión, señalizar que se ha reconectado
-    if reconnection_watcher_active:
-        reconnection_event.set()
+    def on_klippy_log(self, name, match, line):
+        logging.debug(f"Coincidencia '{name}' en el log de Klipper: {line}")
+        self.log_handlers[name](match, line)
 
-def connect_websocket():
-    global ws
-    while True:
+    def on_firmware_restart(self, match, line):
+        """
+        Un FIRMWARE_RESTART reinicia Klipper y descarta las suscripciones: en lugar de
+        reiniciar el servicio se vuelve a suscribir en el mismo proceso.
+        """
+        now = time.time()
+        if now - self.last_firmware_restart < FIRMWARE_RESTART_DEBOUNCE:
+            return
+        self.last_firmware_restart = now
+        logging.info("Se detectó firmware_restart en el log de Klipper. Renovando la suscripción.")
+        self.klippy_restarting = True
+        self.start_klippy_restart_timer()
+        # Si Klipper todavía no está listo la suscripción falla y se repite con notify_klippy_ready
+        asyncio.create_task(self.subscribe(self.klipper_ws))
+
+    async def monitor_klippy_stats(self):
+        """
+        Lee periódicamente las estadísticas de Klipper y avisa cuando se cruza un umbral.
+        """
+        while True:
+            try:
+                # La primera lectura puede procesar varios MB: hacerla fuera del bucle
+                await asyncio.to_thread(self.klippy_stats.update)
+                for message_text in self.klippy_stats.check_thresholds():
+                    self.add_notification(message_text, "host")
+            except Exception as e:
+                logging.error(f"Error al procesar las estadísticas de Klipper: {e}")
+            await asyncio.sleep(STATS_INTERVAL)
+
+    # Mensajes de Moonraker
+
+    async def on_message(self, message):
+        start = time.perf_counter()
+        method = None
         try:
-            ws = websocket.WebSocketApp(
-                "ws://localhost:7125/websocket",
-                on_open=on_open,
-                on_message=on_message,
-                on_error=on_error,
-                on_close=on_close
-            )
-            ws.run_forever()
+            data = json.loads(message)
+            method = data.get('method')
+            params = data.get('params', [])
+
+            # Respuestas a nuestras solicitudes (la suscripción)
+            if method is None and 'id' in data:
+                await self.on_response(data)
+                return
+
+            # Manejo de notificaciones adicionales de Klipper
+            if method in ['notify_klippy_shutdown', 'notify_klippy_disconnected', 'notify_klippy_error', 'notify_klippy_ready']:
+                if method == 'notify_klippy_shutdown':
+                    message_text = f"Se ha perdido conexión con la impresora: {method.replace('notify_', '').replace('_', ' ').title()}"
+                    self.add_notification(message_text, "error")
+                elif method == 'notify_klippy_disconnected':
+                    # Moonraker mantiene el WebSocket abierto; esperar a notify_klippy_ready
+                    self.klippy_restarting = True
+                    self.start_klippy_restart_timer()
+                    logging.info("Se ha reiniciado el firmware de la impresora y se está intentando reconectar.")
+                elif method == 'notify_klippy_error':
+                    message_text = f"Error: {method.replace('notify_', '').replace('_', ' ').title()}"
+                    self.add_notification(message_text, "error")
+                elif method == 'notify_klippy_ready':
+                    # Klipper descarta las suscripciones al reiniciar: volver a suscribirse
+                    logging.info("Klipper está listo. Renovando la suscripción.")
+                    await self.subscribe(self.klipper_ws)
+                return
+
+            if method == 'notify_status_update':
+                await self.on_status_update(params[0])
+
+            elif method == 'notify_filelist_changed':
+                await self.on_filelist_changed(params[0])
+
+            elif method == 'notify_gcode_response':
+                response = params[0]
+                if "M118" in response:
+                    # Asumiendo que las macros envían un mensaje con M118
+                    macro_name = response.replace('M118 // Ejecutando macro:', '').strip()
+                    message_text = f"Macro ejecutada: {macro_name}"
+                    self.add_notification(message_text)
+
         except Exception as e:
-            logging.error(f"Excepción en connect_websocket: {e}")
-        logging.warning("Conexión WebSocket cerrada. Reintentando en 5 segundos...")
-        time.sleep(5)
+            logging.error(f"Error en on_message: {e}")
+            logging.error(f"Mensaje recibido: {message}")
+        finally:
+            # Las respuestas a solicitudes (sin método) se agrupan como 'response'
+            method = method or "response"
+            MESSAGES_TOTAL.inc(method=method)
+            ON_MESSAGE_SECONDS.observe(time.perf_counter() - start, method=method)
+
+    async def on_status_update(self, status):
+        # Evaluar solo las reglas de los campos que trae la actualización
+        for match in self.rules.apply(status):
+            rule = match.rule
+            if not self.rules.check(match, self.rule_flags()):
+                continue
+            if rule.guard and not await self.rule_guards[rule.guard]():
+                continue
+            self.rules.mark_fired(rule)
+            for action in rule.actions:
+                self.rule_actions[action]()
+            message_text = self.rules.render(match, self.rule_flags())
+            if message_text:
+                self.add_notification(message_text, rule.category, rule.priority)
+
+    async def on_response(self, data):
+        if data.get('id') != self.subscribe_id:
+            return
+        if 'error' in data:
+            # Klipper aún no está listo: se reintenta con notify_klippy_ready
+            logging.warning(f"La suscripción a Moonraker falló: {data['error']}")
+            return
+        await self.on_snapshot(data.get('result', {}).get('status', {}))
+        if self.klippy_restarting:
+            self.on_klippy_restored()
+
+    async def on_snapshot(self, status):
+        """
+        Procesa el estado completo que devuelve la suscripción (retrieve_objects).
+
+        La primera vez solo se carga el estado conocido. En las siguientes (reconexión de
+        Moonraker o reinicio de Klipper) se compara contra el estado en caché: las
+        transiciones perdidas se anuncian una vez y lo que no cambió no se repite.
+        """
+        if not self.snapshot_seeded:
+            self.rules.seed(status)
+            self.snapshot_seeded = True
+            # Si el listener arranca con una impresión en curso no se anuncia su inicio
+            if self.rules.state.get("print_stats.state") == "printing":
+                self.start_printing()
+                self.mark_print_started_notified()
+            logging.info("Estado inicial de la impresora cargado.")
+            return
+        logging.info("Resincronizando el estado de la impresora tras la reconexión.")
+        await self.on_status_update(status)
+
+    def rule_flags(self):
+        """
+        Banderas del listener disponibles en las reglas como 'listener.<nombre>'.
+        """
+        return {
+            "has_started_printing": self.has_started_printing,
+            "print_started_notified": self.print_started_notified,
+        }
+
+    # Acciones y guardas de las reglas
+
+    def start_printing(self):
+        self.has_started_printing = True  # Establecer como iniciado
+        self.print_started_notified = False  # Restablecer la bandera de notificación
+
+    def stop_printing(self):
+        self.has_started_printing = False  # Restablecer bandera
+        self.print_started_notified = False  # Restablecer la bandera de notificación
+
+    def mark_print_started_notified(self):
+        self.print_started_notified = True  # Establecer como notificado
+
+    def record_print_start(self):
+        self.history.record_start(self.rules.state.get("print_stats.filename"))
+
+    def record_print_end(self):
+        state = self.rules.state.get("print_stats.state")
+        self.history.record_end(self.rules.state.get("print_stats.filename"), HISTORY_END_STATUSES.get(state, state))
+        # Moonraker ya cerró el trabajo: traer sus datos reales (duración, filamento)
+        self.start_history_sync()
+
+    async def temperatures_at_target(self):
+        """
+        Verifica que la cama y el extrusor estén dentro de TEMPERATURE_CHECK_TOLERANCE de su objetivo.
+        """
+        temperatures = await self.get_current_temperatures()
+        heater_bed_temp = temperatures.get('heater_bed_temp')
+        heater_bed_target = temperatures.get('heater_bed_target')
+        extruder_temp = temperatures.get('extruder_temp')
+        extruder_target = temperatures.get('extruder_target')
+
+        # Si alguna temperatura es None no se puede confirmar
+        if (heater_bed_temp is None or heater_bed_target is None or
+            extruder_temp is None or extruder_target is None):
+            return False
+
+        # Verificar si las temperaturas están dentro del rango de tolerancia
+        bed_temp_ok = abs(heater_bed_temp - heater_bed_target) <= TEMPERATURE_CHECK_TOLERANCE
+        extruder_temp_ok = abs(extruder_temp - extruder_target) <= TEMPERATURE_CHECK_TOLERANCE
+        return bed_temp_ok and extruder_temp_ok
+
+    async def on_filelist_changed(self, change):
+        """
+        Aplica el cambio informado por Moonraker al conjunto de archivos en memoria.
+        Solo se vuelve a descargar la lista completa si se detecta una inconsistencia
+        o si el cambio afecta a un directorio entero.
+        """
+        action = change.get('action')
+        item = change.get('item', {})
+        source_item = change.get('source_item', {})
+        in_gcodes = item.get('root', 'gcodes') == 'gcodes'
+        path = item.get('path')
+
+        if action == 'move_file':
+            # Solo el movimiento mira el origen: puede entrar o salir de 'gcodes'
+            source_path = source_item.get('path')
+            from_gcodes = source_item.get('root', 'gcodes') == 'gcodes'
+            if from_gcodes and in_gcodes:
+                if source_path not in self.file_set:
+                    logging.warning(f"Se movió un archivo desconocido ({source_path}); resincronizando la lista.")
+                    await self.resync_file_list()
+                    return
+                self.file_set.remove(source_path)
+                self.file_set.add(path)
+                message_text = f"Se ha renombrado un archivo de mainsail: {source_path.replace('.gcode', '')} a {path.replace('.gcode', '')}"
+                self.add_notification(message_text, "file")
+            elif from_gcodes:
+                await self.apply_file_deleted(source_path)
+            elif in_gcodes:
+                self.apply_file_created(path)
+            return
 
-# Funciones para manejar el WebSocket con el servidor
-def connect_to_server_ws():
-    global server_ws
+        if action == 'move_dir' and source_item.get('root', 'gcodes') == 'gcodes':
+            in_gcodes = True
+        if not in_gcodes:
+            # Copias de printer.cfg de SAVE_CONFIG, logs, etc.: no son archivos imprimibles
+            return
+        if action == 'create_file':
+            self.apply_file_created(path)
+        elif action == 'delete_file':
+            await self.apply_file_deleted(path)
+        elif action in ['create_dir', 'delete_dir', 'move_dir', 'root_update']:
+            # Un directorio puede contener muchos archivos: comparar contra la lista completa
+            await self.resync_file_list()
+
+    def apply_file_created(self, path):
+        if path not in self.file_set:
+            self.file_set.add(path)
+            self.queue_file_change("created", path)
+
+    async def apply_file_deleted(self, path):
+        if path in self.file_set:
+            self.file_set.remove(path)
+            self.queue_file_change("deleted", path)
+        else:
+            logging.warning(f"Se eliminó un archivo desconocido ({path}); resincronizando la lista.")
+            await self.resync_file_list()
+
+    async def resync_file_list(self):
+        # Obtener la nueva lista de archivos
+        new_file_list = await self.get_file_list()
+        if new_file_list is None:
+            logging.warning("No se pudo obtener la lista de archivos.")
+            return
 
-    while True:
+        new_file_set = set(new_file_list)
+        for filename in new_file_set - self.file_set:
+            self.queue_file_change("created", filename)
+        for filename in self.file_set - new_file_set:
+            self.queue_file_change("deleted", filename)
+        self.file_set = new_file_set
+
+    def queue_file_change(self, kind, filename):
+        """
+        Acumula el cambio para anunciarlo junto con los demás del mismo lote.
+        """
+        self.pending_file_changes[kind].append(filename)
+        self.last_file_change = time.time()
+        if self.file_batch_task is None or self.file_batch_task.done():
+            self.file_batch_task = asyncio.create_task(self.flush_file_changes())
+
+    async def flush_file_changes(self):
+        # Esperar a que pase FILE_BATCH_WINDOW sin cambios nuevos
+        while time.time() - self.last_file_change < FILE_BATCH_WINDOW:
+            await asyncio.sleep(FILE_BATCH_WINDOW - (time.time() - self.last_file_change))
+
+        created = self.pending_file_changes["created"]
+        deleted = self.pending_file_changes["deleted"]
+        self.pending_file_changes = {"created": [], "deleted": []}
+
+        if len(created) == 1:
+            file_no_ext = created[0].replace(".gcode", "")
+            self.add_notification(f"Se ha agregado un nuevo archivo a mainsail: {file_no_ext}", "file")
+        elif created:
+            self.add_notification(f"Se han agregado {len(created)} archivos nuevos a mainsail.", "file")
+
+        if len(deleted) == 1:
+            file_no_ext = deleted[0].replace(".gcode", "")
+            self.add_notification(f"Se ha eliminado un archivo de mainsail: {file_no_ext}", "file")
+        elif deleted:
+            self.add_notification(f"Se han eliminado {len(deleted)} archivos de mainsail.", "file")
+
+    # Conexiones WebSocket
+
+    async def connect_websocket(self):
+        backoff = Backoff(initial_delay=RECONNECT_INITIAL_DELAY, max_delay=RECONNECT_MAX_DELAY)
+        first_attempt = True
+        while True:
+            if not first_attempt:
+                RECONNECTS_TOTAL.inc(connection="moonraker")
+            first_attempt = False
+            try:
+                async with websockets.connect(MOONRAKER_WS_URL) as ws:
+                    self.klipper_ws = ws
+                    backoff.connected()
+                    await self.on_open(ws)
+                    async for message in ws:
+                        if self.recorder:
+                            self.recorder.record_frame(message)
+                        await self.on_message(message)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logging.error(f"Error en WebSocket: {e}")
+            finally:
+                self.klipper_ws = None
+                if self.recorder:
+                    self.recorder.flush()
+            delay = backoff.next_delay()
+            logging.warning(f"Conexión WebSocket cerrada. Reintentando en {delay:.1f} segundos...")
+            await asyncio.sleep(delay)
+
+    async def on_open(self, ws):
+        logging.info("Conexión WebSocket abierta")
+        await self.subscribe(ws)
+
+    async def subscribe(self, ws):
+        if ws is None:
+            return
+        # Suscribirse a los objetos necesarios y recuperar el estado actual
+        self.request_counter += 1
+        self.subscribe_id = self.request_counter
+        subscribe_message = {
+            "jsonrpc": "2.0",
+            "method": "printer.objects.subscribe",
+            "params": {
+                "objects": self.rules.subscription(SUBSCRIBED_OBJECTS),
+                "retrieve_objects": True
+            },
+            "id": self.subscribe_id
+        }
         try:
-            server_ws = websocket.WebSocketApp(
-                SERVER_WS_URL,
-                on_open=on_server_open,
-                on_message=on_server_message,
-                on_error=on_server_error,
-                on_close=on_server_close
-            )
-            server_ws.run_forever()
+            await ws.send(json.dumps(subscribe_message))
         except Exception as e:
-            logging.error(f"Excepción en connect_to_server_ws: {e}")
-        logging.warning("Conexión WebSocket con el servidor cerrada. Reintentando en 5 segundos...")
-        time.sleep(5)
+            logging.error(f"Error al enviar mensaje de suscripción: {e}")
 
-def on_server_open(ws):
-    logging.info("Conexión WebSocket con el servidor establecida")
-    # Enviar un mensaje inicial si es necesario
-
-def on_server_message(ws, message):
-    # Manejar mensajes entrantes del servidor si es necesario
-    logging.info(f"Mensaje recibido del servidor: {message}")
+    # Funciones para manejar el WebSocket con el servidor
+    async def connect_to_server_ws(self):
+        backoff = Backoff(initial_delay=RECONNECT_INITIAL_DELAY, max_delay=RECONNECT_MAX_DELAY)
+        first_attempt = True
+        while True:
+            if not first_attempt:
+                RECONNECTS_TOTAL.inc(connection="server")
+            first_attempt = False
+            try:
+                async with websockets.connect(SERVER_WS_URL) as ws:
+                    self.server_ws = ws
+                    backoff.connected()
+                    self.on_server_open()
+                    async for message in ws:
+                        self.on_server_message(message)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logging.error(f"Error en WebSocket con el servidor: {e}")
+            finally:
+                self.server_ws = None
+                # Los acuses pendientes ya no llegarán por esta conexión
+                self.release_in_flight()
+            delay = backoff.next_delay()
+            logging.warning(f"Conexión WebSocket con el servidor cerrada. Reintentando en {delay:.1f} segundos...")
+            await asyncio.sleep(delay)
+
+    def on_server_open(self):
+        logging.info("Conexión WebSocket con el servidor establecida")
+        # Reenviar lo que quedó sin confirmar en la conexión anterior
+        self.release_in_flight()
+        self.outbox.requeue_sent()
+        self.outbox_ready.set()
+
+    def on_server_message(self, message):
+        # Manejar los acuses de recibo del servidor
+        try:
+            data = json.loads(message)
+        except ValueError:
+            logging.info(f"Mensaje recibido del servidor: {message}")
+            return
 
-def on_server_error(ws, error):
-    logging.error(f"Error en WebSocket con el servidor: {error}")
+        ack = data.get("ack") if isinstance(data, dict) else None
+        if ack is None:
+            logging.info(f"Mensaje recibido del servidor: {message}")
+            return
 
-def on_server_close(ws, close_status_code, close_msg):
-    logging.warning("Conexión WebSocket con el servidor cerrada")
+        notification_id = data.get("id")
+        sent_at = self.in_flight.get(notification_id)
+        elapsed = f"{time.time() - sent_at:.2f}s" if sent_at else "desconocido"
+        logging.info(f"Acuse '{ack}' del servidor para la notificación {notification_id} (tiempo: {elapsed})")
+        if sent_at:
+            ACK_SECONDS.observe(time.time() - sent_at, ack=ack)
+        if ack == "processed":
+            # El servidor ya tiene la notificación: quitarla de la bandeja de salida
+            self.outbox.ack(notification_id)
+        elif ack == "played":
+            self.release_in_flight(notification_id)
 
-if __name__ == "__main__":
-    initialize_file_list()
-    check_initial_restart()
 
-    # Iniciar el procesamiento de notificaciones
-    notification_thread = threading.Thread(target=process_notifications, daemon=True)
-    notification_thread.start()
+def clear_running_flag():
+    """
+    Limpia el RUNNING_FLAG al finalizar el script.
+    """
+    if os.path.exists(RUNNING_FLAG):
+        os.remove(RUNNING_FLAG)
 
-    # Iniciar la conexión WebSocket con el servidor
-    server_ws_thread = threading.Thread(target=connect_to_server_ws, daemon=True)
-    server_ws_thread.start()
+def restart_service():
+    """
+    Reinicia el servicio event_listener.service utilizando systemctl.
+    """
+    try:
+        subprocess.run(['sudo', 'systemctl', 'restart', 'event_listener.service'], check=True)
+        logging.info("Servicio event_listener.service reiniciado exitosamente.")
+    except subprocess.CalledProcessError as e:
+        logging.error(f"Error al reiniciar el servicio: {e}")
 
-    # Iniciar la conexión WebSocket con Klipper
-    websocket_thread = threading.Thread(target=connect_websocket, daemon=True)
-    websocket_thread.start()
+def handle_sigterm(signum, frame):
+    """
+    systemd detiene el servicio con SIGTERM: se trata como Ctrl+C para que run()
+    cierre el seguimiento del log y la grabación antes de salir.
+    """
+    raise KeyboardInterrupt
 
-    # Mantener el hilo principal vivo
+if __name__ == "__main__":
+    create_lock()
+    signal.signal(signal.SIGTERM, handle_sigterm)
+    listener = EventListener()
     try:
-        while True:
-            time.sleep(1)
+        asyncio.run(listener.run())
     except KeyboardInterrupt:
         logging.info("Conexión cerrada por el usuario")
         # Limpiar el RUNNING_FLAG
@@ -0,0 +1,324 @@
+# klippy_stats.py
+#
+# Lectura incremental de las líneas 'Stats' de klippy.log. Klipper escribe una por
+# segundo con la carga de cada MCU, los bytes retransmitidos, la carga del host, la
+# memoria disponible y el PWM de los calentadores, por ejemplo:
+#
+#   Stats 1234.5: gcodein=0  mcu: mcu_awake=0.005 mcu_task_avg=0.000010 ... bytes_write=1234
+#   bytes_retransmit=0 ... heater_bed: target=60 temp=59.8 pwm=0.412 sysload=0.35
+#   cputime=120.5 memavail=356000 print_time=10.0 buffer_time=1.2 ...
+
+import os
+import math
+import mmap
+import time
+import logging
+from array import array
+
+DEFAULT_KLIPPY_LOG = "/home/pi/printer_data/logs/klippy.log"
+
+STATS_MARKER = b"\nStats "
+
+# Campos globales que Klipper escribe después de alguna sección pero no le pertenecen
+HOST_KEYS = {"gcodein", "sysload", "cputime", "memavail", "print_time", "buffer_time", "print_stall"}
+
+# Muestras que se conservan por columna (a una por segundo, una hora)
+DEFAULT_CAPACITY = 3600
+# En la primera lectura solo se procesa el final del log (puede pesar cientos de MB)
+INITIAL_TAIL_BYTES = 8 * 1024 * 1024
+# Ventana de los agregados móviles (en segundos)
+DEFAULT_WINDOW = 300
+
+# Umbrales de alerta: (agregado, límite, sentido, mensaje)
+DEFAULT_THRESHOLDS = [
+    ("mcu_awake", float(os.getenv("STATS_MCU_AWAKE_MAX", 0.5)), "above",
+     "La MCU {name} está muy cargada: activa el {value:.0%} del tiempo."),
+    ("retransmit_ratio", float(os.getenv("STATS_RETRANSMIT_MAX", 0.01)), "above",
+     "La comunicación con la MCU {name} está retransmitiendo el {value:.1%} de los datos."),
+    ("sysload", float(os.getenv("STATS_SYSLOAD_MAX", 3.0)), "above",
+     "La carga del host es alta: {value:.1f}."),
+    ("memavail_mb", float(os.getenv("STATS_MEMAVAIL_MIN_MB", 50)), "below",
+     "Queda poca memoria disponible en el host: {value:.0f} MB."),
+]
+# Una alerta se rearma cuando el valor vuelve a este margen del umbral
+HYSTERESIS = 0.8
+
+
+def parse_stats_line(line):
+    """
+    Convierte una línea 'Stats' (bytes) en (eventtime, {"seccion.campo": valor}).
+    Retorna None si la línea no tiene el formato esperado.
+    """
+    parts = line.split()
+    if len(parts) < 2 or parts[0] != b"Stats":
+        return None
+    try:
+        eventtime = float(parts[1].rstrip(b":"))
+    except ValueError:
+        return None
+    values = {}
+    section = None
+    for token in parts[2:]:
+        if token.endswith(b":"):
+            section = token[:-1].decode("ascii", errors="replace")
+            continue
+        key, separator, value = token.partition(b"=")
+        if not separator:
+            continue
+        try:
+            number = float(value)
+        except ValueError:
+            continue
+        name = key.decode("ascii", errors="replace")
+        if section is None or name in HOST_KEYS:
+            values[name] = number
+        else:
+            values[f"{section}.{name}"] = number
+    return eventtime, values
+
+
+class StatsColumns:
+    """
+    Almacenamiento columnar en anillo: un array('d') de capacidad fija por campo, más
+    la columna de tiempos. Los campos que faltan en una muestra quedan como NaN.
+    """
+
+    def __init__(self, capacity=DEFAULT_CAPACITY):
+        self.capacity = capacity
+        self.times = array("d", [math.nan]) * capacity
+        self.columns = {}
+        self.head = 0  # Próxima posición a escribir
+        self.count = 0
+
+    def append(self, eventtime, values):
+        index = self.head
+        self.times[index] = eventtime
+        for key, column in self.columns.items():
+            column[index] = values.get(key, math.nan)
+        for key in values.keys() - self.columns.keys():
+            column = array("d", [math.nan]) * self.capacity
+            column[index] = values[key]
+            self.columns[key] = column
+        self.head = (index + 1) % self.capacity
+        self.count = min(self.count + 1, self.capacity)
+
+    def clear(self):
+        self.columns = {}
+        self.head = 0
+        self.count = 0
+
+    def last_time(self):
+        if not self.count:
+            return None
+        return self.times[(self.head - 1) % self.capacity]
+
+    def window(self, key, seconds):
+        """
+        Devuelve [(tiempo, valor)] del campo dentro de los últimos seconds, en orden.
+        """
+        column = self.columns.get(key)
+        if column is None or not self.count:
+            return []
+        end = self.last_time()
+        samples = []
+        for offset in range(1, self.count + 1):
+            index = (self.head - offset) % self.capacity
+            eventtime = self.times[index]
+            if end - eventtime > seconds:
+                break
+            value = column[index]
+            if not math.isnan(value):
+                samples.append((eventtime, value))
+        samples.reverse()
+        return samples
+
+    def sections(self, field):
+        """
+        Nombres de las secciones que tienen el campo (p. ej. las MCU con 'mcu_awake').
+        """
+        suffix = "." + field
+        return sorted(key[:-len(suffix)] for key in self.columns if key.endswith(suffix))
+
+
+def _mean(samples):
+    return sum(value for _, value in samples) / len(samples) if samples else None
+
+
+def _increase(samples):
+    """
+    Aumento de un contador en la ventana; un valor menor que el anterior indica que
+    el contador se reinició (p. ej. al reconectar la MCU).
+    """
+    total = 0.0
+    for (_, previous), (_, value) in zip(samples, samples[1:]):
+        total += value - previous if value >= previous else value
+    return total
+
+
+class KlippyStats:
+    """
+    Parser incremental de las líneas 'Stats' de klippy.log usando mmap.
+
+    Cada update() mapea solo la parte nueva del archivo, busca las líneas 'Stats' con
+    mmap.find (sin recorrer en Python las demás líneas) y guarda las muestras en
+    columnas de tamaño fijo. Detecta la rotación y el truncado del log.
+    """
+
+    def __init__(self, path=DEFAULT_KLIPPY_LOG, capacity=DEFAULT_CAPACITY, initial_tail_bytes=INITIAL_TAIL_BYTES,
+                 thresholds=None):
+        self.path = path
+        self.initial_tail_bytes = initial_tail_bytes
+        self.store = StatsColumns(capacity)
+        self.thresholds = DEFAULT_THRESHOLDS if thresholds is None else thresholds
+        self.inode = None
+        self.offset = None  # Posición de un salto de línea ya procesado (None: primera lectura)
+        self.alerts = set()  # Umbrales superados que ya se anunciaron
+
+    def update(self):
+        """
+        Procesa las líneas nuevas del log y devuelve cuántas muestras se agregaron.
+        """
+        try:
+            with open(self.path, "rb") as f:
+                stat = os.fstat(f.fileno())
+                if stat.st_ino != self.inode or (self.offset is not None and stat.st_size < self.offset):
+                    if self.inode is not None:
+                        logging.info(f"{self.path} fue rotado o truncado; leyendo desde el principio.")
+                        self.offset = 0
+                    self.inode = stat.st_ino
+                if self.offset is None:
+                    self.offset = max(0, stat.st_size - self.initial_tail_bytes)
+                if stat.st_size <= self.offset + 1:
+                    return 0
+                return self._scan(f.fileno(), stat.st_size)
+        except FileNotFoundError:
+            return 0
+        except OSError as e:
+            logging.error(f"Error al leer {self.path}: {e}")
+            return 0
+
+    def _scan(self, fd, size):
+        # mmap exige que el desplazamiento sea múltiplo de ALLOCATIONGRANULARITY
+        base = self.offset - self.offset % mmap.ALLOCATIONGRANULARITY
+        added = 0
+        with mmap.mmap(fd, size - base, access=mmap.ACCESS_READ, offset=base) as mm:
+            position = self.offset - base
+            # Una línea 'Stats' al comienzo del archivo no tiene un salto de línea antes
+            if self.offset == 0 and mm[:len(STATS_MARKER) - 1] == STATS_MARKER[1:]:
+                end = mm.find(b"\n")
+                if end >= 0:
+                    added += self._ingest(mm[:end])
+                    position = end
+            while True:
+                start = mm.find(STATS_MARKER, position)
+                if start < 0:
+                    break
+                end = mm.find(b"\n", start + 1)
+                if end < 0:
+                    break  # Línea incompleta: se lee en la próxima actualización
+                added += self._ingest(mm[start + 1:end])
+                position = end
+            # Avanzar hasta el último salto de línea completo para no volver a recorrerlo
+            last_newline = mm.rfind(b"\n", position)
+            if start >= 0 and end < 0:
+                last_newline = start
+            self.offset = base + max(position, last_newline)
+        return added
+
+    def _ingest(self, line):
+        parsed = parse_stats_line(line)
+        if parsed is None:
+            return 0
+        eventtime, values = parsed
+        last = self.store.last_time()
+        if last is not None and eventtime < last:
+            # Klipper se reinició con otro reloj: las ventanas no se pueden mezclar
+            self.store.clear()
+        self.store.append(eventtime, values)
+        return 1
+
+    def aggregates(self, window=DEFAULT_WINDOW):
+        """
+        Agregados móviles de la última ventana: por MCU, carga (mcu_awake) y proporción de
+        bytes retransmitidos; del host, carga, uso de CPU de Klipper y memoria disponible;
+        y el PWM medio de cada calentador.
+        """
+        store = self.store
+        result = {"samples": len(store.window("sysload", window)), "mcus": {}, "heaters": {}, "host": {}}
+        for name in store.sections("mcu_awake"):
+            mcu = {"mcu_awake": _mean(store.window(f"{name}.mcu_awake", window))}
+            written = _increase(store.window(f"{name}.bytes_write", window))
+            retransmitted = _increase(store.window(f"{name}.bytes_retransmit", window))
+            mcu["retransmit_ratio"] = retransmitted / written if written else 0.0
+            mcu["retransmit_bytes"] = retransmitted
+            result["mcus"][name] = mcu
+        for name in store.sections("pwm"):
+            result["heaters"][name] = {"pwm": _mean(store.window(f"{name}.pwm", window))}
+
+        sysload = store.window("sysload", window)
+        cputime = store.window("cputime", window)
+        memavail = store.window("memavail", window)
+        host = result["host"]
+        if sysload:
+            host["sysload"] = _mean(sysload)
+            host["sysload_max"] = max(value for _, value in sysload)
+        if len(cputime) > 1 and cputime[-1][0] > cputime[0][0]:
+            host["klippy_cpu"] = (cputime[-1][1] - cputime[0][1]) / (cputime[-1][0] - cputime[0][0])
+        if memavail:
+            host["memavail_mb"] = memavail[-1][1] / 1024
+        return result
+
+    def check_thresholds(self, window=60):
+        """
+        Devuelve los mensajes de los umbrales que se cruzaron desde la última llamada.
+        Cada alerta se anuncia una vez y se rearma cuando el valor vuelve a la normalidad.
+        """
+        aggregates = self.aggregates(window)
+        values = []
+        for name, mcu in aggregates["mcus"].items():
+            values.append(("mcu_awake", name, mcu["mcu_awake"]))
+            values.append(("retransmit_ratio", name, mcu["retransmit_ratio"]))
+        for key in ("sysload", "memavail_mb"):
+            values.append((key, "host", aggregates["host"].get(key)))
+
+        messages = []
+        for key, name, value in values:
+            if value is None:
+                continue
+            for threshold_key, limit, direction, template in self.thresholds:
+                if threshold_key != key:
+                    continue
+                alert = (key, name)
+                crossed = value > limit if direction == "above" else value < limit
+                recovered = value < limit * HYSTERESIS if direction == "above" else value > limit / HYSTERESIS
+                if crossed and alert not in self.alerts:
+                    self.alerts.add(alert)
+                    messages.append(template.format(name=name, value=value))
+                elif recovered:
+                    self.alerts.discard(alert)
+        return messages
+
+    def describe(self, window=DEFAULT_WINDOW):
+        """
+        Resumen en texto del estado del host y las MCU, para el asistente.
+        """
+        self.update()
+        aggregates = self.aggregates(window)
+        if not aggregates["samples"] and not aggregates["mcus"]:
+            return "No hay estadísticas recientes de Klipper en el log."
+        lines = [f"Estadísticas de los últimos {window // 60} minutos:"]
+        host = aggregates["host"]
+        if "sysload" in host:
+            lines.append(f"Host: carga media {host['sysload']:.2f} (máxima {host['sysload_max']:.2f})")
+        if "klippy_cpu" in host:
+            lines.append(f"Uso de CPU de Klipper: {host['klippy_cpu']:.0%}")
+        if "memavail_mb" in host:
+            lines.append(f"Memoria disponible: {host['memavail_mb']:.0f} MB")
+        for name, mcu in aggregates["mcus"].items():
+            awake = f"{mcu['mcu_awake']:.1%}" if mcu["mcu_awake"] is not None else "desconocida"
+            lines.append(f"MCU {name}: activa {awake} del tiempo, retransmisión {mcu['retransmit_ratio']:.2%} "
+                         f"({mcu['retransmit_bytes']:.0f} bytes)")
+        for name, heater in aggregates["heaters"].items():
+            if heater["pwm"] is not None:
+                lines.append(f"Calentador {name}: PWM medio {heater['pwm']:.0%}")
+        return "\n".join(lines)
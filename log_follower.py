@@ -0,0 +1,193 @@
+# log_follower.py
+
+import os
+import re
+import errno
+import ctypes
+import struct
+import asyncio
+import logging
+
+# Eventos de inotify (ver inotify(7))
+IN_MODIFY = 0x00000002
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_Q_OVERFLOW = 0x00004000
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+
+WATCH_MASK = IN_MODIFY | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE
+EVENT_HEADER = struct.Struct("iIII")
+
+READ_CHUNK = 64 * 1024
+POLL_INTERVAL = 1.0  # Segundos entre lecturas si inotify no está disponible
+
+
+def _load_inotify():
+    try:
+        libc = ctypes.CDLL(None, use_errno=True)
+        libc.inotify_init1.argtypes = [ctypes.c_int]
+        libc.inotify_add_watch.argtypes = [ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32]
+        return libc
+    except (OSError, AttributeError):
+        return None
+
+
+class LogFollower:
+    """
+    Sigue un archivo de log dentro del bucle de asyncio, como 'tail -F' pero sin procesos.
+
+    Se vigila el directorio con inotify (así se detectan tanto las escrituras como la
+    rotación del archivo) y se lee solo lo nuevo desde el último offset. Cada línea
+    completa se compara con los patrones precompilados; un patrón combinado descarta
+    de una vez los bloques sin coincidencias, que son la gran mayoría.
+    """
+
+    def __init__(self, path, patterns, on_match, flags=re.IGNORECASE):
+        """
+        :param path: Archivo a seguir.
+        :param patterns: Diccionario nombre -> expresión regular.
+        :param on_match: Función llamada como on_match(nombre, match, línea).
+        """
+        self.path = path
+        self.directory = os.path.dirname(os.path.abspath(path)) or "."
+        self.filename = os.path.basename(path).encode()
+        self.patterns = [(name, re.compile(pattern, flags)) for name, pattern in patterns.items()]
+        self.combined = re.compile("|".join(f"(?:{regex.pattern})" for _, regex in self.patterns), flags)
+        self.on_match = on_match
+
+        self.file = None
+        self.inode = None
+        self.offset = 0
+        self.partial = b""
+        self.loop = None
+        self.inotify_fd = None
+        self.poll_task = None
+
+    def start(self, loop=None):
+        self.loop = loop or asyncio.get_running_loop()
+        # Empezar desde el final: solo interesan las líneas nuevas
+        self._open(from_end=True)
+        libc = _load_inotify()
+        if libc is not None:
+            fd = libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+            if fd >= 0 and libc.inotify_add_watch(fd, self.directory.encode(), WATCH_MASK) >= 0:
+                self.inotify_fd = fd
+                self.loop.add_reader(fd, self._on_inotify)
+                logging.info(f"Siguiendo {self.path} con inotify.")
+                return
+            if fd >= 0:
+                os.close(fd)
+            logging.warning(f"inotify no disponible para {self.directory} ({os.strerror(ctypes.get_errno())}); leyendo por intervalos.")
+        self.poll_task = self.loop.create_task(self._poll())
+
+    def stop(self):
+        if self.inotify_fd is not None:
+            self.loop.remove_reader(self.inotify_fd)
+            os.close(self.inotify_fd)
+            self.inotify_fd = None
+        if self.poll_task is not None:
+            self.poll_task.cancel()
+            self.poll_task = None
+        self._close()
+
+    def _open(self, from_end=False):
+        try:
+            self.file = open(self.path, "rb")
+        except OSError as e:
+            if e.errno != errno.ENOENT:
+                logging.error(f"No se pudo abrir {self.path}: {e}")
+            self.file = None
+            return
+        stat = os.fstat(self.file.fileno())
+        self.inode = stat.st_ino
+        self.offset = stat.st_size if from_end else 0
+        self.partial = b""
+
+    def _close(self):
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+            self.inode = None
+
+    def _on_inotify(self):
+        try:
+            data = os.read(self.inotify_fd, READ_CHUNK)
+        except BlockingIOError:
+            return
+        relevant = False
+        rotated = False
+        position = 0
+        while position + EVENT_HEADER.size <= len(data):
+            _, mask, _, length = EVENT_HEADER.unpack_from(data, position)
+            name = data[position + EVENT_HEADER.size:position + EVENT_HEADER.size + length].rstrip(b"\0")
+            position += EVENT_HEADER.size + length
+            if mask & IN_Q_OVERFLOW:
+                relevant = True
+            elif name == self.filename:
+                relevant = True
+                if mask & (IN_CREATE | IN_MOVED_TO | IN_MOVED_FROM | IN_DELETE):
+                    rotated = True
+        if relevant:
+            self._check(rotated)
+
+    async def _poll(self):
+        while True:
+            await asyncio.sleep(POLL_INTERVAL)
+            self._check(rotated=False)
+
+    def _check(self, rotated):
+        # Terminar de leer el archivo abierto antes de cambiar al nuevo
+        if self.file is not None:
+            self._read_new()
+        try:
+            current_inode = os.stat(self.path).st_ino
+        except OSError:
+            current_inode = None
+        if self.file is None or rotated or current_inode != self.inode:
+            if current_inode is not None and current_inode != self.inode:
+                self._close()
+                self._open()
+                logging.info(f"{self.path} fue rotado; siguiendo el archivo nuevo.")
+                self._read_new()
+            elif current_inode is None:
+                self._close()
+
+    def _read_new(self):
+        size = os.fstat(self.file.fileno()).st_size
+        if size < self.offset:
+            # El archivo se truncó: volver al principio
+            self.offset = 0
+            self.partial = b""
+        if size == self.offset:
+            return
+        self.file.seek(self.offset)
+        while True:
+            chunk = self.file.read(READ_CHUNK)
+            if not chunk:
+                break
+            self.offset += len(chunk)
+            self._process(chunk)
+
+    def _process(self, chunk):
+        data = self.partial + chunk
+        end = data.rfind(b"\n")
+        if end < 0:
+            self.partial = data
+            return
+        self.partial = data[end + 1:]
+        text = data[:end].decode("utf-8", errors="replace")
+        # La mayoría de los bloques (líneas de Stats) no tienen coincidencias
+        if not self.combined.search(text):
+            return
+        for line in text.split("\n"):
+            for name, regex in self.patterns:
+                match = regex.search(line)
+                if match:
+                    try:
+                        self.on_match(name, match, line)
+                    except Exception as e:
+                        logging.error(f"Error al procesar la línea del log '{name}': {e}")
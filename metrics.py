@@ -0,0 +1,224 @@
+# metrics.py
+#
+# Métricas en memoria con salida en el formato de texto de Prometheus.
+# Las usan server.py, controlprint.py y tts.py (y el listener) para medir cada etapa.
+
+import time
+import threading
+import contextvars
+from contextlib import contextmanager
+
+# Límites de los buckets de los histogramas de latencia (en segundos)
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+# Tiempos por etapa de la solicitud en curso (ver request_timings)
+_current_timings = contextvars.ContextVar("current_timings", default=None)
+
+
+def _format_labels(names, values, extra=None):
+    pairs = list(zip(names, values))
+    if extra:
+        pairs.append(extra)
+    if not pairs:
+        return ""
+    escaped = (str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for _, v in pairs)
+    return "{" + ",".join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + "}"
+
+
+def _format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Metric:
+    """
+    Base de las métricas: un valor por combinación de etiquetas, protegido por un lock
+    porque se actualizan desde el bucle de asyncio y desde hilos de reproducción.
+    """
+
+    type_name = "untyped"
+
+    def __init__(self, name, help_text, labels=(), registry=None):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = tuple(labels)
+        self.lock = threading.Lock()
+        self.values = {}
+        (registry or REGISTRY).register(self)
+
+    def _key(self, labels):
+        if set(labels) != set(self.label_names):
+            raise ValueError(f"Métrica '{self.name}': se esperaban las etiquetas {self.label_names}")
+        return tuple(str(labels[name]) for name in self.label_names)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} {self.type_name}"]
+        with self.lock:
+            items = sorted(self.values.items())
+        for key, value in items:
+            lines.extend(self._render_value(key, value))
+        return lines
+
+    def _render_value(self, key, value):
+        return [f"{self.name}{_format_labels(self.label_names, key)} {_format_value(value)}"]
+
+
+class Counter(Metric):
+    type_name = "counter"
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    def get(self, **labels):
+        with self.lock:
+            return self.values.get(self._key(labels), 0)
+
+
+class Gauge(Metric):
+    type_name = "gauge"
+
+    def __init__(self, name, help_text, labels=(), registry=None, function=None):
+        super().__init__(name, help_text, labels, registry)
+        # Si se indica, el valor se lee al exportar (p. ej. el tamaño de una cola)
+        self.function = function
+
+    def set(self, value, **labels):
+        with self.lock:
+            self.values[self._key(labels)] = value
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+    def get(self, **labels):
+        if self.function is not None:
+            return self.function()
+        with self.lock:
+            return self.values.get(self._key(labels), 0)
+
+    def render(self):
+        if self.function is None:
+            return super().render()
+        return [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} {self.type_name}",
+                f"{self.name} {_format_value(self.function())}"]
+
+
+class Histogram(Metric):
+    type_name = "histogram"
+
+    def __init__(self, name, help_text, labels=(), registry=None, buckets=DEFAULT_BUCKETS):
+        # Antes de registrarse: el registro compara los buckets de las métricas repetidas
+        self.buckets = tuple(sorted(buckets)) + (float("inf"),)
+        super().__init__(name, help_text, labels, registry)
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self.lock:
+            entry = self.values.get(key)
+            if entry is None:
+                entry = self.values[key] = {"counts": [0] * len(self.buckets), "sum": 0.0, "count": 0}
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    entry["counts"][i] += 1
+                    break
+            entry["sum"] += value
+            entry["count"] += 1
+
+    @contextmanager
+    def time(self, timing=None, **labels):
+        """
+        Mide la duración del bloque y la registra; si hay una solicitud en curso con
+        request_timings(), también la suma a sus tiempos por etapa con la clave timing
+        (por defecto, los valores de las etiquetas).
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            self.observe(elapsed, **labels)
+            record_timing(timing or "_".join(str(v) for v in labels.values()) or self.name, elapsed)
+
+    def get(self, **labels):
+        with self.lock:
+            entry = self.values.get(self._key(labels))
+            return dict(entry, counts=list(entry["counts"])) if entry else None
+
+    def _render_value(self, key, entry):
+        lines = []
+        cumulative = 0
+        for bound, count in zip(self.buckets, entry["counts"]):
+            cumulative += count
+            labels = _format_labels(self.label_names, key, ("le", _format_value(bound)))
+            lines.append(f"{self.name}_bucket{labels} {cumulative}")
+        labels = _format_labels(self.label_names, key)
+        lines.append(f"{self.name}_sum{labels} {_format_value(entry['sum'])}")
+        lines.append(f"{self.name}_count{labels} {entry['count']}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.metrics = {}
+
+    def register(self, metric):
+        """
+        Registra la métrica. Si ya hay una del mismo nombre, tipo y etiquetas (el módulo
+        que la define se importó dos veces, como hace uvicorn con reload=True), la nueva
+        comparte sus valores y la reemplaza al exportar: el último módulo importado es el
+        que atiende, y una Gauge con function debe leer su estado.
+        """
+        with self.lock:
+            existing = self.metrics.get(metric.name)
+            if existing is not None:
+                if (type(existing) is not type(metric) or existing.label_names != metric.label_names
+                        or getattr(existing, "buckets", None) != getattr(metric, "buckets", None)):
+                    raise ValueError(f"La métrica '{metric.name}' ya está registrada con otra definición")
+                metric.lock = existing.lock
+                metric.values = existing.values
+            self.metrics[metric.name] = metric
+
+    def render(self):
+        """
+        Devuelve todas las métricas en el formato de texto de Prometheus.
+        """
+        with self.lock:
+            metrics = list(self.metrics.values())
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+# Tipo de contenido del formato de texto de Prometheus
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+@contextmanager
+def request_timings():
+    """
+    Acumula los tiempos por etapa de una solicitud. Las etapas medidas con
+    Histogram.time() dentro del bloque se suman al diccionario devuelto (en ms).
+    """
+    timings = {}
+    token = _current_timings.set(timings)
+    try:
+        yield timings
+    finally:
+        _current_timings.reset(token)
+
+
+def record_timing(stage, elapsed):
+    timings = _current_timings.get()
+    if timings is not None:
+        timings[stage] = round(timings.get(stage, 0) + elapsed * 1000, 1)
@@ -0,0 +1,343 @@
+# moonraker_replay.py
+#
+# Grabación y reproducción de sesiones de Moonraker.
+#
+# Grabar: iniciar event_listener.py con MOONRAKER_RECORD_PATH=/ruta/sesion.jsonl.gz
+# Reproducir como un Moonraker falso:
+#     python moonraker_replay.py serve sesion.jsonl.gz --speed 10 --port 7125
+# Reproducir contra el listener y reportar notificaciones y latencias:
+#     python moonraker_replay.py run sesion.jsonl.gz --speed 10
+
+import os
+import sys
+import gzip
+import zlib
+import json
+import time
+import asyncio
+import argparse
+import tempfile
+import statistics
+from collections import Counter
+
+
+# El grabador vuelca lo acumulado al llegar a esta cantidad de entradas o de segundos
+RECORD_FLUSH_ENTRIES = 200
+RECORD_FLUSH_SECONDS = 5
+
+
+class SessionRecorder:
+    """
+    Graba los frames crudos del WebSocket de Moonraker y las respuestas HTTP que
+    recibe el listener, con su marca de tiempo relativa, en JSON lines comprimido.
+
+    Cada volcado se escribe como un miembro gzip completo (gzip admite varios
+    concatenados), así la grabación se puede leer aunque el proceso termine sin
+    llamar a close(); como mucho se pierde lo acumulado desde el último volcado.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.start = time.monotonic()
+        self.last_flush = self.start
+        self.pending = []
+        self.file = open(path, 'ab')
+
+    def _write(self, entry):
+        now = time.monotonic()
+        entry["t"] = round(now - self.start, 4)
+        self.pending.append(json.dumps(entry, separators=(',', ':'), ensure_ascii=False) + "\n")
+        if len(self.pending) >= RECORD_FLUSH_ENTRIES or now - self.last_flush >= RECORD_FLUSH_SECONDS:
+            self.flush()
+
+    def record_frame(self, frame):
+        self._write({"ws": frame})
+
+    def record_http(self, path, body):
+        self._write({"http": path, "body": body})
+
+    def flush(self):
+        self.last_flush = time.monotonic()
+        if not self.pending:
+            return
+        data = "".join(self.pending).encode('utf-8')
+        self.pending = []
+        self.file.write(gzip.compress(data))
+        self.file.flush()
+
+    def close(self):
+        if not self.file.closed:
+            self.flush()
+            self.file.close()
+
+
+def load_session(path):
+    """
+    Lee una sesión grabada y devuelve (frames, respuestas HTTP por ruta).
+    Si la grabación quedó cortada (el proceso terminó a mitad de un volcado), se
+    devuelve lo leído hasta la última línea completa.
+    """
+    frames = []
+    http = {}
+    with gzip.open(path, 'rt', encoding='utf-8') as f:
+        try:
+            for line in f:
+                if not line.endswith("\n"):
+                    break  # Última línea incompleta
+                if not line.strip():
+                    continue
+                entry = json.loads(line)
+                if "ws" in entry:
+                    frames.append((entry["t"], entry["ws"]))
+                elif "http" in entry:
+                    http.setdefault(entry["http"], []).append((entry["t"], entry["body"]))
+        except (EOFError, gzip.BadGzipFile, zlib.error):
+            print(f"La grabación {path} está cortada; se reproduce hasta la última línea completa.", file=sys.stderr)
+    return frames, http
+
+
+class FakeMoonraker:
+    """
+    Moonraker falso que reproduce una sesión grabada a velocidad 1x o N veces más rápido.
+
+    Sirve /websocket y los endpoints HTTP que usa el listener. Las respuestas HTTP se
+    toman de la grabación (la última anterior al instante reproducido) o, si no hay,
+    se construyen a partir del estado acumulado de la reproducción. También expone /ws
+    como sustituto del servidor: acusa las notificaciones y guarda su hora de llegada.
+    """
+
+    def __init__(self, session_path, speed=1.0):
+        self.frames, self.http = load_session(session_path)
+        self.speed = speed
+        self.cursor = 0  # Siguiente frame a reproducir (compartido entre reconexiones)
+        self.replay_time = 0.0
+        self.status = {}
+        self.files = set()
+        self.finished = asyncio.Event()
+        self.frame_sent_at = []  # Instante real de envío de cada frame
+        self.notifications = []  # (instante de llegada, texto)
+        self.app = self.build_app()
+
+    def build_app(self):
+        from fastapi import FastAPI, WebSocket, WebSocketDisconnect, Request
+
+        app = FastAPI()
+
+        @app.websocket("/websocket")
+        async def moonraker_ws(websocket: WebSocket):
+            await websocket.accept()
+            stream_task = None
+            try:
+                while True:
+                    request = await websocket.receive_json()
+                    # Cada suscripción (inicial o tras notify_klippy_ready) recibe el estado acumulado
+                    self.consume_responses()
+                    await websocket.send_json({
+                        "jsonrpc": "2.0",
+                        "result": {"eventtime": self.replay_time, "status": self.status},
+                        "id": request.get("id")
+                    })
+                    if stream_task is None:
+                        stream_task = asyncio.create_task(self.stream(websocket))
+            except WebSocketDisconnect:
+                pass
+            finally:
+                if stream_task is not None:
+                    stream_task.cancel()
+
+        @app.websocket("/ws")
+        async def server_ws(websocket: WebSocket):
+            await websocket.accept()
+            try:
+                while True:
+                    data = await websocket.receive_json()
+                    self.notifications.append((time.monotonic(), data.get("text", "")))
+                    if data.get("id") is not None:
+                        await websocket.send_json({"ack": "processed", "id": data["id"]})
+                        await websocket.send_json({"ack": "played", "id": data["id"]})
+            except WebSocketDisconnect:
+                pass
+
+        @app.get("/server/files/list")
+        async def files_list(request: Request):
+            return self.http_response(request, {"result": [{"path": path} for path in sorted(self.files)]})
+
+        @app.get("/printer/objects/query")
+        async def objects_query(request: Request):
+            status = {name: self.status.get(name, {}) for name in request.query_params.keys()}
+            return self.http_response(request, {"result": {"eventtime": self.replay_time, "status": status}})
+
+        @app.get("/server/history/list")
+        async def history_list(request: Request):
+            return self.http_response(request, {"result": {"count": 0, "jobs": []}})
+
+        @app.get("/server/info")
+        async def server_info(request: Request):
+            klippy_state = self.status.get("klipper", {}).get("state", "ready")
+            return self.http_response(request, {"result": {"klippy_state": klippy_state}})
+
+        return app
+
+    def http_response(self, request, synthesized):
+        path = request.url.path + (f"?{request.url.query}" if request.url.query else "")
+        recorded = [body for t, body in self.http.get(path, []) if t <= self.replay_time]
+        return recorded[-1] if recorded else synthesized
+
+    @staticmethod
+    def is_response(frame):
+        return '"id"' in frame and '"method"' not in frame
+
+    def consume_responses(self):
+        """
+        Aplica al estado las respuestas grabadas que siguen en la sesión; el Moonraker falso
+        responde las suscripciones con el estado acumulado en lugar de reenviarlas.
+        """
+        while self.cursor < len(self.frames) and self.is_response(self.frames[self.cursor][1]):
+            self.replay_time = self.frames[self.cursor][0]
+            self.track(json.loads(self.frames[self.cursor][1]))
+            self.cursor += 1
+
+    async def stream(self, websocket):
+        previous_t = self.frames[self.cursor][0] if self.cursor < len(self.frames) else 0
+        while self.cursor < len(self.frames):
+            t, frame = self.frames[self.cursor]
+            await asyncio.sleep(max(0.0, (t - previous_t) / self.speed))
+            previous_t = t
+            if self.cursor >= len(self.frames) or self.frames[self.cursor][1] is not frame:
+                # Una suscripción consumió las respuestas pendientes mientras se esperaba
+                continue
+            self.cursor += 1
+            self.replay_time = t
+            data = json.loads(frame)
+            self.track(data)
+            if self.is_response(frame):
+                continue
+            self.frame_sent_at.append(time.monotonic())
+            await websocket.send_text(frame)
+        self.finished.set()
+
+    def track(self, data):
+        """
+        Acumula el estado reproducido para sintetizar las respuestas HTTP.
+        """
+        method = data.get("method")
+        params = data.get("params") or [{}]
+        if method == "notify_status_update":
+            for name, fields in params[0].items():
+                if isinstance(fields, dict):
+                    self.status.setdefault(name, {}).update(fields)
+        elif method == "notify_filelist_changed":
+            action = params[0].get("action")
+            item = params[0].get("item", {})
+            if action == "create_file":
+                self.files.add(item.get("path"))
+            elif action == "delete_file":
+                self.files.discard(item.get("path"))
+            elif action == "move_file":
+                self.files.discard(params[0].get("source_item", {}).get("path"))
+                self.files.add(item.get("path"))
+        elif "result" in data and isinstance(data["result"], dict) and "status" in data["result"]:
+            for name, fields in data["result"]["status"].items():
+                self.status.setdefault(name, {}).update(fields)
+
+    def report(self):
+        """
+        Cuenta las notificaciones recibidas y estima la latencia de punta a punta como
+        el tiempo entre el último frame enviado y la llegada de cada notificación.
+        """
+        latencies = []
+        for arrived, _ in self.notifications:
+            previous = [sent for sent in self.frame_sent_at if sent <= arrived]
+            if previous:
+                latencies.append(arrived - previous[-1])
+        report = {
+            "frames": len(self.frames),
+            "frames_sent": len(self.frame_sent_at),
+            "notifications": len(self.notifications),
+            "by_message": dict(Counter(text for _, text in self.notifications).most_common()),
+        }
+        if latencies:
+            latencies.sort()
+            report["latency_ms"] = {
+                "p50": round(statistics.median(latencies) * 1000, 1),
+                "p95": round(latencies[int(0.95 * (len(latencies) - 1))] * 1000, 1),
+                "max": round(latencies[-1] * 1000, 1),
+            }
+        return report
+
+
+async def serve(args):
+    import uvicorn
+
+    fake = FakeMoonraker(args.session, speed=args.speed)
+    server = uvicorn.Server(uvicorn.Config(fake.app, host=args.host, port=args.port, log_level="warning"))
+    await server.serve()
+
+
+async def run_listener(args):
+    import uvicorn
+
+    fake = FakeMoonraker(args.session, speed=args.speed)
+    server = uvicorn.Server(uvicorn.Config(fake.app, host="127.0.0.1", port=args.port, log_level="warning"))
+    server_task = asyncio.create_task(server.serve())
+    while not server.started:
+        await asyncio.sleep(0.05)
+
+    # Configurar el listener antes de importarlo para no tocar los archivos de producción
+    workdir = tempfile.mkdtemp(prefix="sfp_replay_")
+    os.environ.setdefault("API_KEY", "replay")
+    os.environ["EVENT_LISTENER_LOG"] = os.path.join(workdir, "event_listener.log")
+    os.environ["NOTIFY_OUTBOX_PATH"] = os.path.join(workdir, "outbox.db")
+    os.environ["EVENT_LISTENER_RUNNING_FLAG"] = os.path.join(workdir, "event_listener_running")
+    os.environ["MOONRAKER_URL"] = f"http://127.0.0.1:{args.port}"
+    os.environ["SERVER_WS_URL"] = args.server_url or f"ws://127.0.0.1:{args.port}/ws"
+    os.environ.setdefault("LISTENER_METRICS_PORT", "0")
+    os.environ.setdefault("KLIPPY_LOG", os.path.join(workdir, "klippy.log"))
+    os.environ["PRINT_HISTORY_PATH"] = os.path.join(workdir, "print_history.db")
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    import event_listener
+
+    listener = event_listener.EventListener()
+    listener_task = asyncio.create_task(listener.run())
+    started = time.monotonic()
+    await fake.finished.wait()
+    # Dar tiempo a que se vacíen los lotes y la bandeja de salida
+    await asyncio.sleep(args.drain)
+    elapsed = time.monotonic() - started
+
+    listener_task.cancel()
+    server.should_exit = True
+    await asyncio.gather(listener_task, server_task, return_exceptions=True)
+
+    report = fake.report()
+    report["elapsed_s"] = round(elapsed, 2)
+    report["log"] = os.environ["EVENT_LISTENER_LOG"]
+    print(json.dumps(report, indent=4, ensure_ascii=False))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Reproduce sesiones grabadas de Moonraker.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    serve_parser = subparsers.add_parser("serve", help="Servir la sesión como un Moonraker falso.")
+    serve_parser.add_argument("session")
+    serve_parser.add_argument("--speed", type=float, default=1.0)
+    serve_parser.add_argument("--host", default="127.0.0.1")
+    serve_parser.add_argument("--port", type=int, default=7125)
+
+    run_parser = subparsers.add_parser("run", help="Reproducir la sesión contra el listener y reportar.")
+    run_parser.add_argument("session")
+    run_parser.add_argument("--speed", type=float, default=1.0)
+    run_parser.add_argument("--port", type=int, default=7126)
+    run_parser.add_argument("--server-url", help="WebSocket de un server.py real; por defecto se usa el sustituto interno.")
+    run_parser.add_argument("--drain", type=float, default=5.0, help="Segundos de espera al terminar la reproducción.")
+
+    args = parser.parse_args()
+    if args.command == "serve":
+        asyncio.run(serve(args))
+    else:
+        asyncio.run(run_listener(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,122 @@
+# notification_filter.py
+
+import time
+import logging
+from collections import deque
+
+# Ventana por defecto para filtrar duplicados (en segundos)
+DEFAULT_WINDOW = 30
+
+# Ventanas de duplicados por categoría (en segundos)
+CATEGORY_WINDOWS = {
+    "klipper_state": 15,
+    "mcu_state": 15,
+    "print_state": 10,
+    "temperature": 30,
+    "file": 30,
+    "error": 10,
+    "host": 300,
+}
+
+# Categorías cuyas ráfagas se condensan en un único mensaje con el conteo.
+# El primer mensaje de la ráfaga se anuncia de inmediato; los siguientes dentro
+# de la ventana se cuentan y se resumen al cerrarse la ventana.
+COALESCE_TEMPLATES = {
+    "klipper_state": "Estado de Klipper cambió {count} veces. {last}",
+    "mcu_state": "Estado de la MCU cambió {count} veces. {last}",
+}
+
+
+class NotificationFilter:
+    """
+    Filtro de notificaciones duplicadas con búsqueda O(1) y expiración amortizada.
+
+    Las claves vigentes se guardan en un diccionario (clave -> instante de expiración)
+    y el orden de expiración en una deque por ventana: como todas las entradas de una
+    misma ventana expiran en orden de llegada, cada deque está ordenada y basta con
+    revisar su cabeza.
+    """
+
+    def __init__(self, windows=None, coalesce_templates=None, default_window=DEFAULT_WINDOW, clock=time.time):
+        self.windows = dict(CATEGORY_WINDOWS if windows is None else windows)
+        self.coalesce_templates = dict(COALESCE_TEMPLATES if coalesce_templates is None else coalesce_templates)
+        self.default_window = default_window
+        self.clock = clock
+        self._expires = {}  # clave normalizada -> instante de expiración
+        self._expiry_order = {}  # ventana -> deque de (instante de expiración, clave)
+        self._bursts = {}  # categoría -> {"count", "last", "ends"}
+
+    def window_for(self, category):
+        return self.windows.get(category, self.default_window)
+
+    def in_burst(self, category):
+        """
+        Indica si hay una ráfaga en curso para la categoría.
+        """
+        return category in self._bursts
+
+    def _expire(self, now):
+        for order in self._expiry_order.values():
+            while order and order[0][0] <= now:
+                expires_at, key = order.popleft()
+                # Solo eliminar si la entrada no fue renovada con otra expiración
+                if self._expires.get(key) == expires_at:
+                    del self._expires[key]
+                    logging.debug(f"Removiendo notificación antigua: {key}")
+
+    def submit(self, message, category=None):
+        """
+        Registra un mensaje y devuelve la lista de pares (categoría, mensaje) que deben
+        encolarse: los resúmenes de ráfagas que se cerraron, cada uno con su categoría,
+        y el propio mensaje.
+
+        El mensaje no está en la lista si es un duplicado o quedó absorbido por una
+        ráfaga en curso de su categoría.
+        """
+        now = self.clock()
+        self._expire(now)
+        ready = self.flush(now)
+
+        window = self.window_for(category)
+        burst = self._bursts.get(category)
+        if burst is not None:
+            # Ráfaga en curso: contar el cambio en lugar de anunciarlo. Se cuenta
+            # aunque repita un estado anterior para que el resumen refleje el último.
+            burst["count"] += 1
+            burst["last"] = message
+            logging.debug(f"Notificación condensada en ráfaga '{category}': {message}")
+            return ready
+
+        key = f"{category}:{message.strip().lower()}"
+        if key in self._expires:
+            logging.debug(f"Notificación duplicada encontrada: {message}")
+            return ready
+
+        expires_at = now + window
+        self._expires[key] = expires_at
+        self._expiry_order.setdefault(window, deque()).append((expires_at, key))
+
+        if category in self.coalesce_templates:
+            self._bursts[category] = {"count": 1, "last": message, "ends": now + window}
+
+        ready.append((category, message))
+        return ready
+
+    def flush(self, now=None):
+        """
+        Cierra las ráfagas cuya ventana terminó y devuelve sus resúmenes como pares
+        (categoría, mensaje).
+        Debe llamarse periódicamente para que los resúmenes no queden retenidos.
+        """
+        if now is None:
+            now = self.clock()
+        summaries = []
+        for category in [c for c, b in self._bursts.items() if b["ends"] <= now]:
+            burst = self._bursts.pop(category)
+            if burst["count"] > 1:
+                template = self.coalesce_templates[category]
+                summaries.append((category, template.format(count=burst["count"], last=burst["last"])))
+        return summaries
+
+    def __len__(self):
+        return len(self._expires)
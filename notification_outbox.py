@@ -0,0 +1,156 @@
+# notification_outbox.py
+
+import os
+import time
+import sqlite3
+import logging
+import threading
+
+# Prioridades de las notificaciones (menor número = mayor prioridad)
+PRIORITY_CRITICAL = 0  # Errores, paradas y pérdidas de conexión
+PRIORITY_STATE = 1  # Cambios de estado de la impresora
+PRIORITY_INFO = 2  # Mensajes informativos (archivos, temperaturas, macros)
+
+# Prioridad según la categoría de la notificación
+CATEGORY_PRIORITIES = {
+    "error": PRIORITY_CRITICAL,
+    "klipper_state": PRIORITY_STATE,
+    "klipper_message": PRIORITY_STATE,
+    "mcu_state": PRIORITY_STATE,
+    "print_state": PRIORITY_STATE,
+    "host": PRIORITY_STATE,
+}
+
+# Tiempo de vida de una notificación pendiente según su prioridad (en segundos)
+DEFAULT_TTLS = {
+    PRIORITY_CRITICAL: 3600,
+    PRIORITY_STATE: 600,
+    PRIORITY_INFO: 120,
+}
+
+# Límites para acotar el uso de disco
+DEFAULT_MAX_ENTRIES = 500
+MAX_MESSAGE_LENGTH = 500
+
+
+def priority_for(category):
+    return CATEGORY_PRIORITIES.get(category, PRIORITY_INFO)
+
+
+class NotificationOutbox:
+    """
+    Bandeja de salida persistente de notificaciones respaldada por SQLite.
+
+    Las notificaciones quedan en disco hasta que el servidor confirma que las procesó,
+    se entregan por prioridad y luego por orden de llegada, y expiran según su prioridad.
+    Las que se enviaron sin confirmación se vuelven a entregar al reconectar.
+    """
+
+    def __init__(self, path, ttls=None, max_entries=DEFAULT_MAX_ENTRIES, clock=time.time):
+        self.path = path
+        self.ttls = dict(DEFAULT_TTLS if ttls is None else ttls)
+        self.max_entries = max_entries
+        self.clock = clock
+        self.lock = threading.Lock()
+
+        directory = os.path.dirname(path)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory)
+
+        self.db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        # WAL reduce las escrituras sincrónicas en la tarjeta SD
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        self.db.execute("""
+            CREATE TABLE IF NOT EXISTS outbox (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                priority INTEGER NOT NULL,
+                category TEXT,
+                message TEXT NOT NULL,
+                created_at REAL NOT NULL,
+                expires_at REAL NOT NULL,
+                sent_at REAL
+            )
+        """)
+        self.db.execute("CREATE INDEX IF NOT EXISTS idx_outbox_pending ON outbox (sent_at, priority, id)")
+        self.db.execute("CREATE INDEX IF NOT EXISTS idx_outbox_expires ON outbox (expires_at)")
+        # Lo enviado sin confirmación antes de un reinicio se vuelve a entregar
+        self.requeue_sent()
+
+    def put(self, message, category=None, priority=None):
+        """
+        Guarda una notificación y devuelve su id.
+        """
+        if priority is None:
+            priority = priority_for(category)
+        now = self.clock()
+        expires_at = now + self.ttls.get(priority, self.ttls[PRIORITY_INFO])
+        with self.lock:
+            cursor = self.db.execute(
+                "INSERT INTO outbox (priority, category, message, created_at, expires_at) VALUES (?, ?, ?, ?, ?)",
+                (priority, category, message[:MAX_MESSAGE_LENGTH], now, expires_at)
+            )
+            self._enforce_limit()
+            return cursor.lastrowid
+
+    def next_pending(self):
+        """
+        Marca como enviada y devuelve la notificación pendiente de mayor prioridad
+        como (id, mensaje, creada_en), o None si no hay pendientes.
+        """
+        now = self.clock()
+        with self.lock:
+            self._purge_expired(now)
+            row = self.db.execute(
+                "SELECT id, message, created_at FROM outbox WHERE sent_at IS NULL ORDER BY priority, id LIMIT 1"
+            ).fetchone()
+            if row is None:
+                return None
+            self.db.execute("UPDATE outbox SET sent_at = ? WHERE id = ?", (now, row[0]))
+            return row
+
+    def ack(self, notification_id):
+        """
+        Elimina una notificación confirmada por el servidor.
+        """
+        with self.lock:
+            self.db.execute("DELETE FROM outbox WHERE id = ?", (notification_id,))
+
+    def requeue(self, notification_id):
+        """
+        Devuelve a pendiente una notificación que no se pudo enviar.
+        """
+        with self.lock:
+            self.db.execute("UPDATE outbox SET sent_at = NULL WHERE id = ?", (notification_id,))
+
+    def requeue_sent(self):
+        """
+        Devuelve a pendiente todo lo enviado sin confirmación, para reenviarlo al reconectar.
+        """
+        with self.lock:
+            cursor = self.db.execute("UPDATE outbox SET sent_at = NULL WHERE sent_at IS NOT NULL")
+            if cursor.rowcount:
+                logging.info(f"{cursor.rowcount} notificaciones sin confirmar se volverán a enviar.")
+
+    def pending_count(self):
+        with self.lock:
+            return self.db.execute("SELECT COUNT(*) FROM outbox WHERE sent_at IS NULL").fetchone()[0]
+
+    def _purge_expired(self, now):
+        cursor = self.db.execute("DELETE FROM outbox WHERE expires_at <= ?", (now,))
+        if cursor.rowcount:
+            logging.warning(f"{cursor.rowcount} notificaciones expiradas eliminadas de la bandeja de salida.")
+
+    def _enforce_limit(self):
+        excess = self.db.execute("SELECT COUNT(*) FROM outbox").fetchone()[0] - self.max_entries
+        if excess > 0:
+            # Descartar primero las de menor prioridad y, dentro de ellas, las más antiguas
+            self.db.execute(
+                "DELETE FROM outbox WHERE id IN (SELECT id FROM outbox ORDER BY priority DESC, id LIMIT ?)",
+                (excess,)
+            )
+            logging.warning(f"Bandeja de salida llena: {excess} notificaciones descartadas.")
+
+    def close(self):
+        with self.lock:
+            self.db.close()
@@ -0,0 +1,251 @@
+# notification_rules.py
+
+import re
+import json
+import time
+from collections import namedtuple
+
+from notification_outbox import PRIORITY_CRITICAL, PRIORITY_STATE, PRIORITY_INFO
+
+# Nombres de prioridad aceptados en el archivo de reglas
+PRIORITIES = {
+    "critical": PRIORITY_CRITICAL,
+    "state": PRIORITY_STATE,
+    "info": PRIORITY_INFO,
+}
+
+# Prefijo de los campos que no vienen de Klipper sino de banderas del listener
+LISTENER_PREFIX = "listener."
+
+# Filtros disponibles en las plantillas: {campo|filtro}
+TEMPLATE_FILTERS = {
+    "noext": lambda value: str(value).replace(".gcode", ""),
+    "lower": lambda value: str(value).lower(),
+    "title": lambda value: str(value).title(),
+}
+
+TEMPLATE_PATTERN = re.compile(r"\{([\w.]+)(?:\|(\w+))?\}")
+
+# changed: el campo cambió en la misma actualización (true) o no (false)
+CONDITION_OPS = {"eq", "ne", "in", "not_in", "truthy", "changed"}
+TRANSITION_KEYS = {"from", "to", "to_not", "require_previous", "ignore_case"}
+
+# changed: campos que cambiaron en la actualización que produjo la coincidencia
+Match = namedtuple("Match", ["rule", "value", "previous", "changed"])
+
+
+class Rule:
+    """
+    Regla compilada: campo observado, transición, condiciones, plantilla del mensaje,
+    categoría/prioridad, enfriamiento y acciones del listener.
+    """
+
+    def __init__(self, index, spec):
+        self.index = index
+        self.id = spec.get("id", f"rule_{index}")
+        self.field = spec["field"]
+        if "." not in self.field:
+            raise ValueError(f"Regla '{self.id}': el campo debe tener la forma objeto.campo")
+
+        transition = spec.get("transition", {})
+        unknown = set(transition) - TRANSITION_KEYS
+        if unknown:
+            raise ValueError(f"Regla '{self.id}': claves de transición desconocidas {sorted(unknown)}")
+        self.ignore_case = transition.get("ignore_case", False)
+        self.from_values = self._as_set(transition.get("from"))
+        self.to_values = self._as_set(transition.get("to"))
+        self.to_not_values = self._as_set(transition.get("to_not"))
+        self.require_previous = transition.get("require_previous", False)
+
+        self.conditions = []
+        for field, condition in spec.get("when", {}).items():
+            ignore_case = condition.get("ignore_case", False)
+            for op, expected in condition.items():
+                if op == "ignore_case":
+                    continue
+                if op not in CONDITION_OPS:
+                    raise ValueError(f"Regla '{self.id}': operador desconocido '{op}'")
+                if op in ("in", "not_in"):
+                    expected = self._as_set(expected, ignore_case)
+                elif ignore_case and isinstance(expected, str):
+                    expected = expected.lower()
+                self.conditions.append((field, op, expected, ignore_case))
+
+        self.message = spec.get("message")
+        for _, filter_name in TEMPLATE_PATTERN.findall(self.message or ""):
+            if filter_name and filter_name not in TEMPLATE_FILTERS:
+                raise ValueError(f"Regla '{self.id}': filtro de plantilla desconocido '{filter_name}'")
+        self.category = spec.get("category")
+        priority = spec.get("priority")
+        if priority is not None and priority not in PRIORITIES:
+            raise ValueError(f"Regla '{self.id}': prioridad desconocida '{priority}'")
+        self.priority = PRIORITIES.get(priority)
+        self.cooldown = spec.get("cooldown", 0)
+        self.guard = spec.get("guard")
+        self.actions = list(spec.get("actions", []))
+
+    def _as_set(self, values, ignore_case=None):
+        if values is None:
+            return None
+        if not isinstance(values, list):
+            values = [values]
+        if ignore_case is None:
+            ignore_case = self.ignore_case
+        return {self._normalize(v, ignore_case) for v in values}
+
+    @staticmethod
+    def _normalize(value, ignore_case):
+        if ignore_case and isinstance(value, str):
+            return value.lower()
+        return value
+
+    def matches_transition(self, value, previous):
+        if value is None or value == previous:
+            return False
+        if self.require_previous and previous is None:
+            return False
+        value = self._normalize(value, self.ignore_case)
+        if self.to_values is not None and value not in self.to_values:
+            return False
+        if self.to_not_values is not None and value in self.to_not_values:
+            return False
+        if self.from_values is not None and self._normalize(previous, self.ignore_case) not in self.from_values:
+            return False
+        return True
+
+    def matches_conditions(self, lookup, changed=frozenset()):
+        for field, op, expected, ignore_case in self.conditions:
+            if op == "changed":
+                if (field in changed) != expected:
+                    return False
+                continue
+            actual = self._normalize(lookup(field), ignore_case)
+            if op == "eq" and actual != expected:
+                return False
+            if op == "ne" and actual == expected:
+                return False
+            if op == "in" and actual not in expected:
+                return False
+            if op == "not_in" and actual in expected:
+                return False
+            if op == "truthy" and bool(actual) != expected:
+                return False
+        return True
+
+
+class RuleEngine:
+    """
+    Motor de reglas de notificación compilado en una tabla de despacho.
+
+    Las reglas se indexan por el campo que observan ("print_stats.state"), de modo que
+    cada actualización de estado solo evalúa las reglas de los campos que trae.
+    """
+
+    def __init__(self, specs, clock=time.time):
+        self.clock = clock
+        self.rules = [Rule(index, spec) for index, spec in enumerate(specs)]
+        self.dispatch = {}
+        for rule in self.rules:
+            self.dispatch.setdefault(rule.field, []).append(rule)
+        self.state = {}  # "objeto.campo" -> último valor conocido
+        self.last_fired = {}  # id de la regla -> instante en que se disparó
+
+    @classmethod
+    def from_file(cls, path, clock=time.time):
+        with open(path, 'r', encoding='utf-8') as f:
+            return cls(json.load(f)["rules"], clock=clock)
+
+    def subscription(self, base=None):
+        """
+        Devuelve los objetos a suscribir en Moonraker: los de base más los que usan las reglas.
+        """
+        objects = {name: (list(fields) if fields is not None else None) for name, fields in (base or {}).items()}
+        for field in self.dispatch:
+            name, attribute = field.split(".", 1)
+            if name not in objects:
+                objects[name] = [attribute]
+            elif objects[name] is not None and attribute not in objects[name]:
+                objects[name].append(attribute)
+        return objects
+
+    def apply(self, status):
+        """
+        Actualiza el estado conocido con una notificación de Moonraker y devuelve,
+        en el orden del archivo de reglas, las reglas cuya transición se cumplió.
+        Las condiciones se verifican después con check(), en el momento de dispararlas,
+        para que vean las banderas que cambiaron las reglas anteriores.
+        """
+        changes = self._update(status)
+        changed = frozenset(key for key, (value, previous) in changes.items() if value != previous)
+
+        now = self.clock()
+        candidates = []
+        for key, (value, previous) in changes.items():
+            for rule in self.dispatch.get(key, ()):
+                if not rule.matches_transition(value, previous):
+                    continue
+                if rule.cooldown and now - self.last_fired.get(rule.id, float("-inf")) < rule.cooldown:
+                    continue
+                candidates.append(Match(rule, value, previous, changed))
+        candidates.sort(key=lambda match: match.rule.index)
+        return candidates
+
+    def seed(self, status):
+        """
+        Carga un estado completo (p. ej. la respuesta de la suscripción) sin disparar reglas.
+        """
+        self._update(status)
+
+    def _update(self, status):
+        changes = {}
+        for name, fields in status.items():
+            if not isinstance(fields, dict):
+                continue
+            for attribute, value in fields.items():
+                if value is None:
+                    continue
+                key = f"{name}.{attribute}"
+                changes[key] = (value, self.state.get(key))
+                self.state[key] = value
+        return changes
+
+    def check(self, match, flags=None):
+        """
+        Verifica las condiciones de una coincidencia con el estado y las banderas actuales.
+        """
+        return match.rule.matches_conditions(self.lookup(flags), match.changed)
+
+    def mark_fired(self, rule):
+        self.last_fired[rule.id] = self.clock()
+
+    def lookup(self, flags=None):
+        flags = flags or {}
+
+        def get(field):
+            if field.startswith(LISTENER_PREFIX):
+                return flags.get(field[len(LISTENER_PREFIX):])
+            return self.state.get(field)
+
+        return get
+
+    def render(self, match, flags=None):
+        """
+        Construye el mensaje de una coincidencia a partir de su plantilla.
+        """
+        if not match.rule.message:
+            return None
+        get = self.lookup(flags)
+
+        def substitute(found):
+            field, filter_name = found.group(1), found.group(2)
+            if field == "value":
+                value = match.value
+            elif field == "previous":
+                value = match.previous
+            else:
+                value = get(field)
+            if filter_name:
+                value = TEMPLATE_FILTERS[filter_name](value)
+            return str(value)
+
+        return TEMPLATE_PATTERN.sub(substitute, match.rule.message)
@@ -0,0 +1,307 @@
+# print_history.py
+
+import os
+import time
+import sqlite3
+import logging
+import threading
+from datetime import datetime, timedelta
+
+DEFAULT_HISTORY_PATH = "/opt/Say-Fi-Print/print_history.db"  # Si no se define PRINT_HISTORY_PATH
+
+# Trabajos por página al sincronizar con server/history/list de Moonraker
+HISTORY_PAGE_SIZE = 50
+# Un trabajo local y uno de Moonraker del mismo archivo con inicios a menos de esto son el mismo
+LOCAL_MATCH_TOLERANCE = 120
+
+# Estado de Moonraker para los trabajos que siguen en curso
+STATUS_IN_PROGRESS = "in_progress"
+
+# Períodos que entienden las consultas (ver period_bounds)
+PERIODS = ["hoy", "ayer", "semana", "semana_pasada", "mes", "mes_pasado", "año", "todo"]
+
+PERIOD_NAMES = {
+    "hoy": "hoy", "ayer": "ayer", "semana": "esta semana", "semana_pasada": "la semana pasada",
+    "mes": "este mes", "mes_pasado": "el mes pasado", "año": "este año", "todo": "en total",
+}
+STATUS_NAMES = {
+    "completed": "completadas", "cancelled": "canceladas", "error": "con error", STATUS_IN_PROGRESS: "en curso",
+    "klippy_shutdown": "interrumpidas por Klipper", "klippy_disconnect": "interrumpidas por Klipper",
+    "interrupted": "interrumpidas", "server_exit": "interrumpidas",
+}
+
+
+def period_bounds(period, now=None):
+    """
+    Convierte un período en (desde, hasta) como timestamps UNIX en hora local.
+    """
+    now = now or datetime.now()
+    today = now.replace(hour=0, minute=0, second=0, microsecond=0)
+    if period == "hoy":
+        start, end = today, now
+    elif period == "ayer":
+        start, end = today - timedelta(days=1), today
+    elif period == "semana":
+        start, end = today - timedelta(days=today.weekday()), now
+    elif period == "semana_pasada":
+        end = today - timedelta(days=today.weekday())
+        start = end - timedelta(days=7)
+    elif period == "mes":
+        start, end = today.replace(day=1), now
+    elif period == "mes_pasado":
+        end = today.replace(day=1)
+        start = (end - timedelta(days=1)).replace(day=1)
+    elif period == "año":
+        start, end = today.replace(month=1, day=1), now
+    elif period == "todo":
+        return 0.0, now.timestamp()
+    else:
+        raise ValueError(f"Período desconocido '{period}'. Opciones: {', '.join(PERIODS)}")
+    return start.timestamp(), end.timestamp()
+
+
+class PrintHistory:
+    """
+    Historial local de impresiones respaldado por SQLite (WAL).
+
+    Se llena desde server/history/list de Moonraker y con las transiciones de
+    print_stats que ve el listener. Los índices cubren las columnas que usan las
+    consultas agregadas, así que se responden desde el índice sin leer cada trabajo.
+    """
+
+    def __init__(self, path=None):
+        # Del entorno al crear el historial: event_listener.py importa este módulo antes de cargar el .env
+        path = path or os.getenv("PRINT_HISTORY_PATH", DEFAULT_HISTORY_PATH)
+        self.path = path
+        self.lock = threading.Lock()
+        directory = os.path.dirname(path)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory)
+
+        # El servidor y el listener escriben en el mismo archivo desde procesos distintos
+        self.db = sqlite3.connect(path, check_same_thread=False, isolation_level=None, timeout=10)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        self.db.execute("""
+            CREATE TABLE IF NOT EXISTS jobs (
+                job_id TEXT PRIMARY KEY,
+                filename TEXT NOT NULL,
+                status TEXT NOT NULL,
+                start_time REAL NOT NULL,
+                end_time REAL,
+                print_duration REAL NOT NULL DEFAULT 0,
+                total_duration REAL NOT NULL DEFAULT 0,
+                filament_used REAL NOT NULL DEFAULT 0,
+                filament_type TEXT,
+                filament_weight REAL NOT NULL DEFAULT 0,
+                source TEXT NOT NULL
+            )
+        """)
+        # Índices cubrientes para los agregados por tiempo, estado y tipo de filamento
+        self.db.execute("""CREATE INDEX IF NOT EXISTS idx_jobs_time ON jobs
+            (start_time, status, filament_type, print_duration, filament_used, filament_weight)""")
+        self.db.execute("""CREATE INDEX IF NOT EXISTS idx_jobs_type ON jobs
+            (filament_type, start_time, status, print_duration, filament_used, filament_weight)""")
+        self.db.execute("CREATE INDEX IF NOT EXISTS idx_jobs_file ON jobs (filename, start_time)")
+        self.db.execute("CREATE INDEX IF NOT EXISTS idx_jobs_status ON jobs (status, start_time)")
+
+    # Escritura
+
+    def upsert_jobs(self, jobs):
+        """
+        Guarda o actualiza trabajos con el formato de server/history/list y
+        reemplaza los registros locales del listener que correspondan al mismo trabajo.
+        """
+        rows = []
+        for job in jobs:
+            metadata = job.get("metadata") or {}
+            rows.append((
+                str(job["job_id"]),
+                job.get("filename", ""),
+                job.get("status", STATUS_IN_PROGRESS),
+                job.get("start_time") or 0,
+                job.get("end_time"),
+                job.get("print_duration") or 0,
+                job.get("total_duration") or 0,
+                job.get("filament_used") or 0,
+                (metadata.get("filament_type") or "").split(";")[0].strip().upper() or None,
+                metadata.get("filament_weight_total") or 0,
+            ))
+        if not rows:
+            return 0
+        with self.lock:
+            self.db.execute("BEGIN")
+            try:
+                self.db.executemany("""
+                    INSERT INTO jobs (job_id, filename, status, start_time, end_time, print_duration,
+                                      total_duration, filament_used, filament_type, filament_weight, source)
+                    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, 'moonraker')
+                    ON CONFLICT(job_id) DO UPDATE SET
+                        status = excluded.status, end_time = excluded.end_time,
+                        print_duration = excluded.print_duration, total_duration = excluded.total_duration,
+                        filament_used = excluded.filament_used, filament_type = excluded.filament_type,
+                        filament_weight = excluded.filament_weight
+                """, rows)
+                self.db.executemany("""
+                    DELETE FROM jobs WHERE source = 'local' AND filename = ? AND start_time BETWEEN ? AND ?
+                """, [(row[1], row[3] - LOCAL_MATCH_TOLERANCE, row[3] + LOCAL_MATCH_TOLERANCE) for row in rows])
+                self.db.execute("COMMIT")
+            except Exception:
+                self.db.execute("ROLLBACK")
+                raise
+        return len(rows)
+
+    def record_start(self, filename, start_time=None):
+        """
+        Registra el inicio de una impresión visto por el listener. Al reanudar una
+        impresión pausada ya hay un trabajo en curso del archivo y no se crea otro.
+        """
+        start_time = start_time or time.time()
+        with self.lock:
+            self.db.execute("""
+                INSERT OR IGNORE INTO jobs (job_id, filename, status, start_time, source)
+                SELECT ?, ?, ?, ?, 'local'
+                WHERE NOT EXISTS (SELECT 1 FROM jobs WHERE source = 'local' AND filename = ? AND status = ?)
+            """, (f"local:{filename}:{int(start_time)}", filename or "", STATUS_IN_PROGRESS, start_time,
+                  filename or "", STATUS_IN_PROGRESS))
+
+    def record_end(self, filename, status, end_time=None):
+        """
+        Cierra el último trabajo local en curso del archivo. Es una aproximación hasta
+        que la sincronización con Moonraker traiga los datos reales del trabajo.
+        """
+        end_time = end_time or time.time()
+        with self.lock:
+            self.db.execute("""
+                UPDATE jobs SET status = ?, end_time = ?, total_duration = ? - start_time, print_duration = ? - start_time
+                WHERE job_id = (SELECT job_id FROM jobs WHERE source = 'local' AND filename = ? AND status = ?
+                                ORDER BY start_time DESC LIMIT 1)
+            """, (status, end_time, end_time, end_time, filename or "", STATUS_IN_PROGRESS))
+
+    def sync_cursor(self):
+        """
+        Timestamp desde el cual pedir trabajos a Moonraker: el inicio del trabajo de
+        Moonraker más antiguo aún en curso o, si no hay, el del más reciente.
+        """
+        with self.lock:
+            row = self.db.execute(
+                "SELECT MIN(start_time) FROM jobs WHERE source = 'moonraker' AND status = ?", (STATUS_IN_PROGRESS,)
+            ).fetchone()
+            if row[0] is None:
+                row = self.db.execute("SELECT MAX(start_time) FROM jobs WHERE source = 'moonraker'").fetchone()
+        return max(0.0, row[0] - 1) if row[0] is not None else 0.0
+
+    def sync(self, fetch_page):
+        """
+        Sincroniza de forma incremental. fetch_page(start, since) debe devolver la lista
+        de trabajos de server/history/list desde el desplazamiento start.
+        """
+        since = self.sync_cursor()
+        start = 0
+        total = 0
+        while True:
+            jobs = fetch_page(start, since)
+            total += self.upsert_jobs(jobs)
+            if len(jobs) < HISTORY_PAGE_SIZE:
+                break
+            start += len(jobs)
+        if total:
+            logging.info(f"Historial de impresiones: {total} trabajos sincronizados.")
+        return total
+
+    # Consultas
+
+    @staticmethod
+    def _filters(since, until, status=None, filament_type=None):
+        clauses = ["start_time >= ?", "start_time < ?"]
+        params = [since, until]
+        if status:
+            clauses.append("status = ?")
+            params.append(status)
+        if filament_type:
+            clauses.append("filament_type = ?")
+            params.append(filament_type.upper())
+        return " AND ".join(clauses), params
+
+    def totals(self, since, until, status=None, filament_type=None):
+        """
+        Cantidad de trabajos, horas de impresión, filamento (mm) y peso (g) en el rango.
+        """
+        where, params = self._filters(since, until, status, filament_type)
+        with self.lock:
+            row = self.db.execute(f"""
+                SELECT COUNT(*), COALESCE(SUM(print_duration), 0), COALESCE(SUM(filament_used), 0),
+                       COALESCE(SUM(filament_weight), 0)
+                FROM jobs WHERE {where}
+            """, params).fetchone()
+        return {"jobs": row[0], "print_hours": row[1] / 3600, "filament_mm": row[2], "filament_g": row[3]}
+
+    def by_status(self, since, until, filament_type=None):
+        where, params = self._filters(since, until, filament_type=filament_type)
+        with self.lock:
+            rows = self.db.execute(
+                f"SELECT status, COUNT(*) FROM jobs WHERE {where} GROUP BY status ORDER BY 2 DESC", params
+            ).fetchall()
+        return dict(rows)
+
+    def by_filament_type(self, since, until):
+        with self.lock:
+            rows = self.db.execute("""
+                SELECT COALESCE(filament_type, 'desconocido'), COUNT(*), SUM(filament_used), SUM(filament_weight)
+                FROM jobs WHERE start_time >= ? AND start_time < ? GROUP BY filament_type ORDER BY 3 DESC
+            """, (since, until)).fetchall()
+        return {name: {"jobs": count, "filament_mm": used or 0, "filament_g": weight or 0} for name, count, used, weight in rows}
+
+    def top_files(self, since, until, limit=5):
+        with self.lock:
+            return self.db.execute("""
+                SELECT filename, COUNT(*), SUM(print_duration) FROM jobs
+                WHERE start_time >= ? AND start_time < ? GROUP BY filename ORDER BY 2 DESC, 3 DESC LIMIT ?
+            """, (since, until, limit)).fetchall()
+
+    def last_job(self, filename=None):
+        with self.lock:
+            if filename:
+                cursor = self.db.execute(
+                    "SELECT filename, status, start_time, print_duration FROM jobs WHERE filename = ? ORDER BY start_time DESC LIMIT 1",
+                    (filename,))
+            else:
+                cursor = self.db.execute(
+                    "SELECT filename, status, start_time, print_duration FROM jobs ORDER BY start_time DESC LIMIT 1")
+            return cursor.fetchone()
+
+    # Resúmenes para el asistente
+
+    def describe(self, period="semana", filament_type=None, status=None):
+        since, until = period_bounds(period)
+        totals = self.totals(since, until, status, filament_type)
+        scope = PERIOD_NAMES[period] + (f" con {filament_type.upper()}" if filament_type else "")
+        if not totals["jobs"]:
+            return f"No hay impresiones registradas {scope}."
+        hours = int(totals["print_hours"])
+        minutes = int((totals["print_hours"] - hours) * 60)
+        lines = [f"Impresiones {scope}: {totals['jobs']}, con {hours} horas y {minutes} minutos de impresión "
+                 f"y {totals['filament_mm'] / 1000:.1f} metros de filamento"
+                 + (f" ({totals['filament_g']:.0f} g)." if totals["filament_g"] else ".")]
+        if not status:
+            counts = self.by_status(since, until, filament_type)
+            lines.append(", ".join(f"{STATUS_NAMES.get(name, name)}: {count}" for name, count in counts.items()))
+        if not filament_type:
+            types = self.by_filament_type(since, until)
+            if len(types) > 1 or "desconocido" not in types:
+                lines.append("Por material: " + ", ".join(
+                    f"{name} {data['filament_mm'] / 1000:.1f} m" for name, data in types.items()))
+        return "\n".join(lines)
+
+    def describe_top_files(self, period="mes", limit=5):
+        since, until = period_bounds(period)
+        rows = self.top_files(since, until, limit)
+        if not rows:
+            return f"No hay impresiones registradas {PERIOD_NAMES[period]}."
+        return f"Archivos más impresos {PERIOD_NAMES[period]}:\n" + "\n".join(
+            f"{filename.replace('.gcode', '')}: {count} veces, {duration / 3600:.1f} horas"
+            for filename, count, duration in rows)
+
+    def close(self):
+        with self.lock:
+            self.db.close()
@@ -497,6 +497,19 @@ class PrinterFunctions:
             print(f"Error al intentar verificar si la impresora está imprimiendo: {e}")
             return False
 
+    def get_history_jobs(self, start=0, since=0, limit=50):
+        """
+        Obtiene una página del historial de trabajos de Moonraker (server/history/list).
+        Lanza una excepción si la solicitud falla.
+        """
+        if self.SERVER != "moonraker":
+            raise ValueError("El historial de impresiones solo está disponible con Moonraker.")
+        url = self._get_url("server/history/list")
+        params = {"start": start, "since": since, "limit": limit, "order": "asc"}
+        response = requests.get(url, headers=self._get_headers(), params=params, timeout=10)
+        response.raise_for_status()
+        return response.json().get("result", {}).get("jobs", [])
+
     def search_files(self, file_name, top_n=5):
         """
         Busca y devuelve los archivos más similares al nombre proporcionado.
@@ -0,0 +1,130 @@
+# recognition_pool.py
+
+import os
+import time
+import queue
+import threading
+import collections
+from metrics import Counter
+
+RECOGNITION_WORKERS = int(os.getenv("RECOGNITION_WORKERS", "2"))
+MAX_PENDING = 6  # Segmentos en espera; al llenarse se descarta el más antiguo
+MAX_AGE = 10  # Segundos tras los que un segmento sin reconocer ya no sirve
+RECENT_KEYS = 64  # Claves recordadas para no reconocer dos veces el mismo segmento
+
+RECOGNITION_DROPPED_TOTAL = Counter("sayfi_recognition_dropped_total",
+                                    "Segmentos de palabra clave descartados sin reconocer.", labels=("reason",))
+
+
+class Segment:
+    def __init__(self, audio, key, epoch):
+        self.audio = audio
+        self.key = key
+        self.epoch = epoch
+        self.captured = time.monotonic()
+
+
+class Detection:
+    def __init__(self, result, key, captured):
+        self.result = result
+        self.key = key  # Clave del segmento; en Transcriber, la posición del stream donde termina
+        self.captured = captured
+
+
+class RecognitionPool:
+    """
+    Pool acotado de hilos que reconocen la palabra clave en los segmentos capturados.
+
+    Cada segmento se envía una sola vez (las claves repetidas se ignoran) y espera en
+    una cola de MAX_PENDING; si el reconocimiento se atrasa se descartan primero los
+    más antiguos, y los que llevan más de max_age segundos esperando ya no se
+    reconocen. Los aciertos se publican en un único canal, detections. clear() abre
+    una época nueva: lo pendiente se descarta y los resultados de segmentos anteriores
+    que aún estén en curso se ignoran al terminar.
+    """
+
+    def __init__(self, recognize, workers=RECOGNITION_WORKERS, max_pending=MAX_PENDING, max_age=MAX_AGE):
+        """
+        :param recognize: Función segmento -> resultado (None si no hay palabra clave).
+        """
+        self.recognize = recognize
+        self.max_pending = max_pending
+        self.max_age = max_age
+        self.pending = collections.deque()
+        self.condition = threading.Condition()
+        self.recent = collections.deque(maxlen=RECENT_KEYS)
+        self.epoch = 0
+        self.detections = queue.Queue()
+        self.threads = [threading.Thread(target=self._worker, daemon=True) for _ in range(max(1, workers))]
+        self.started = False
+
+    def start(self):
+        if not self.started:
+            self.started = True
+            for thread in self.threads:
+                thread.start()
+
+    def submit(self, audio, key):
+        """
+        Encola un segmento para reconocer. Devuelve False si ya se había enviado.
+        """
+        with self.condition:
+            if key in self.recent:
+                RECOGNITION_DROPPED_TOTAL.inc(reason="duplicate")
+                return False
+            self.recent.append(key)
+            if len(self.pending) >= self.max_pending:
+                self.pending.popleft()
+                RECOGNITION_DROPPED_TOTAL.inc(reason="overflow")
+                print("Reconocimiento atrasado: se descarta el segmento más antiguo.")
+            self.pending.append(Segment(audio, key, self.epoch))
+            self.condition.notify()
+        return True
+
+    def clear(self):
+        """Descarta lo pendiente, las detecciones sin leer y los resultados en curso."""
+        with self.condition:
+            self.epoch += 1
+            self.pending.clear()
+            while True:
+                try:
+                    self.detections.get_nowait()
+                except queue.Empty:
+                    break
+
+    def has_detection(self):
+        return not self.detections.empty()
+
+    def poll(self, timeout=None):
+        """Devuelve la siguiente Detection o None si no llega ninguna en timeout segundos."""
+        try:
+            return self.detections.get(timeout=timeout) if timeout else self.detections.get_nowait()
+        except queue.Empty:
+            return None
+
+    def _next_segment(self):
+        with self.condition:
+            while True:
+                self.condition.wait_for(lambda: self.pending)
+                segment = self.pending.popleft()
+                if time.monotonic() - segment.captured <= self.max_age:
+                    return segment
+                RECOGNITION_DROPPED_TOTAL.inc(reason="stale")
+                print(f"Segmento descartado: llevaba más de {self.max_age} s esperando.")
+
+    def _worker(self):
+        while True:
+            segment = self._next_segment()
+            try:
+                result = self.recognize(segment.audio)
+            except Exception as e:
+                print(f"Error al reconocer la palabra clave: {e}")
+                continue
+            if not result:
+                continue
+            with self.condition:
+                # Tras clear() el resultado ya no corresponde a la escucha actual
+                if segment.epoch != self.epoch:
+                    RECOGNITION_DROPPED_TOTAL.inc(reason="stale")
+                    continue
+                self.detections.put(Detection(result, segment.key, segment.captured))
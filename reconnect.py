@@ -0,0 +1,75 @@
+# reconnect.py
+
+import time
+import random
+import asyncio
+
+# Valores por defecto de la espera entre reintentos (en segundos)
+FIRST_RETRY_DELAY = 0.5
+INITIAL_DELAY = 1.0
+MAX_DELAY = 60.0
+BACKOFF_FACTOR = 2.0
+JITTER = 0.5
+# Una conexión que duró al menos esto se considera estable y reinicia la espera
+STABLE_AFTER = 30.0
+
+
+class Backoff:
+    """
+    Espera exponencial con jitter para reintentar conexiones.
+
+    El primer reintento es rápido (la causa más común es un corte breve); después la
+    espera se duplica hasta MAX_DELAY. El jitter reparte los reintentos para que el
+    listener y los clientes no golpeen a la vez a un servicio que recién vuelve.
+    Si la conexión se mantuvo abierta al menos stable_after segundos, la siguiente
+    caída vuelve a empezar desde el reintento rápido.
+    """
+
+    def __init__(self, first_delay=FIRST_RETRY_DELAY, initial_delay=INITIAL_DELAY, max_delay=MAX_DELAY,
+                 factor=BACKOFF_FACTOR, jitter=JITTER, stable_after=STABLE_AFTER,
+                 clock=time.monotonic, rng=random.random):
+        self.first_delay = first_delay
+        self.initial_delay = initial_delay
+        self.max_delay = max_delay
+        self.factor = factor
+        self.jitter = jitter
+        self.stable_after = stable_after
+        self.clock = clock
+        self.rng = rng
+        self.attempts = 0
+        self.connected_at = None
+
+    def connected(self):
+        """
+        Registra que la conexión se estableció.
+        """
+        self.connected_at = self.clock()
+
+    def reset(self):
+        self.attempts = 0
+        self.connected_at = None
+
+    def next_delay(self):
+        """
+        Registra un fallo o una desconexión y devuelve cuántos segundos esperar.
+        """
+        if self.connected_at is not None and self.clock() - self.connected_at >= self.stable_after:
+            self.attempts = 0
+        self.connected_at = None
+
+        if self.attempts == 0:
+            delay = self.first_delay
+        else:
+            delay = min(self.max_delay, self.initial_delay * self.factor ** (self.attempts - 1))
+            # Jitter: un valor al azar entre delay * (1 - jitter) y delay
+            delay *= 1 - self.jitter * self.rng()
+        self.attempts += 1
+        return delay
+
+    async def wait(self):
+        """
+        Versión asíncrona: espera el siguiente intervalo y devuelve su duración.
+        """
+        delay = self.next_delay()
+        await asyncio.sleep(delay)
+        return delay
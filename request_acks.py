@@ -0,0 +1,55 @@
+# request_acks.py
+#
+# Acuses de recibo de las solicitudes process_text del /ws del servidor: 'processed'
+# cuando la respuesta ya se envió y 'played' cuando terminó de sonar su audio.
+# El listener regula con ellos el ritmo de sus notificaciones (ver event_listener.py).
+
+import asyncio
+import logging
+
+
+class RequestAcks:
+    """
+    Acuses de una solicitud con 'id'.
+
+    'played' lo pide el hilo de reproducción en cualquier momento (un audio corto puede
+    terminar antes de que se envíe la respuesta); se envía siempre después de
+    'processed' y una sola vez, aunque también se pida al no haber audio.
+    """
+
+    def __init__(self, send, request_id, loop=None):
+        """
+        :param send: Corrutina que envía un dict al cliente (p. ej. websocket.send_json).
+        """
+        self.send = send
+        self.request_id = request_id
+        self.loop = loop or asyncio.get_running_loop()
+        self.processed_sent = asyncio.Event()
+        self.played_sent = False
+
+    async def _send(self, stage):
+        try:
+            await self.send({"ack": stage, "id": self.request_id})
+            logging.info(f"Acuse '{stage}' enviado para la solicitud {self.request_id}")
+        except Exception as e:
+            logging.error(f"Error al enviar acuse '{stage}' para la solicitud {self.request_id}: {str(e)}")
+
+    async def processed(self, played=False):
+        """
+        Envía 'processed'. Con played también 'played': no se encoló audio que esperar.
+        """
+        await self._send("processed")
+        self.processed_sent.set()
+        if played:
+            await self.played()
+
+    async def played(self):
+        await self.processed_sent.wait()
+        if self.played_sent:
+            return
+        self.played_sent = True
+        await self._send("played")
+
+    def on_played(self):
+        """Para el hilo de reproducción: programa 'played' en el bucle del servidor."""
+        asyncio.run_coroutine_threadsafe(self.played(), self.loop)
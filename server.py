@@ -1,11 +1,14 @@
 # server.py
 
 from fastapi import FastAPI, WebSocket, WebSocketDisconnect, HTTPException, UploadFile, File, Header
+from fastapi.responses import Response
 from pydantic import BaseModel
 from typing import Optional, Dict, List
 import uvicorn
 from controlprint import LLM  # Asegúrate de tener este módulo
 from tts import TTS  # Asegúrate de tener este módulo
+from metrics import REGISTRY, CONTENT_TYPE, Histogram, Gauge, request_timings
+from request_acks import RequestAcks
 from fastapi.staticfiles import StaticFiles
 import os
 import logging
@@ -122,6 +125,11 @@ class ConnectionManager:
 
 manager = ConnectionManager()
 
+# Métricas del servidor (ver metrics.py); se exponen en /metrics
+STAGE_SECONDS = Histogram("sayfi_process_text_stage_seconds", "Duración de cada etapa de process_text.", labels=("stage",))
+ACTIVE_CONNECTIONS = Gauge("sayfi_active_connections", "Clientes WebSocket conectados.",
+                           function=lambda: len(manager.active_connections))
+
 # Cargar las variables de entorno desde el archivo .env al inicio
 load_dotenv()
 
@@ -145,6 +153,7 @@ patterns_to_ignore = {
     "Nuevo objetivo de temperatura de la cama": r"^Nuevo objetivo de temperatura de la cama: .*°C$",
     "Nuevo objetivo de temperatura del extrusor": r"^Nuevo objetivo de temperatura del extrusor: .*°C$",
     "Se ha agregado un nuevo archivo a mainsail": r"^Se ha agregado un nuevo archivo a mainsail: .*",
+    "Se han agregado archivos nuevos a mainsail": r"^Se han agregado \d+ archivos nuevos a mainsail\.$",
     "Se va a imprimir": r"^Se va a imprimir: .*"
 }
 
@@ -193,21 +202,40 @@ async def websocket_endpoint(websocket: WebSocket):
             api_key = data.get("API_KEY")
             if api_key != EXPECTED_API_KEY:
                 logging.warning(f"Intento de acceso no autorizado con API_KEY: {api_key}")
-                await websocket.send_json({"error": "API Key inválida o no proporcionada."})
+                error = {"error": "API Key inválida o no proporcionada."}
+                if data.get("id") is not None:
+                    error["id"] = data["id"]  # Para que el cliente no espere una respuesta que no llegará
+                await websocket.send_json(error)
                 continue
 
             # Procesar diferentes tipos de mensajes
             action = data.get("action")
             if action == "process_text":
-                # Procesar el texto recibido
-                response = await process_text(data, websocket)
-                # Verificar si es un mensaje 'Notify:'
-                if data.get("text", "").startswith("Notify:"):
-                    # Broadcast a todos los clientes
-                    await manager.broadcast_message(response)
-                else:
-                    # Enviar solo al remitente
-                    await manager.send_personal_message(response, websocket)
+                # Identificador opcional de la solicitud para los acuses de recibo
+                request_id = data.get("id")
+                acks = RequestAcks(websocket.send_json, request_id) if request_id is not None else None
+                on_played = acks.on_played if acks is not None else None
+                # Procesar el texto recibido midiendo cada etapa
+                with request_timings() as timings:
+                    with STAGE_SECONDS.time(stage="total"):
+                        response = await process_text(data, websocket, on_played=on_played)
+                # Incluir los tiempos por etapa (en ms) solo si el cliente los pidió
+                if data.get("timings"):
+                    response["timings"] = timings
+                # Devolver el identificador para que el cliente asocie la respuesta
+                if request_id is not None:
+                    response["id"] = request_id
+                with STAGE_SECONDS.time(stage="send"):
+                    # Verificar si es un mensaje 'Notify:'
+                    if data.get("text", "").startswith("Notify:"):
+                        # Broadcast a todos los clientes
+                        await manager.broadcast_message(response)
+                    else:
+                        # Enviar solo al remitente
+                        await manager.send_personal_message(response, websocket)
+                if acks is not None:
+                    # Si no se encoló audio en el servidor no habrá reproducción que esperar
+                    await acks.processed(played=not response.get("audio_path"))
             elif action == "set_sayllm":
                 # Actualizar el estado de 'sayllm'
                 response = set_sayllm_ws(data)
@@ -244,6 +272,10 @@ async def websocket_endpoint(websocket: WebSocket):
                 # Obtener el volumen actual
                 response = get_volume_ws(data)
                 await manager.send_personal_message(response, websocket)
+            elif action == "stop_playback":
+                # Barge-in: cortar el audio en curso y descartar las respuestas anteriores
+                result = tts.interrupt(flush=data.get("flush", True))
+                await manager.send_personal_message({"playback": "stopped", **result}, websocket)
             else:
                 # Acción desconocida
                 await websocket.send_json({"error": "Acción desconocida."})
@@ -257,7 +289,7 @@ async def websocket_endpoint(websocket: WebSocket):
         manager.disconnect(websocket)
 
 # Función para procesar el texto recibido
-async def process_text(data, websocket: WebSocket):
+async def process_text(data, websocket: WebSocket, on_played=None):
     global ignore_start_time
     global sayllm, saytts
 
@@ -306,7 +338,8 @@ async def process_text(data, websocket: WebSocket):
             # Obtener la respuesta de LLM
             try:
                 if sayllm:
-                    function_name, args, message = llm.get_response(request_text)
+                    with STAGE_SECONDS.time(stage="llm"):
+                        function_name, args, message = llm.get_response(request_text)
                     # Limpiar emojis del mensaje que se pasará al TTS
                     cleaned_message = remove_emojis(message)
                     # Log del mensaje procesado
@@ -331,7 +364,8 @@ async def process_text(data, websocket: WebSocket):
 
             if not current_saytts:
                 # Convertir el mensaje a audio y reproducirlo en el servidor
-                audio_path = tts.speak(cleaned_message, play_audio=True)  # play_audio=True para reproducir en el servidor
+                with STAGE_SECONDS.time(stage="tts"):
+                    audio_path = tts.speak(cleaned_message, play_audio=True, on_played=on_played)  # play_audio=True para reproducir en el servidor
                 # Construir la URL del archivo de audio
                 if audio_path:
                     audio_filename = os.path.basename(audio_path)
@@ -373,7 +407,8 @@ async def process_text(data, websocket: WebSocket):
             message = ""
 
             try:
-                function_name, args, message = llm.get_response(request_text)
+                with STAGE_SECONDS.time(stage="llm"):
+                    function_name, args, message = llm.get_response(request_text)
                 # Limpiar emojis del mensaje que se pasará al TTS
                 cleaned_message = remove_emojis(message)
                 logging.info(f"Mensaje procesado sin emojis para TTS: {cleaned_message}")
@@ -389,7 +424,8 @@ async def process_text(data, websocket: WebSocket):
 
             if not current_saytts:
                 # Convertir el mensaje a audio y reproducirlo en el servidor
-                audio_path = tts.speak(cleaned_message, play_audio=True)  # play_audio=True para reproducir en el servidor
+                with STAGE_SECONDS.time(stage="tts"):
+                    audio_path = tts.speak(cleaned_message, play_audio=True, on_played=on_played)  # play_audio=True para reproducir en el servidor
                 # Construir la URL del archivo de audio
                 if audio_path:
                     audio_filename = os.path.basename(audio_path)
@@ -593,5 +629,10 @@ async def update_env(env_file: UploadFile = File(...), rol_file: UploadFile = Fi
         logging.error(f"Error al actualizar los archivos: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
+# Endpoint de métricas en el formato de texto de Prometheus
+@app.get("/metrics")
+async def metrics():
+    return Response(content=REGISTRY.render(), media_type=CONTENT_TYPE)
+
 if __name__ == "__main__":
     uvicorn.run("server:app", host="0.0.0.0", port=6996, reload=True)
@@ -0,0 +1,144 @@
+# server_session.py
+
+import os
+import json
+import time
+import itertools
+import threading
+from websockets.sync.client import connect
+from reconnect import Backoff
+
+REQUEST_TIMEOUT = 60  # Segundos máximos de espera por la respuesta (incluye LLM y TTS)
+
+
+class PendingRequest:
+    def __init__(self):
+        self.event = threading.Event()
+        self.response = None
+        self.acks = []
+
+
+class ServerSession:
+    """
+    Sesión WebSocket persistente y autenticada con el /ws del servidor.
+
+    Un hilo mantiene la conexión (reconectando con espera exponencial) y reparte lo
+    que llega: las respuestas a process_text se asocian por 'id' con la solicitud que
+    las espera, los acuses se registran y los avisos generales (volumen, sayllm,
+    notificaciones) solo se muestran. Así cada orden reutiliza la misma conexión.
+    """
+
+    def __init__(self, url=None, api_key=None):
+        # Del entorno al crear la sesión, cuando transcriber.py ya cargó el .env
+        self.url = url or os.getenv("SERVER_WS_URL") or f"ws://{os.getenv('SERVER_URL', '127.0.0.1')}:6996/ws"
+        self.api_key = api_key or os.getenv("API_KEY")
+        self.ws = None
+        self.connected = threading.Event()
+        self.pending = {}
+        self.lock = threading.Lock()
+        self.ids = itertools.count(1)
+        self.closed = False
+        self.thread = threading.Thread(target=self.run, daemon=True)
+
+    def start(self):
+        self.thread.start()
+
+    def close(self):
+        self.closed = True
+        ws = self.ws
+        if ws is not None:
+            ws.close()
+
+    def run(self):
+        backoff = Backoff()
+        while not self.closed:
+            try:
+                with connect(self.url, open_timeout=10) as ws:
+                    self.ws = ws
+                    backoff.connected()
+                    self.connected.set()
+                    print(f"Conectado al servidor en {self.url}")
+                    for message in ws:
+                        self.dispatch(message)
+            except Exception as e:
+                print(f"Error en la conexión con el servidor: {e}")
+            finally:
+                self.connected.clear()
+                self.ws = None
+                self.fail_pending()
+            if self.closed:
+                break
+            delay = backoff.next_delay()
+            print(f"Conexión con el servidor cerrada. Reintentando en {delay:.1f} segundos...")
+            time.sleep(delay)
+
+    def fail_pending(self):
+        # Las respuestas pendientes ya no llegarán por esta conexión
+        with self.lock:
+            pending, self.pending = self.pending, {}
+        for request in pending.values():
+            request.event.set()
+
+    def dispatch(self, message):
+        try:
+            data = json.loads(message)
+        except ValueError:
+            print(f"Mensaje del servidor no válido: {message}")
+            return
+        if not isinstance(data, dict):
+            return
+        request_id = data.get("id")
+        with self.lock:
+            request = self.pending.get(request_id)
+            if request is not None and "ack" not in data:
+                del self.pending[request_id]
+        if "ack" in data:
+            if request is not None:
+                request.acks.append(data["ack"])
+            print(f"Acuse '{data['ack']}' del servidor para {request_id}")
+        elif request is not None:
+            request.response = data
+            request.event.set()
+        elif "error" in data:
+            print(f"Error del servidor: {data['error']}")
+        else:
+            print(f"Mensaje del servidor: {data}")
+
+    def send(self, action, **fields):
+        """
+        Envía una acción sin esperar respuesta. Devuelve False si no hay conexión.
+        """
+        ws = self.ws
+        if ws is None:
+            return False
+        try:
+            ws.send(json.dumps({"API_KEY": self.api_key, "action": action, **fields}))
+            return True
+        except Exception as e:
+            print(f"No se pudo enviar '{action}' al servidor: {e}")
+            return False
+
+    def request(self, action, timeout=REQUEST_TIMEOUT, **fields):
+        """
+        Envía una acción con un 'id' propio y espera la respuesta que lo lleva.
+        """
+        if not self.connected.wait(timeout):
+            raise ConnectionError("Sin conexión con el servidor")
+        request_id = f"transcriber-{next(self.ids)}"
+        request = PendingRequest()
+        with self.lock:
+            self.pending[request_id] = request
+        if not self.send(action, id=request_id, **fields):
+            with self.lock:
+                self.pending.pop(request_id, None)
+            raise ConnectionError("Sin conexión con el servidor")
+        if not request.event.wait(timeout):
+            with self.lock:
+                self.pending.pop(request_id, None)
+            raise TimeoutError(f"El servidor no respondió a '{action}' en {timeout} s")
+        if request.response is None:
+            raise ConnectionError("Se perdió la conexión con el servidor antes de la respuesta")
+        return request.response
+
+    def process_text(self, text):
+        return self.request("process_text", text=text)
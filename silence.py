@@ -0,0 +1,107 @@
+# silence.py
+
+import math
+import numpy as np
+
+MAX_AMPLITUDE = 32768  # int16, igual que AudioSegment.max_possible_amplitude
+SILENCE_OFFSET_DB = 16  # silence_thresh = dBFS de la grabación - 16
+MIN_SILENCE_LEN = 500  # ms
+VOICED_PROPORTION = 0.3  # Más del 30% del audio no silencioso se considera voz
+
+
+def _samples(audio):
+    if isinstance(audio, np.ndarray):
+        return audio.astype(np.int16, copy=False)
+    return np.frombuffer(audio, dtype=np.int16)
+
+
+def dbfs(audio):
+    """
+    dBFS del audio como AudioSegment.dBFS (RMS entero, igual que audioop.rms).
+    """
+    samples = _samples(audio)
+    if not samples.size:
+        return -math.inf
+    rms = int(math.sqrt(np.dot(samples.astype(np.int64), samples.astype(np.int64)) / samples.size))
+    if not rms:
+        return -math.inf
+    return 20 * math.log10(rms / MAX_AMPLITUDE)
+
+
+def detect_silence(audio, sample_rate, min_silence_len=MIN_SILENCE_LEN, silence_thresh=-16, seek_step=1):
+    """
+    Equivalente vectorizado de pydub.silence.detect_silence para PCM int16 mono.
+
+    Con la suma acumulada de los cuadrados, el RMS de cada ventana de min_silence_len ms
+    sale de una resta, sin recorrer el audio por cada milisegundo.
+    """
+    samples = _samples(audio)
+    per_ms = sample_rate // 1000
+    seg_len = round(1000 * samples.size / sample_rate)
+    if seg_len < min_silence_len:
+        return []
+
+    # AudioSegment rellena con ceros hasta la duración redondeada en ms
+    padded = np.zeros(seg_len * per_ms, dtype=np.int64)
+    count = min(samples.size, padded.size)
+    padded[:count] = samples[:count]
+    cumulative = np.concatenate(([0], np.cumsum(padded * padded)))
+
+    last_slice_start = seg_len - min_silence_len
+    starts = np.arange(0, last_slice_start + 1, seek_step)
+    if last_slice_start % seek_step:
+        starts = np.append(starts, last_slice_start)
+
+    window = min_silence_len * per_ms
+    sums = cumulative[starts * per_ms + window] - cumulative[starts * per_ms]
+    # audioop.rms trunca el resultado a entero
+    rms = np.floor(np.sqrt(sums / window))
+    threshold = 10 ** (silence_thresh / 20) * MAX_AMPLITUDE
+    silence_starts = starts[rms <= threshold]
+    if not silence_starts.size:
+        return []
+
+    # Dos inicios pertenecen al mismo rango salvo que no sean consecutivos y además haya hueco
+    gaps = np.diff(silence_starts)
+    breaks = np.flatnonzero((gaps != seek_step) & (gaps > min_silence_len))
+    range_starts = np.concatenate(([silence_starts[0]], silence_starts[breaks + 1]))
+    range_ends = np.concatenate((silence_starts[breaks], [silence_starts[-1]])) + min_silence_len
+    return [[int(start), int(end)] for start, end in zip(range_starts, range_ends)]
+
+
+def detect_nonsilent(audio, sample_rate, min_silence_len=MIN_SILENCE_LEN, silence_thresh=-16, seek_step=1):
+    """
+    Equivalente vectorizado de pydub.silence.detect_nonsilent; rangos en milisegundos.
+    """
+    silent_ranges = detect_silence(audio, sample_rate, min_silence_len, silence_thresh, seek_step)
+    len_seg = round(1000 * _samples(audio).size / sample_rate)
+
+    if not silent_ranges:
+        return [[0, len_seg]]
+    if silent_ranges[0][0] == 0 and silent_ranges[0][1] == len_seg:
+        return []
+
+    prev_end = 0
+    nonsilent_ranges = []
+    for start, end in silent_ranges:
+        nonsilent_ranges.append([prev_end, start])
+        prev_end = end
+    if end != len_seg:
+        nonsilent_ranges.append([prev_end, len_seg])
+    if nonsilent_ranges[0] == [0, 0]:
+        nonsilent_ranges.pop(0)
+    return nonsilent_ranges
+
+
+def analyze(audio, sample_rate, min_silence_len=MIN_SILENCE_LEN, offset_db=SILENCE_OFFSET_DB):
+    """
+    Analiza una grabación con los umbrales de Transcriber.listen_for_command.
+    Devuelve (rangos no silenciosos, proporción no silenciosa).
+    """
+    samples = _samples(audio)
+    total_duration = round(1000 * samples.size / sample_rate)
+    if not total_duration:
+        return [], 0.0
+    nonsilent_ranges = detect_nonsilent(samples, sample_rate, min_silence_len, dbfs(samples) - offset_db)
+    total_nonsilent_duration = sum(end - start for start, end in nonsilent_ranges)
+    return nonsilent_ranges, total_nonsilent_duration / total_duration
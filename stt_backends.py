@@ -0,0 +1,229 @@
+# stt_backends.py
+
+import os
+import time
+import numpy as np
+import speech_recognition as sr
+import audio_codec
+from reconnect import Backoff
+
+try:
+    # Motor local opcional (pip install faster-whisper); no está en requirements.txt
+    # porque no hay ruedas para todas las placas
+    from faster_whisper import WhisperModel
+except ImportError:
+    WhisperModel = None
+
+# La configuración (GROQ_API_KEY, GROQ_AUDIO_FORMAT, WHISPER_*) se lee al crear cada
+# backend y no al importar: transcriber.py carga el .env después de sus imports
+GROQ_URL = 'https://api.groq.com/openai/v1/audio/transcriptions'
+
+LATENCY_ALPHA = 0.3  # Peso de la última medición en la media móvil
+UNAVAILABLE_FIRST_DELAY = 5  # Segundos fuera de servicio tras el primer fallo
+UNAVAILABLE_MAX_DELAY = 300
+
+
+class STTBackend:
+    """
+    Interfaz común de los motores de voz a texto.
+
+    Cada backend lleva su propia estadística: una media móvil de segundos de proceso
+    por segundo de audio (con un mínimo de un segundo, porque en clips cortos domina la
+    latencia fija) y, tras un fallo, un periodo fuera de servicio que crece con los
+    fallos seguidos.
+    """
+
+    name = "stt"
+    initial_rate = 1.0  # Estimación antes de la primera medición
+
+    def __init__(self):
+        self.rate = None
+        self.requests = 0
+        self.failures = 0
+        self.unavailable_until = 0.0
+        self.backoff = Backoff(first_delay=UNAVAILABLE_FIRST_DELAY, initial_delay=UNAVAILABLE_FIRST_DELAY * 2,
+                               max_delay=UNAVAILABLE_MAX_DELAY, stable_after=float("inf"))
+
+    def transcribe(self, pcm, sample_rate):
+        """Devuelve el texto del audio PCM int16 mono ('' si no hay voz)."""
+        raise NotImplementedError
+
+    def available(self, now=None):
+        return (now or time.monotonic()) >= self.unavailable_until
+
+    def expected_latency(self, duration):
+        rate = self.initial_rate if self.rate is None else self.rate
+        return rate * max(duration, 1.0)
+
+    def record_success(self, duration, elapsed):
+        rate = elapsed / max(duration, 1.0)
+        self.rate = rate if self.rate is None else self.rate + (rate - self.rate) * LATENCY_ALPHA
+        self.requests += 1
+        self.backoff.reset()
+
+    def record_failure(self):
+        self.failures += 1
+        delay = self.backoff.next_delay()
+        self.unavailable_until = time.monotonic() + delay
+        return delay
+
+
+class GroqBackend(STTBackend):
+    """Whisper en Groq; el audio se codifica en memoria y la sesión HTTP se reutiliza."""
+
+    name = "groq"
+    initial_rate = 0.5
+
+    def __init__(self, session, api_key=None, audio_format=None, language='es'):
+        super().__init__()
+        self.session = session
+        self.api_key = api_key or os.getenv("GROQ_API_KEY")
+        # wav se empaqueta en memoria; flac u opus suben menos bytes pero arrancan ffmpeg en cada petición
+        self.audio_format = audio_format or os.getenv("GROQ_AUDIO_FORMAT", "wav")
+        if not self.api_key:
+            raise ValueError("GROQ_API_KEY no está definida")
+        self.language = language
+
+    def transcribe(self, pcm, sample_rate):
+        encode_start = time.perf_counter()
+        payload, filename, mime = audio_codec.encode(pcm, sample_rate, self.audio_format)
+        encode_time = time.perf_counter() - encode_start
+        files = {
+            'file': (filename, payload, mime)
+        }
+        data = {
+            'model': 'whisper-large-v3-turbo',
+            'temperature': '0',
+            'response_format': 'json',
+            'language': self.language
+        }
+        headers = {
+            'Authorization': f'Bearer {self.api_key}'
+        }
+        upload_start = time.perf_counter()
+        response = self.session.post(GROQ_URL, headers=headers, files=files, data=data)
+        upload_time = time.perf_counter() - upload_start
+        print(f"Groq: {len(payload)} bytes ({filename}, {len(pcm) * 500 // sample_rate} ms de audio), "
+              f"codificación {encode_time * 1000:.0f} ms, petición {upload_time * 1000:.0f} ms")
+        if response.status_code == 200:
+            return response.json()['text']
+        print(f"Respuesta: {response.text}")
+        raise Exception(f"Error al transcribir el audio: {response.status_code}")
+
+
+class GoogleBackend(STTBackend):
+    """Reconocimiento gratuito de Google a través de speech_recognition."""
+
+    name = "google"
+    initial_rate = 0.8
+
+    def __init__(self, recognizer=None, language='es-ES'):
+        super().__init__()
+        self.recognizer = recognizer or sr.Recognizer()
+        self.language = language
+
+    def transcribe(self, pcm, sample_rate):
+        try:
+            return self.recognizer.recognize_google(sr.AudioData(pcm, sample_rate, 2), language=self.language)
+        except sr.UnknownValueError:
+            return ""
+
+
+class WhisperBackend(STTBackend):
+    """
+    Whisper local en CPU con faster-whisper. El modelo se carga una sola vez (int8 por
+    defecto) y se calienta con un segundo de silencio para que la primera orden no
+    pague la inicialización.
+    """
+
+    name = "whisper"
+    initial_rate = 1.5
+
+    def __init__(self, model_size=None, compute_type=None, threads=None, language='es'):
+        super().__init__()
+        model_size = model_size or os.getenv("WHISPER_MODEL", "base")
+        compute_type = compute_type or os.getenv("WHISPER_COMPUTE_TYPE", "int8")
+        threads = threads or int(os.getenv("WHISPER_THREADS", os.cpu_count() or 4))
+        self.language = language
+        load_start = time.perf_counter()
+        self.model = WhisperModel(model_size, device="cpu", compute_type=compute_type, cpu_threads=threads)
+        self.transcribe(bytes(32000), 16000)
+        print(f"Whisper local '{model_size}' ({compute_type}) listo en {time.perf_counter() - load_start:.1f} s.")
+
+    def transcribe(self, pcm, sample_rate):
+        if sample_rate != 16000:
+            raise ValueError("faster-whisper espera audio a 16 kHz")
+        audio = np.frombuffer(pcm, dtype=np.int16).astype(np.float32) / 32768.0
+        segments, _ = self.model.transcribe(audio, language=self.language, beam_size=1,
+                                            condition_on_previous_text=False)
+        return " ".join(segment.text.strip() for segment in segments)
+
+
+def build_backends(names, session=None, recognizer=None):
+    """
+    Crea una vez cada backend de la lista (p. ej. "groq,whisper"); los que no se
+    pueden crear se omiten con un aviso.
+    """
+    backends = []
+    for name in dict.fromkeys(name.strip().lower() for name in names.split(",") if name.strip()):
+        try:
+            if name == "groq":
+                backends.append(GroqBackend(session))
+            elif name == "google":
+                backends.append(GoogleBackend(recognizer))
+            elif name == "whisper":
+                if WhisperModel is None:
+                    print("faster-whisper no está instalado; se omite el backend local.")
+                    continue
+                backends.append(WhisperBackend())
+            else:
+                print(f"Backend de voz a texto desconocido: {name}")
+        except Exception as e:
+            print(f"No se pudo iniciar el backend {name}: {e}")
+    return backends
+
+
+class STTRouter:
+    """
+    Elige el backend con menor latencia esperada para la duración del audio entre los
+    disponibles; si falla, prueba el siguiente. En caso de empate manda el orden de
+    configuración.
+    """
+
+    def __init__(self, backends):
+        self.backends = list(backends)
+
+    def candidates(self, duration):
+        now = time.monotonic()
+        available = [backend for backend in self.backends if backend.available(now)]
+        if not available:
+            # Todos fuera de servicio: probar igualmente, empezando por el que antes vuelve
+            return sorted(self.backends, key=lambda backend: backend.unavailable_until)
+        return sorted(available, key=lambda backend: backend.expected_latency(duration))
+
+    def transcribe(self, pcm, sample_rate):
+        if not self.backends:
+            raise Exception("No hay ningún backend de voz a texto disponible")
+        duration = len(pcm) / (sample_rate * 2)
+        last_error = None
+        for backend in self.candidates(duration):
+            start = time.perf_counter()
+            try:
+                text = backend.transcribe(pcm, sample_rate)
+            except Exception as e:
+                delay = backend.record_failure()
+                print(f"Fallo en {backend.name} ({e}); fuera de servicio {delay:.0f} s.")
+                last_error = e
+                continue
+            elapsed = time.perf_counter() - start
+            backend.record_success(duration, elapsed)
+            print(f"Transcripción ({backend.name}, {elapsed * 1000:.0f} ms para {duration:.1f} s): {text}")
+            return text
+        raise last_error
+
+    def describe(self):
+        return ", ".join(
+            f"{backend.name}: {backend.expected_latency(1.0):.2f} s/s"
+            + ("" if backend.available() else " (fuera de servicio)")
+            for backend in self.backends
+        )
@@ -0,0 +1,9 @@
+# Los módulos del proyecto están en la raíz del repositorio
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Configuración que algunos módulos leen al importarse: sin tocar los archivos del servicio
+os.environ.setdefault("API_KEY", "test")
+os.environ.setdefault("EVENT_LISTENER_LOG", os.devnull)
@@ -0,0 +1,31 @@
+import io
+import wave
+
+import audio_codec
+
+
+def no_subprocess(*args, **kwargs):
+    raise AssertionError("WAV no debe arrancar ffmpeg")
+
+
+def test_wav_is_encoded_in_process(monkeypatch):
+    monkeypatch.setattr(audio_codec.subprocess, "run", no_subprocess)
+    pcm = b"\1\2" * 1600
+    data, filename, mime = audio_codec.encode(pcm, 16000)
+    assert (filename, mime) == ("audio.wav", "audio/wav")
+    with wave.open(io.BytesIO(data)) as wav:
+        assert (wav.getframerate(), wav.getnchannels(), wav.getsampwidth()) == (16000, 1, 2)
+        assert wav.readframes(wav.getnframes()) == pcm
+
+
+def test_unknown_format_uses_wav(monkeypatch):
+    monkeypatch.setattr(audio_codec.subprocess, "run", no_subprocess)
+    assert audio_codec.encode(b"\0\0", 16000, "mp3")[1] == "audio.wav"
+
+
+def test_compressed_format_falls_back_to_wav(monkeypatch):
+    def missing_ffmpeg(*args, **kwargs):
+        raise FileNotFoundError("ffmpeg")
+
+    monkeypatch.setattr(audio_codec.subprocess, "run", missing_ffmpeg)
+    assert audio_codec.encode(b"\0\0", 16000, "flac")[1:] == ("audio.wav", "audio/wav")
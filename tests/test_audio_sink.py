@@ -0,0 +1,63 @@
+import os
+import wave
+
+import pytest
+
+pytest.importorskip("pyaudio")
+
+from audio_sink import AudioSink
+
+
+def queued(sink, *sizes):
+    return [sink.play(b"\1\0" * size, name=f"clip{index}") for index, size in enumerate(sizes)]
+
+
+def test_interrupt_without_flush_keeps_a_clip_that_has_not_started():
+    sink = AudioSink()
+    clips = queued(sink, 100, 100)
+    assert sink.interrupt(flush=False) == (False, 0)
+    assert list(sink.clips) == clips
+    assert not clips[0].interrupted
+
+
+def test_interrupt_without_flush_cuts_only_the_clip_playing():
+    sink = AudioSink()
+    clips = queued(sink, 100, 100, 100)
+    sink._callback(None, 10, None, None)
+    assert sink.interrupt(flush=False) == (True, 0)
+    assert clips[0].interrupted
+    assert list(sink.clips) == clips[1:]
+
+
+def test_interrupt_with_flush_counts_clips_that_never_started():
+    sink = AudioSink()
+    clips = queued(sink, 100, 100, 100)
+    sink._callback(None, 10, None, None)
+    assert sink.interrupt(flush=True) == (True, 2)
+    assert not sink.clips
+    assert all(clip.interrupted for clip in clips)
+
+
+def test_callback_plays_clips_back_to_back():
+    sink = AudioSink()
+    first, second = queued(sink, 3, 5)
+    out, _ = sink._callback(None, 6, None, None)
+    assert out == b"\1\0" * 6
+    assert first.offset == len(first.data) and first.started is not None
+    assert second.offset == 6
+    out, _ = sink._callback(None, 4, None, None)
+    assert out == b"\1\0" * 2 + b"\0\0" * 2
+
+
+def test_decode_resamples_and_uses_the_cache(tmp_path):
+    path = str(tmp_path / "aviso.wav")
+    with wave.open(path, "wb") as wav:
+        wav.setnchannels(1)
+        wav.setsampwidth(2)
+        wav.setframerate(16000)
+        wav.writeframes(b"\0\1" * 16000)
+    sink = AudioSink(sample_rate=24000)
+    pcm = sink.decode(path)
+    assert abs(len(pcm) - 24000 * 2) <= 2 * 32
+    sink.cache[os.path.abspath(path)] = b"precargado"
+    assert sink.decode(path) == b"precargado"
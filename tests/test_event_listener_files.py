@@ -0,0 +1,105 @@
+import asyncio
+
+import pytest
+
+import event_listener
+
+
+@pytest.fixture
+def listener(tmp_path, monkeypatch):
+    monkeypatch.setenv("PRINT_HISTORY_PATH", str(tmp_path / "print_history.db"))
+    monkeypatch.setattr(event_listener, "OUTBOX_PATH", str(tmp_path / "outbox.db"))
+    monkeypatch.setattr(event_listener, "FILE_BATCH_WINDOW", 0.05)
+    listener = event_listener.EventListener()
+    listener.file_set = {"a.gcode", "b.gcode"}
+    listener.remote_files = ["a.gcode", "b.gcode"]
+    listener.resyncs = 0
+    listener.notifications = []
+
+    async def get_file_list():
+        listener.resyncs += 1
+        return list(listener.remote_files)
+
+    monkeypatch.setattr(listener, "get_file_list", get_file_list)
+    monkeypatch.setattr(listener, "add_notification",
+                        lambda message, category=None, priority=None: listener.notifications.append(message))
+    yield listener
+    listener.history.close()
+    listener.outbox.close()
+
+
+def apply(listener, *changes):
+    async def scenario():
+        for change in changes:
+            await listener.on_filelist_changed(change)
+        if listener.file_batch_task:
+            await listener.file_batch_task
+
+    asyncio.run(scenario())
+    return listener.notifications
+
+
+def change(action, path, root="gcodes", source_path=None, source_root="gcodes"):
+    change = {"action": action, "item": {"path": path, "root": root}}
+    if source_path:
+        change["source_item"] = {"path": source_path, "root": source_root}
+    return change
+
+
+def test_other_roots_are_ignored(listener):
+    notifications = apply(listener,
+                          change("create_file", "printer-20240101_120000.cfg", root="config"),
+                          change("delete_file", "moonraker.log", root="logs"),
+                          change("create_dir", "backups", root="config"))
+    assert notifications == []
+    assert listener.resyncs == 0
+    assert listener.file_set == {"a.gcode", "b.gcode"}
+
+
+def test_single_changes_are_announced_by_name(listener):
+    assert apply(listener, change("create_file", "c.gcode")) == ["Se ha agregado un nuevo archivo a mainsail: c"]
+    listener.notifications.clear()
+    assert apply(listener, change("delete_file", "a.gcode")) == ["Se ha eliminado un archivo de mainsail: a"]
+    assert listener.file_set == {"b.gcode", "c.gcode"}
+    assert listener.resyncs == 0
+
+
+def test_changes_in_the_window_are_batched(listener):
+    notifications = apply(listener,
+                          change("create_file", "c.gcode"),
+                          change("create_file", "d.gcode"),
+                          change("create_file", "c.gcode"),  # Repetido: ya está en la lista
+                          change("delete_file", "a.gcode"),
+                          change("delete_file", "b.gcode"))
+    assert notifications == ["Se han agregado 2 archivos nuevos a mainsail.",
+                             "Se han eliminado 2 archivos de mainsail."]
+
+
+def test_moves_between_roots(listener):
+    notifications = apply(listener, change("move_file", "c.gcode", source_path="a.gcode"))
+    assert notifications == ["Se ha renombrado un archivo de mainsail: a a c"]
+    listener.notifications.clear()
+
+    notifications = apply(listener,
+                          change("move_file", "old/c.gcode", root="config", source_path="c.gcode"),
+                          change("move_file", "d.gcode", source_path="d.gcode", source_root="config"))
+    assert notifications == ["Se ha agregado un nuevo archivo a mainsail: d",
+                             "Se ha eliminado un archivo de mainsail: c"]
+    assert listener.file_set == {"b.gcode", "d.gcode"}
+    assert listener.resyncs == 0
+
+
+def test_inconsistencies_resync_the_list(listener):
+    listener.remote_files = ["b.gcode", "x.gcode"]
+    notifications = apply(listener, change("delete_file", "unknown.gcode"))
+    assert listener.resyncs == 1
+    assert listener.file_set == {"b.gcode", "x.gcode"}
+    assert notifications == ["Se ha agregado un nuevo archivo a mainsail: x",
+                             "Se ha eliminado un archivo de mainsail: a"]
+
+
+def test_directory_changes_resync_the_list(listener):
+    listener.remote_files = ["a.gcode", "b.gcode", "dir/c.gcode", "dir/d.gcode"]
+    notifications = apply(listener, change("move_dir", "dir", source_path="dir", source_root="config"))
+    assert listener.resyncs == 1
+    assert notifications == ["Se han agregado 2 archivos nuevos a mainsail."]
@@ -0,0 +1,125 @@
+import os
+
+import pytest
+
+from klippy_stats import KlippyStats, StatsColumns, parse_stats_line
+
+THRESHOLDS = [
+    ("mcu_awake", 0.5, "above", "MCU {name} cargada"),
+    ("memavail_mb", 50, "below", "Poca memoria"),
+]
+
+
+def stats_line(eventtime, awake=0.01, written=1000, retransmit=0, sysload=0.5, memavail=400000, pwm=0.4):
+    return (f"Stats {eventtime:.1f}: gcodein=0  mcu: mcu_awake={awake} bytes_write={written} "
+            f"bytes_retransmit={retransmit} heater_bed: target=60 temp=59.8 pwm={pwm} sysload={sysload} "
+            f"cputime={eventtime / 10} memavail={memavail} print_time=1.0\n")
+
+
+def append(path, text):
+    with open(path, "a", encoding="utf-8") as f:
+        f.write(text)
+
+
+def test_parse_stats_line_prefixes_sections_but_not_host_keys():
+    eventtime, values = parse_stats_line(stats_line(12.0).strip().encode())
+    assert eventtime == 12.0
+    assert values["mcu.mcu_awake"] == 0.01
+    assert values["heater_bed.pwm"] == 0.4
+    assert values["sysload"] == 0.5
+    assert "heater_bed.sysload" not in values
+    assert parse_stats_line(b"Receive: 12 ok") is None
+    assert parse_stats_line(b"Stats abc: sysload=1") is None
+
+
+def test_columns_window_keeps_order_and_wraps():
+    store = StatsColumns(capacity=3)
+    for second in range(5):
+        store.append(float(second), {"sysload": second * 1.0})
+    assert store.count == 3
+    assert store.window("sysload", 10) == [(2.0, 2.0), (3.0, 3.0), (4.0, 4.0)]
+    assert store.window("sysload", 1) == [(3.0, 3.0), (4.0, 4.0)]
+    assert store.window("missing", 10) == []
+
+
+def test_partial_line_is_read_once_completed(tmp_path):
+    path = tmp_path / "klippy.log"
+    append(path, "Starting Klippy...\n" + stats_line(1.0) + "Receive: 99 ok\n" + stats_line(2.0))
+    stats = KlippyStats(str(path), thresholds=THRESHOLDS)
+    assert stats.update() == 2
+
+    line = stats_line(3.0)
+    append(path, line[:30])
+    assert stats.update() == 0
+    append(path, line[30:])
+    assert stats.update() == 1
+    assert stats.update() == 0
+    assert stats.store.last_time() == 3.0
+
+
+def test_truncation_and_rotation_read_from_start(tmp_path):
+    path = tmp_path / "klippy.log"
+    append(path, "".join(stats_line(float(second)) for second in range(1, 6)))
+    stats = KlippyStats(str(path), thresholds=THRESHOLDS)
+    assert stats.update() == 5
+
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(stats_line(1.0))
+    assert stats.update() == 1
+    # El reloj volvió atrás: las muestras anteriores se descartan
+    assert stats.store.count == 1
+
+    os.rename(path, tmp_path / "klippy.log.1")
+    append(path, stats_line(2.0) + stats_line(3.0))
+    assert stats.update() == 2
+    assert stats.store.count == 3
+
+
+def test_initial_read_only_parses_the_tail(tmp_path):
+    path = tmp_path / "klippy.log"
+    append(path, "".join(stats_line(float(second)) for second in range(1, 101)))
+    stats = KlippyStats(str(path), initial_tail_bytes=len(stats_line(100.0)) * 3, thresholds=THRESHOLDS)
+    added = stats.update()
+    assert 2 <= added <= 3
+    assert stats.store.last_time() == 100.0
+
+
+def test_aggregates_handle_counter_reset(tmp_path):
+    path = tmp_path / "klippy.log"
+    lines = [
+        stats_line(1.0, written=1000, retransmit=0, sysload=1.0, memavail=102400),
+        stats_line(2.0, written=2000, retransmit=10, sysload=3.0, memavail=102400),
+        stats_line(3.0, written=500, retransmit=5, sysload=2.0, memavail=51200),
+    ]
+    append(path, "".join(lines))
+    stats = KlippyStats(str(path), thresholds=THRESHOLDS)
+    stats.update()
+    aggregates = stats.aggregates(window=60)
+    mcu = aggregates["mcus"]["mcu"]
+    # 1000 bytes y luego el contador se reinicia: 500 más
+    assert mcu["retransmit_bytes"] == 15
+    assert mcu["retransmit_ratio"] == 15 / 1500
+    assert aggregates["host"]["sysload"] == 2.0
+    assert aggregates["host"]["sysload_max"] == 3.0
+    assert aggregates["host"]["memavail_mb"] == 50
+    assert aggregates["heaters"]["heater_bed"]["pwm"] == pytest.approx(0.4)
+
+
+def test_thresholds_alert_once_and_rearm_with_hysteresis(tmp_path):
+    path = tmp_path / "klippy.log"
+    stats = KlippyStats(str(path), thresholds=THRESHOLDS)
+
+    def sample(eventtime, awake):
+        append(path, stats_line(eventtime, awake=awake))
+        stats.update()
+        return stats.check_thresholds(window=0)
+
+    append(path, "")
+    assert sample(1.0, 0.1) == []
+    assert sample(2.0, 0.7) == ["MCU mcu cargada"]
+    assert sample(3.0, 0.8) == []
+    # Por debajo del umbral pero dentro del margen: no se rearma
+    assert sample(4.0, 0.45) == []
+    assert sample(5.0, 0.7) == []
+    assert sample(6.0, 0.3) == []
+    assert sample(7.0, 0.7) == ["MCU mcu cargada"]
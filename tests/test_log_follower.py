@@ -0,0 +1,85 @@
+import os
+import asyncio
+
+from log_follower import LogFollower
+
+PATTERNS = {"shutdown": r"MCU '(\w+)' shutdown", "restart": r"Restarting printer"}
+
+
+def follower_for(path):
+    matches = []
+    follower = LogFollower(str(path), PATTERNS, lambda name, match, line: matches.append((name, line)))
+    return follower, matches
+
+
+def append(path, text):
+    with open(path, "a", encoding="utf-8") as f:
+        f.write(text)
+
+
+def test_reads_only_new_lines(tmp_path):
+    path = tmp_path / "klippy.log"
+    append(path, "MCU 'mcu' shutdown: antiguo\n")
+    follower, matches = follower_for(path)
+    follower._open(from_end=True)
+    append(path, "Stats 1.0: sysload=0.1\nMCU 'mcu' shutdown: Timer too close\n")
+    follower._check(rotated=False)
+    assert matches == [("shutdown", "MCU 'mcu' shutdown: Timer too close")]
+    follower.stop()
+
+
+def test_partial_line_waits_for_newline(tmp_path):
+    path = tmp_path / "klippy.log"
+    append(path, "")
+    follower, matches = follower_for(path)
+    follower._open(from_end=True)
+    append(path, "Restarting pri")
+    follower._check(rotated=False)
+    assert matches == []
+    append(path, "nter\n")
+    follower._check(rotated=False)
+    assert matches == [("restart", "Restarting printer")]
+    follower.stop()
+
+
+def test_rotation_finishes_old_file_then_follows_new(tmp_path):
+    path = tmp_path / "klippy.log"
+    append(path, "")
+    follower, matches = follower_for(path)
+    follower._open(from_end=True)
+    append(path, "MCU 'mcu' shutdown: antes de rotar\n")
+    os.rename(path, tmp_path / "klippy.log.1")
+    append(path, "Restarting printer\n")
+    follower._check(rotated=True)
+    assert [name for name, _ in matches] == ["shutdown", "restart"]
+    follower.stop()
+
+
+def test_truncation_reads_from_start(tmp_path):
+    path = tmp_path / "klippy.log"
+    append(path, "x" * 100 + "\n")
+    follower, matches = follower_for(path)
+    follower._open(from_end=True)
+    with open(path, "w", encoding="utf-8") as f:
+        f.write("Restarting printer\n")
+    follower._check(rotated=False)
+    assert matches == [("restart", "Restarting printer")]
+    follower.stop()
+
+
+def test_start_follows_with_event_loop(tmp_path):
+    path = tmp_path / "klippy.log"
+    append(path, "")
+    follower, matches = follower_for(path)
+
+    async def scenario():
+        follower.start()
+        append(path, "MCU 'ebb' shutdown: Lost communication\n")
+        for _ in range(40):
+            if matches:
+                break
+            await asyncio.sleep(0.05)
+        follower.stop()
+
+    asyncio.run(scenario())
+    assert matches == [("shutdown", "MCU 'ebb' shutdown: Lost communication")]
@@ -0,0 +1,64 @@
+import os
+import sys
+import importlib.util
+
+import pytest
+
+from metrics import REGISTRY, Counter, Gauge, Histogram, Registry
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def load_as(name, filename):
+    """Ejecuta el módulo con otro nombre, como hace uvicorn con __main__ y __mp_main__."""
+    spec = importlib.util.spec_from_file_location(name, os.path.join(ROOT, filename))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def test_repeated_metric_shares_values():
+    registry = Registry()
+    first = Counter("test_total", "Prueba.", labels=("reason",), registry=registry)
+    first.inc(reason="a")
+    second = Counter("test_total", "Prueba.", labels=("reason",), registry=registry)
+    second.inc(reason="a")
+    assert first.get(reason="a") == second.get(reason="a") == 2
+    assert registry.render().count("# TYPE test_total counter") == 1
+
+
+def test_repeated_gauge_reads_the_latest_function():
+    registry = Registry()
+    Gauge("test_connections", "Prueba.", registry=registry, function=lambda: 1)
+    Gauge("test_connections", "Prueba.", registry=registry, function=lambda: 2)
+    assert "test_connections 2" in registry.render()
+
+
+def test_conflicting_definition_is_rejected():
+    registry = Registry()
+    Histogram("test_seconds", "Prueba.", registry=registry)
+    with pytest.raises(ValueError):
+        Counter("test_seconds", "Prueba.", registry=registry)
+    with pytest.raises(ValueError):
+        Histogram("test_seconds", "Prueba.", registry=registry, buckets=(1, 2))
+    with pytest.raises(ValueError):
+        Histogram("test_seconds", "Prueba.", labels=("stage",), registry=registry)
+
+
+def test_module_imported_twice():
+    import recognition_pool
+    again = load_as("__mp_main__", "recognition_pool.py")
+    before = recognition_pool.RECOGNITION_DROPPED_TOTAL.get(reason="overflow")
+    again.RECOGNITION_DROPPED_TOTAL.inc(reason="overflow")
+    assert recognition_pool.RECOGNITION_DROPPED_TOTAL.get(reason="overflow") == before + 1
+
+
+def test_server_imported_twice(monkeypatch):
+    for dependency in ("fastapi", "uvicorn", "emoji", "openai", "gtts"):
+        pytest.importorskip(dependency)
+    monkeypatch.chdir(ROOT)  # server.py monta la carpeta static relativa al directorio actual
+    monkeypatch.delitem(sys.modules, "server", raising=False)
+    main = load_as("__mp_main__", "server.py")
+    server = importlib.import_module("server")
+    assert server.app is not main.app
+    assert "sayfi_process_text_stage_seconds" in REGISTRY.render()
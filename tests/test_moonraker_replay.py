@@ -0,0 +1,57 @@
+import gzip
+import json
+
+from moonraker_replay import RECORD_FLUSH_ENTRIES, SessionRecorder, load_session
+
+FRAME = json.dumps({"jsonrpc": "2.0", "method": "notify_status_update", "params": [{"print_stats": {"state": "printing"}}]})
+
+
+def test_round_trip_without_close(tmp_path):
+    path = str(tmp_path / "sesion.jsonl.gz")
+    recorder = SessionRecorder(path)
+    recorder.record_http("/printer/info", {"result": {"state": "ready"}})
+    for _ in range(RECORD_FLUSH_ENTRIES + 5):
+        recorder.record_frame(FRAME)
+    recorder.flush()
+    recorder.record_frame(FRAME)
+    recorder.flush()
+    # El proceso termina sin close(): cada volcado ya es un miembro gzip completo
+    frames, http = load_session(path)
+    assert len(frames) == RECORD_FLUSH_ENTRIES + 6
+    assert frames[0][1] == FRAME
+    assert list(http) == ["/printer/info"]
+
+
+def test_truncated_tail_is_ignored(tmp_path):
+    path = tmp_path / "sesion.jsonl.gz"
+    recorder = SessionRecorder(str(path))
+    for _ in range(3):
+        recorder.record_frame(FRAME)
+    recorder.close()
+    tail = gzip.compress((json.dumps({"ws": FRAME, "t": 9.0}) + "\n").encode("utf-8") * 50)
+    with open(path, "ab") as f:
+        f.write(tail[:len(tail) // 2])
+    frames, _ = load_session(str(path))
+    assert 3 <= len(frames) < 53
+    assert all(frame == FRAME for _, frame in frames)
+
+
+def test_recording_without_gzip_trailer(tmp_path):
+    # Grabaciones anteriores: un único stream gzip al que nunca se le escribió el final
+    path = str(tmp_path / "sesion.jsonl.gz")
+    f = gzip.open(path, "at", encoding="utf-8")
+    for second in range(10):
+        f.write(json.dumps({"ws": FRAME, "t": second}) + "\n")
+    f.flush()
+    frames, _ = load_session(path)
+    assert [t for t, _ in frames] == list(range(10))
+    f.close()
+
+
+def test_reopening_appends(tmp_path):
+    path = str(tmp_path / "sesion.jsonl.gz")
+    for _ in range(2):
+        recorder = SessionRecorder(path)
+        recorder.record_frame(FRAME)
+        recorder.close()
+    assert len(load_session(path)[0]) == 2
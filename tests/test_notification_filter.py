@@ -0,0 +1,72 @@
+from notification_filter import NotificationFilter
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+def make_filter(**kwargs):
+    clock = Clock()
+    return NotificationFilter(clock=clock, **kwargs), clock
+
+
+def test_duplicate_within_window_dropped():
+    notifications, clock = make_filter(windows={"print_state": 10}, coalesce_templates={})
+    assert notifications.submit("Impresión pausada", "print_state") == [("print_state", "Impresión pausada")]
+    clock.now += 5
+    # La comparación ignora mayúsculas y espacios de los extremos
+    assert notifications.submit("  impresión PAUSADA ", "print_state") == []
+    clock.now += 6
+    assert notifications.submit("Impresión pausada", "print_state") == [("print_state", "Impresión pausada")]
+
+
+def test_same_message_in_other_category_not_duplicate():
+    notifications, _ = make_filter(coalesce_templates={})
+    assert notifications.submit("listo", "a") == [("a", "listo")]
+    assert notifications.submit("listo", "b") == [("b", "listo")]
+
+
+def test_expired_keys_are_removed():
+    notifications, clock = make_filter(windows={"a": 1, "b": 5}, coalesce_templates={})
+    notifications.submit("uno", "a")
+    notifications.submit("dos", "b")
+    clock.now += 2
+    notifications.submit("tres", "b")
+    assert len(notifications) == 2
+
+
+def test_burst_announces_first_and_summarizes_rest():
+    notifications, clock = make_filter()
+    assert notifications.submit("Estado de Klipper: ready", "klipper_state") == [("klipper_state", "Estado de Klipper: ready")]
+    assert notifications.in_burst("klipper_state")
+    clock.now += 1
+    assert notifications.submit("Estado de Klipper: shutdown", "klipper_state") == []
+    clock.now += 1
+    assert notifications.submit("Estado de Klipper: ready", "klipper_state") == []
+    assert notifications.flush() == []  # La ventana de 15 s sigue abierta
+    clock.now += 15
+    assert notifications.flush() == [("klipper_state", "Estado de Klipper cambió 3 veces. Estado de Klipper: ready")]
+    assert not notifications.in_burst("klipper_state")
+
+
+def test_burst_of_one_has_no_summary():
+    notifications, clock = make_filter()
+    notifications.submit("Estado de la MCU: ready", "mcu_state")
+    clock.now += 20
+    assert notifications.flush() == []
+
+
+def test_summaries_keep_their_own_category():
+    notifications, clock = make_filter()
+    notifications.submit("Estado de la MCU: ready", "mcu_state")
+    notifications.submit("Estado de la MCU: shutdown", "mcu_state")
+    clock.now += 20
+    # Al enviar otro mensaje se entregan antes los resúmenes vencidos, con su categoría
+    assert notifications.submit("Enfriando la cama", "temperature") == [
+        ("mcu_state", "Estado de la MCU cambió 2 veces. Estado de la MCU: shutdown"),
+        ("temperature", "Enfriando la cama"),
+    ]
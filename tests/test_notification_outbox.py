@@ -0,0 +1,87 @@
+import pytest
+
+from notification_outbox import NotificationOutbox, PRIORITY_CRITICAL, PRIORITY_STATE, PRIORITY_INFO
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock():
+    return Clock()
+
+
+@pytest.fixture
+def outbox(tmp_path, clock):
+    box = NotificationOutbox(str(tmp_path / "outbox.db"), clock=clock)
+    yield box
+    box.close()
+
+
+def drain(outbox):
+    messages = []
+    while True:
+        row = outbox.next_pending()
+        if row is None:
+            return messages
+        outbox.ack(row[0])
+        messages.append(row[1])
+
+
+def test_priority_then_arrival_order(outbox):
+    outbox.put("archivo nuevo", "file")
+    outbox.put("impresión pausada", "print_state")
+    outbox.put("error", "error")
+    outbox.put("otro archivo", "file")
+    outbox.put("cama a 60", "temperature", priority=PRIORITY_CRITICAL)
+    assert drain(outbox) == ["error", "cama a 60", "impresión pausada", "archivo nuevo", "otro archivo"]
+
+
+def test_expiry_depends_on_priority(outbox, clock):
+    outbox.put("informativo", "file")  # 120 s
+    outbox.put("estado", "print_state")  # 600 s
+    clock.now += 121
+    assert drain(outbox) == ["estado"]
+
+
+def test_unacked_is_not_delivered_twice_until_requeued(outbox):
+    notification_id = outbox.put("hola")
+    assert outbox.next_pending()[0] == notification_id
+    assert outbox.next_pending() is None
+    assert outbox.pending_count() == 0
+    outbox.requeue(notification_id)
+    assert outbox.next_pending()[1] == "hola"
+
+
+def test_ack_removes(outbox):
+    notification_id = outbox.put("hola")
+    outbox.next_pending()
+    outbox.ack(notification_id)
+    outbox.requeue_sent()
+    assert outbox.next_pending() is None
+
+
+def test_sent_without_ack_survives_restart(tmp_path, clock):
+    path = str(tmp_path / "outbox.db")
+    box = NotificationOutbox(path, clock=clock)
+    box.put("sin confirmar", "error")
+    box.next_pending()
+    box.close()
+    box = NotificationOutbox(path, clock=clock)
+    assert box.next_pending()[1] == "sin confirmar"
+    box.close()
+
+
+def test_limit_drops_lowest_priority_oldest_first(tmp_path, clock):
+    box = NotificationOutbox(str(tmp_path / "outbox.db"), max_entries=3, clock=clock)
+    box.put("info 1", priority=PRIORITY_INFO)
+    box.put("estado", priority=PRIORITY_STATE)
+    box.put("info 2", priority=PRIORITY_INFO)
+    box.put("crítico", priority=PRIORITY_CRITICAL)
+    assert drain(box) == ["crítico", "estado", "info 2"]
+    box.close()
@@ -0,0 +1,89 @@
+import os
+
+import pytest
+
+from notification_rules import RuleEngine
+
+RULES_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "notification_rules.json")
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+def fire(engine, status, flags=None):
+    """Aplica una actualización como on_status_update y devuelve los mensajes."""
+    messages = []
+    for match in engine.apply(status):
+        if not engine.check(match, flags):
+            continue
+        engine.mark_fired(match.rule)
+        messages.append(engine.render(match, flags))
+    return messages
+
+
+@pytest.fixture
+def engine():
+    return RuleEngine.from_file(RULES_PATH, clock=Clock())
+
+
+def test_state_message_announced_with_state_change(engine):
+    engine.seed({"klipper": {"state": "ready", "state_message": "Printer is ready"}})
+    messages = fire(engine, {"klipper": {"state": "shutdown", "state_message": "MCU 'mcu' shutdown: Timer too close"}})
+    assert messages == [
+        "Estado de Klipper: shutdown",
+        "Mensaje de estado: MCU 'mcu' shutdown: Timer too close",
+        "Se ha perdido conexión con la impresora: shutdown",
+    ]
+
+
+def test_stale_state_message_not_repeated(engine):
+    engine.seed({"klipper": {"state": "startup", "state_message": "ok"}})
+    # El mensaje en caché no llega en esta actualización: no se vuelve a anunciar
+    messages = fire(engine, {"klipper": {"state": "shutdown"}})
+    assert "Mensaje de estado: ok" not in messages
+    assert messages == ["Estado de Klipper: shutdown", "Se ha perdido conexión con la impresora: shutdown"]
+
+
+def test_unchanged_state_message_in_snapshot_not_repeated(engine):
+    engine.seed({"klipper": {"state": "ready", "state_message": "ok"}})
+    # Una resincronización trae el estado completo aunque el mensaje no haya cambiado
+    messages = fire(engine, {"klipper": {"state": "error", "state_message": "ok"}})
+    assert messages == ["Estado de Klipper: error", "Se ha perdido conexión con la impresora: error"]
+
+
+def test_print_transitions_use_filename_and_flags(engine):
+    engine.seed({"print_stats": {"state": "standby", "filename": ""}})
+    assert fire(engine, {"print_stats": {"state": "printing", "filename": "benchy.gcode"}}) == ["Se va a imprimir: benchy"]
+    assert fire(engine, {"print_stats": {"state": "paused"}}) == ["La impresión ha sido pausada."]
+    assert fire(engine, {"print_stats": {"state": "weird"}}) == ["Estado de impresión desconocido: weird"]
+
+
+def test_same_value_does_not_fire(engine):
+    engine.seed({"mcu": {"state": "ready"}})
+    assert fire(engine, {"mcu": {"state": "ready"}}) == []
+
+
+def test_listener_flags_gate_temperature_rules(engine):
+    engine.seed({"heater_bed": {"target": 0}})
+    assert fire(engine, {"heater_bed": {"target": 60}}, {"has_started_printing": True}) == []
+    assert fire(engine, {"heater_bed": {"target": 0}}, {"has_started_printing": False}) == ["Enfriando la cama"]
+
+
+def test_cooldown():
+    clock = Clock()
+    engine = RuleEngine([{"id": "x", "field": "a.b", "message": "{value}", "cooldown": 10}], clock=clock)
+    assert fire(engine, {"a": {"b": 1}}) == ["1"]
+    clock.now += 5
+    assert fire(engine, {"a": {"b": 2}}) == []
+    clock.now += 6
+    assert fire(engine, {"a": {"b": 3}}) == ["3"]
+
+
+def test_unknown_operator_rejected():
+    with pytest.raises(ValueError):
+        RuleEngine([{"field": "a.b", "when": {"a.c": {"bogus": 1}}}])
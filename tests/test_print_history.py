@@ -0,0 +1,84 @@
+from datetime import datetime
+
+import pytest
+
+from print_history import HISTORY_PAGE_SIZE, STATUS_IN_PROGRESS, PrintHistory, period_bounds
+
+
+@pytest.fixture
+def history(tmp_path):
+    history = PrintHistory(str(tmp_path / "history" / "print_history.db"))
+    yield history
+    history.close()
+
+
+def moonraker_job(job_id, filename, start_time, status="completed", duration=3600, used=1000, material="PLA"):
+    return {"job_id": job_id, "filename": filename, "status": status, "start_time": start_time,
+            "end_time": start_time + duration, "print_duration": duration, "total_duration": duration,
+            "filament_used": used, "metadata": {"filament_type": material, "filament_weight_total": used / 330}}
+
+
+def test_period_bounds():
+    now = datetime(2024, 3, 13, 15, 30)  # Miércoles
+    since, until = period_bounds("semana", now)
+    assert datetime.fromtimestamp(since) == datetime(2024, 3, 11)
+    assert until == now.timestamp()
+    since, until = period_bounds("mes_pasado", now)
+    assert datetime.fromtimestamp(since) == datetime(2024, 2, 1)
+    assert datetime.fromtimestamp(until) == datetime(2024, 3, 1)
+    with pytest.raises(ValueError):
+        period_bounds("siglo", now)
+
+
+def test_local_jobs_are_replaced_by_moonraker(history):
+    history.record_start("benchy.gcode", start_time=1000)
+    # Al reanudar una pausa no se crea otro trabajo
+    history.record_start("benchy.gcode", start_time=1500)
+    history.record_end("benchy.gcode", "completed", end_time=4600)
+    assert history.totals(0, 10000)["jobs"] == 1
+    assert history.totals(0, 10000)["print_hours"] == 1.0
+
+    history.upsert_jobs([moonraker_job("0001", "benchy.gcode", 1030, material="petg; pla")])
+    assert history.totals(0, 10000)["jobs"] == 1
+    assert history.by_filament_type(0, 10000) == {"PETG": {"jobs": 1, "filament_mm": 1000, "filament_g": 1000 / 330}}
+
+
+def test_upsert_updates_job_in_progress(history):
+    history.upsert_jobs([moonraker_job("0001", "a.gcode", 1000, status=STATUS_IN_PROGRESS, duration=0, used=0)])
+    history.upsert_jobs([moonraker_job("0001", "a.gcode", 1000, status="cancelled", duration=600, used=200)])
+    assert history.by_status(0, 10000) == {"cancelled": 1}
+    assert history.totals(0, 10000, status="cancelled")["filament_mm"] == 200
+
+
+def test_sync_cursor_and_paging(history):
+    assert history.sync_cursor() == 0.0
+    history.upsert_jobs([moonraker_job("0001", "a.gcode", 1000),
+                         moonraker_job("0002", "b.gcode", 2000, status=STATUS_IN_PROGRESS),
+                         moonraker_job("0003", "c.gcode", 3000)])
+    # Se vuelve a pedir desde el trabajo que seguía en curso
+    assert history.sync_cursor() == 1999
+
+    pages = []
+    jobs = [moonraker_job(f"{i:04d}", "d.gcode", 5000 + i) for i in range(HISTORY_PAGE_SIZE + 3)]
+
+    def fetch_page(start, since):
+        pages.append((start, since))
+        return jobs[start:start + HISTORY_PAGE_SIZE]
+
+    assert history.sync(fetch_page) == HISTORY_PAGE_SIZE + 3
+    assert pages == [(0, 1999), (HISTORY_PAGE_SIZE, 1999)]
+
+
+def test_aggregates_and_top_files(history):
+    history.upsert_jobs([moonraker_job("0001", "a.gcode", 1000),
+                         moonraker_job("0002", "a.gcode", 2000, status="error", duration=1800),
+                         moonraker_job("0003", "b.gcode", 3000, material="ABS", used=3000),
+                         moonraker_job("0004", "c.gcode", 9000)])
+    totals = history.totals(0, 5000, filament_type="pla")
+    assert totals["jobs"] == 2
+    assert totals["print_hours"] == 1.5
+    assert history.by_status(0, 5000) == {"completed": 2, "error": 1}
+    assert list(history.by_filament_type(0, 5000)) == ["ABS", "PLA"]
+    assert history.top_files(0, 5000, limit=1) == [("a.gcode", 2, 5400)]
+    assert history.last_job() == ("c.gcode", "completed", 9000, 3600)
+    assert history.last_job("b.gcode")[0] == "b.gcode"
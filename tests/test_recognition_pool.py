@@ -0,0 +1,90 @@
+import time
+import threading
+
+from recognition_pool import RECOGNITION_DROPPED_TOTAL, RecognitionPool
+
+
+def dropped(reason):
+    return RECOGNITION_DROPPED_TOTAL.get(reason=reason)
+
+
+def keyword(audio):
+    return "Asistente" if "asistente" in audio else None
+
+
+def test_detections_keep_segment_key():
+    pool = RecognitionPool(keyword, workers=1)
+    pool.start()
+    assert pool.submit("ruido", key=1)
+    assert pool.submit("oye asistente", key=2)
+    detection = pool.poll(timeout=2)
+    assert (detection.result, detection.key) == ("Asistente", 2)
+    assert pool.poll(timeout=0.1) is None
+    assert not pool.has_detection()
+
+
+def test_duplicate_keys_are_ignored():
+    before = dropped("duplicate")
+    pool = RecognitionPool(keyword, workers=1)
+    assert pool.submit("asistente", key=10)
+    assert not pool.submit("asistente", key=10)
+    assert len(pool.pending) == 1
+    assert dropped("duplicate") == before + 1
+
+
+def test_overflow_drops_oldest():
+    before = dropped("overflow")
+    pool = RecognitionPool(keyword, workers=1, max_pending=3)
+    for key in range(5):
+        pool.submit(f"segmento {key}", key)
+    assert [segment.key for segment in pool.pending] == [2, 3, 4]
+    assert dropped("overflow") == before + 2
+
+
+def test_stale_segments_are_not_recognized():
+    before = dropped("stale")
+    seen = []
+    pool = RecognitionPool(lambda audio: seen.append(audio) or keyword(audio), workers=1, max_age=5)
+    pool.submit("asistente viejo", key=1)
+    pool.pending[0].captured -= 10
+    pool.submit("asistente", key=2)
+    pool.start()
+    assert pool.poll(timeout=2).key == 2
+    assert seen == ["asistente"]
+    assert dropped("stale") == before + 1
+
+
+def test_clear_discards_pending_detections_and_results_in_flight():
+    started = threading.Event()
+    release = threading.Event()
+
+    def slow(audio):
+        if audio.startswith("lento"):
+            started.set()
+            release.wait(2)
+        return keyword(audio)
+
+    pool = RecognitionPool(slow, workers=1)
+    pool.start()
+    pool.submit("asistente", key=1)
+    assert pool.poll(timeout=2).key == 1
+
+    pool.submit("asistente", key=2)
+    for _ in range(200):
+        if pool.has_detection():
+            break
+        time.sleep(0.01)
+    assert pool.has_detection()
+    pool.submit("lento asistente", key=3)
+    pool.submit("asistente", key=4)
+    assert started.wait(2)
+    before = dropped("stale")
+    pool.clear()
+    assert not pool.has_detection()
+    assert not pool.pending
+    release.set()
+
+    # El resultado del segmento en curso pertenece a la época anterior
+    pool.submit("asistente", key=5)
+    assert pool.poll(timeout=2).key == 5
+    assert dropped("stale") == before + 1
@@ -0,0 +1,48 @@
+import asyncio
+
+from reconnect import Backoff
+
+
+class Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_fast_first_retry_then_exponential_capped():
+    backoff = Backoff(first_delay=0.5, initial_delay=1, max_delay=8, factor=2, jitter=0, rng=lambda: 0.0)
+    assert [backoff.next_delay() for _ in range(7)] == [0.5, 1, 2, 4, 8, 8, 8]
+
+
+def test_jitter_stays_within_range():
+    backoff = Backoff(first_delay=0.5, initial_delay=4, jitter=0.5, rng=lambda: 1.0)
+    backoff.next_delay()
+    assert backoff.next_delay() == 2.0  # 4 * (1 - 0.5)
+
+
+def test_stable_connection_restarts_sequence():
+    clock = Clock()
+    backoff = Backoff(first_delay=0.5, initial_delay=1, jitter=0, stable_after=30, clock=clock)
+    backoff.next_delay()
+    backoff.next_delay()
+    backoff.connected()
+    clock.now += 10
+    assert backoff.next_delay() == 2  # Conexión breve: la espera sigue creciendo
+    backoff.connected()
+    clock.now += 30
+    assert backoff.next_delay() == 0.5
+
+
+def test_reset():
+    backoff = Backoff(jitter=0)
+    backoff.next_delay()
+    backoff.next_delay()
+    backoff.reset()
+    assert backoff.next_delay() == backoff.first_delay
+
+
+def test_wait_sleeps_next_delay():
+    backoff = Backoff(first_delay=0.01)
+    assert asyncio.run(backoff.wait()) == 0.01
@@ -0,0 +1,78 @@
+import asyncio
+import threading
+
+from request_acks import RequestAcks
+
+
+class Client:
+    def __init__(self, fail=False):
+        self.sent = []
+        self.fail = fail
+
+    async def send(self, data):
+        if self.fail:
+            raise ConnectionError("cliente desconectado")
+        self.sent.append((data["ack"], data["id"]))
+
+
+def run(scenario):
+    return asyncio.run(scenario())
+
+
+def test_played_from_the_playback_thread_waits_for_processed():
+    client = Client()
+
+    async def scenario():
+        acks = RequestAcks(client.send, "r1")
+        # Un audio corto termina mientras todavía se envía la respuesta
+        thread = threading.Thread(target=acks.on_played)
+        thread.start()
+        thread.join()
+        await asyncio.sleep(0.05)
+        assert client.sent == []
+        await acks.processed()
+        await asyncio.sleep(0.05)
+
+    run(scenario)
+    assert client.sent == [("processed", "r1"), ("played", "r1")]
+
+
+def test_without_audio_both_acks_are_sent_once():
+    client = Client()
+
+    async def scenario():
+        acks = RequestAcks(client.send, "r2")
+        await acks.processed(played=True)
+        acks.on_played()
+        await asyncio.sleep(0.05)
+
+    run(scenario)
+    assert client.sent == [("processed", "r2"), ("played", "r2")]
+
+
+def test_requests_are_acknowledged_independently():
+    client = Client()
+
+    async def scenario():
+        first = RequestAcks(client.send, "a")
+        second = RequestAcks(client.send, "b")
+        await first.processed()
+        await second.processed()
+        second.on_played()
+        await asyncio.sleep(0.05)
+        first.on_played()
+        await asyncio.sleep(0.05)
+
+    run(scenario)
+    assert client.sent == [("processed", "a"), ("processed", "b"), ("played", "b"), ("played", "a")]
+
+
+def test_send_errors_are_not_raised():
+    client = Client(fail=True)
+
+    async def scenario():
+        acks = RequestAcks(client.send, "r3")
+        await acks.processed(played=True)
+        return acks.played_sent
+
+    assert run(scenario)
@@ -0,0 +1,80 @@
+import json
+import threading
+
+import pytest
+from websockets.sync.server import serve
+
+from server_session import PendingRequest, ServerSession
+
+
+@pytest.fixture
+def server():
+    """Servidor /ws mínimo: acusa process_text, intercala un aviso y responde con el mismo id."""
+    received = []
+
+    def handler(ws):
+        for message in ws:
+            data = json.loads(message)
+            received.append(data)
+            if data.get("action") == "process_text":
+                if data["text"] == "colgar":
+                    ws.close()
+                    return
+                ws.send(json.dumps({"id": data["id"], "ack": "processed"}))
+                ws.send(json.dumps({"message": "Volumen ajustado"}))
+                ws.send(json.dumps({"id": "otro", "message": "respuesta ajena"}))
+                ws.send(json.dumps({"id": data["id"], "message": f"ok: {data['text']}"}))
+
+    with serve(handler, "127.0.0.1", 0) as ws_server:
+        thread = threading.Thread(target=ws_server.serve_forever, daemon=True)
+        thread.start()
+        ws_server.received = received
+        yield ws_server
+        ws_server.shutdown()
+
+
+@pytest.fixture
+def session(server):
+    session = ServerSession(url=f"ws://127.0.0.1:{server.socket.getsockname()[1]}/ws", api_key="clave")
+    session.start()
+    assert session.connected.wait(5)
+    yield session
+    session.close()
+
+
+def test_dispatch_routes_acks_and_responses():
+    session = ServerSession(url="ws://127.0.0.1:1/ws", api_key="clave")
+    request = PendingRequest()
+    session.pending["transcriber-1"] = request
+    session.dispatch(json.dumps({"id": "transcriber-1", "ack": "processed"}))
+    session.dispatch("no es json")
+    session.dispatch(json.dumps(["lista"]))
+    session.dispatch(json.dumps({"id": "transcriber-9", "message": "sin solicitud"}))
+    assert request.acks == ["processed"] and not request.event.is_set()
+    session.dispatch(json.dumps({"id": "transcriber-1", "message": "hecho"}))
+    assert request.event.is_set()
+    assert request.response == {"id": "transcriber-1", "message": "hecho"}
+    assert session.pending == {}
+
+
+def test_requests_reuse_the_connection_and_match_ids(session, server):
+    assert session.process_text("hola") == {"id": "transcriber-1", "message": "ok: hola"}
+    assert session.process_text("adiós")["message"] == "ok: adiós"
+    assert session.send("stop_playback")
+    assert [data["action"] for data in server.received[:2]] == ["process_text", "process_text"]
+    assert all(data["API_KEY"] == "clave" for data in server.received)
+
+
+def test_lost_connection_fails_the_pending_request(session):
+    with pytest.raises(ConnectionError):
+        session.request("process_text", timeout=5, text="colgar")
+    # Reconecta sola y la siguiente orden funciona
+    assert session.connected.wait(5)
+    assert session.process_text("otra vez")["message"] == "ok: otra vez"
+
+
+def test_without_connection():
+    session = ServerSession(url="ws://127.0.0.1:1/ws", api_key="clave")
+    assert not session.send("stop_playback")
+    with pytest.raises(ConnectionError):
+        session.request("process_text", timeout=0.1, text="hola")
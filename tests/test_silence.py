@@ -0,0 +1,59 @@
+import warnings
+
+import numpy as np
+import pytest
+
+import silence
+
+with warnings.catch_warnings():
+    warnings.simplefilter("ignore", RuntimeWarning)  # pydub avisa si no encuentra ffmpeg
+    pydub = pytest.importorskip("pydub")
+    pydub_silence = pytest.importorskip("pydub.silence")
+
+SAMPLE_RATE = 16000
+
+
+def recording(pattern, seed=0):
+    """PCM int16 con tramos (segundos, amplitud) de ruido gaussiano."""
+    rng = np.random.default_rng(seed)
+    parts = [rng.normal(0, amplitude, int(seconds * SAMPLE_RATE)) for seconds, amplitude in pattern]
+    return np.clip(np.concatenate(parts), -32768, 32767).astype(np.int16).tobytes()
+
+
+def segment(audio):
+    return pydub.AudioSegment(audio, frame_rate=SAMPLE_RATE, sample_width=2, channels=1)
+
+
+CASES = [
+    [(0.4, 30), (1.2, 4000), (0.8, 30), (0.9, 3000), (0.3, 30)],
+    [(1.0, 5000), (0.6, 20), (0.2, 5000)],
+    [(0.7, 10), (0.05, 8000), (0.9, 10)],
+    [(1.5, 2000)],
+    [(1.2, 0)],
+    [(0.3, 3000)],
+]
+
+
+@pytest.mark.parametrize("pattern", CASES)
+def test_detect_nonsilent_matches_pydub(pattern):
+    audio = recording(pattern)
+    thresh = segment(audio).dBFS - silence.SILENCE_OFFSET_DB
+    for seek_step in (1, 7):
+        expected = pydub_silence.detect_nonsilent(segment(audio), silence.MIN_SILENCE_LEN, thresh, seek_step)
+        assert silence.detect_nonsilent(audio, SAMPLE_RATE, silence.MIN_SILENCE_LEN, thresh, seek_step) == expected
+
+
+@pytest.mark.parametrize("pattern", CASES)
+def test_analyze_matches_pydub(pattern):
+    audio = recording(pattern)
+    reference = segment(audio)
+    assert silence.dbfs(audio) == pytest.approx(reference.dBFS)
+    expected = pydub_silence.detect_nonsilent(reference, silence.MIN_SILENCE_LEN,
+                                              reference.dBFS - silence.SILENCE_OFFSET_DB)
+    ranges, proportion = silence.analyze(audio, SAMPLE_RATE)
+    assert ranges == expected
+    assert proportion == pytest.approx(sum(end - start for start, end in expected) / len(reference))
+
+
+def test_analyze_empty_audio():
+    assert silence.analyze(b"", SAMPLE_RATE) == ([], 0.0)
@@ -0,0 +1,18 @@
+import pytest
+
+pytest.importorskip("speech_recognition")
+
+from stt_backends import GroqBackend
+
+
+def test_groq_uploads_wav_unless_compression_is_requested(monkeypatch):
+    monkeypatch.delenv("GROQ_AUDIO_FORMAT", raising=False)
+    assert GroqBackend(session=None, api_key="clave").audio_format == "wav"
+    monkeypatch.setenv("GROQ_AUDIO_FORMAT", "opus")
+    assert GroqBackend(session=None, api_key="clave").audio_format == "opus"
+
+
+def test_groq_requires_a_key(monkeypatch):
+    monkeypatch.delenv("GROQ_API_KEY", raising=False)
+    with pytest.raises(ValueError):
+        GroqBackend(session=None)
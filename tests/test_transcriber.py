@@ -0,0 +1,146 @@
+import os
+import time
+from types import SimpleNamespace
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pytest
+
+for dependency in ("speech_recognition", "openai", "pyaudio", "webrtcvad", "rapidfuzz"):
+    pytest.importorskip(dependency)
+os.environ.setdefault("OPEN_AI_API_KEY", "test")  # transcriber.py crea el cliente de OpenAI al importarse
+
+import webrtcvad
+from audio_stream import AudioStream
+from transcriber import Transcriber
+
+
+class FakeSTT:
+    def __init__(self, text):
+        self.text = text
+
+    def transcribe(self, pcm, sample_rate):
+        return self.text
+
+
+def detect(text, keyword="Angie"):
+    transcriber = SimpleNamespace(keyword=keyword, stop="stop", keyword_stt=FakeSTT(text))
+    audio = SimpleNamespace(get_raw_data=lambda: b"\0\0" * 160, sample_rate=16000)
+    return Transcriber.detect_keyword_in_segment(transcriber, audio)
+
+
+def test_keyword_segment_detection():
+    assert detect("Angie pausa la impresión") == "Angie pausa la impresión"
+    assert detect("oye Angie, ¿cuánto falta?") == "Angie, ¿cuánto falta?"
+    assert detect("stop") == "Stop"
+    assert detect("La impresión ha finalizado normalmente.") is None
+    assert detect("") is None
+
+
+class Done(Exception):
+    pass
+
+
+class FakeServer:
+    def __init__(self):
+        self.sent = []
+        self.texts = []
+
+    def send(self, action):
+        self.sent.append(action)
+
+    def process_text(self, text):
+        self.texts.append(text)
+        return {"message": "ok"}
+
+
+def test_barge_in_only_on_keyword_or_stop():
+    # Lo que oye el micrófono en modo nube: el eco de la respuesta, habla cualquiera y, al final, stop
+    heard = iter(["La impresión ha finalizado normalmente.", "sube el volumen", "stop"])
+    server = FakeServer()
+    transcriber = SimpleNamespace(keyword="Angie", stop="stop", server=server, playsound=lambda *args, **kwargs: None)
+
+    def listen_for_keyword():
+        # Como el pool de reconocimiento: solo las detecciones llegan a transcribe()
+        for text in heard:
+            transcriber.keyword_stt = FakeSTT(text)
+            audio = SimpleNamespace(get_raw_data=lambda: b"\0\0" * 160, sample_rate=16000)
+            detection = Transcriber.detect_keyword_in_segment(transcriber, audio)
+            if detection:
+                return detection
+        raise Done
+
+    transcriber.listen_for_keyword = listen_for_keyword
+    with pytest.raises(Done):
+        Transcriber.transcribe(transcriber)
+    assert server.sent == ["stop_playback"]
+    assert server.texts == ["Stop"]
+
+
+SAMPLE_RATE = 16000
+
+
+def speech(seconds, seed=0):
+    rng = np.random.default_rng(seed)
+    t = np.arange(int(seconds * SAMPLE_RATE)) / SAMPLE_RATE
+    envelope = 0.5 + 0.5 * np.sin(2 * np.pi * 4 * t)
+    voice = np.sin(2 * np.pi * 180 * t) + 0.5 * np.sin(2 * np.pi * 720 * t)
+    return (6000 * envelope * voice + rng.normal(0, 300, t.size)).astype(np.int16).tobytes()
+
+
+def room(seconds, seed=0):
+    return np.random.default_rng(seed).normal(0, 20, int(seconds * SAMPLE_RATE)).astype(np.int16).tobytes()
+
+
+class SegmentSTT:
+    """Devuelve 'segmento N' en orden de llegada; el primero tarda más que los demás."""
+
+    def __init__(self):
+        self.segments = []
+
+    def transcribe(self, pcm, sample_rate):
+        index = len(self.segments)
+        self.segments.append(len(pcm))
+        time.sleep(0.2 if index == 0 else 0.0)
+        return f"segmento {index + 1}"
+
+
+def command_transcriber(audio_before, command):
+
+    stream = AudioStream()
+    stream.write(room(0.5))
+    stream.write(audio_before)
+    transcriber = Transcriber.__new__(Transcriber)
+    transcriber.audio_stream = stream
+    transcriber.wake_position = stream.position
+    stream.write(command)
+    transcriber.playsound = lambda *args, **kwargs: None
+    transcriber.command_start_timeout = 3
+    transcriber.command_end_silence = 0.5
+    transcriber.stt_pool = ThreadPoolExecutor(max_workers=2)
+    transcriber.stt = SegmentSTT()
+    transcriber.vad = webrtcvad.Vad(3)
+    return transcriber
+
+
+def test_command_segments_are_joined_in_capture_order():
+    # Las pausas de 0,6 s cierran un segmento del VAD, pero no alcanzan para terminar la orden
+    command = speech(1.2) + room(0.6) + speech(1.2, seed=1) + room(0.6) + speech(1.0, seed=2) + room(2.0)
+    transcriber = command_transcriber(speech(1.0, seed=3), command)
+    assert transcriber.listen_for_command() == "segmento 1 segmento 2 segmento 3"
+    # Lo dicho antes de la palabra clave no forma parte de la orden
+    assert sum(transcriber.stt.segments) < len(command)
+    assert transcriber.psilencio is False
+
+
+def test_segment_open_when_the_audio_stops_is_transcribed():
+    transcriber = command_transcriber(b"", room(0.3) + speech(1.5))
+    assert transcriber.listen_for_command() == "segmento 1"
+    assert len(transcriber.stt.segments) == 1
+
+
+def test_no_speech_times_out_on_audio_time():
+    transcriber = command_transcriber(b"", room(4.0))
+    assert transcriber.listen_for_command() is None
+    assert transcriber.psilencio is True
+    assert transcriber.stt.segments == []
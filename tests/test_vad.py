@@ -0,0 +1,80 @@
+import numpy as np
+import pytest
+
+from vad import FRAME_MS, SAMPLE_WIDTH, VadCollector, frame_energies, frame_view
+
+webrtcvad = pytest.importorskip("webrtcvad")
+bench_vad = pytest.importorskip("bench_vad")
+
+SAMPLE_RATE = bench_vad.SAMPLE_RATE
+FRAME_BYTES = int(SAMPLE_RATE * FRAME_MS / 1000) * SAMPLE_WIDTH
+
+
+def collector(energy_gate=50):
+    # webrtcvad guarda estado entre llamadas: cada recorrido usa una instancia nueva
+    return VadCollector(webrtcvad.Vad(3), SAMPLE_RATE, energy_gate=energy_gate)
+
+
+def streamed(audio):
+    vad = collector()
+    segments = []
+    for offset in range(0, len(audio) - FRAME_BYTES + 1, FRAME_BYTES):
+        segment = vad.feed(audio[offset:offset + FRAME_BYTES])
+        if segment:
+            segments.append(segment)
+    segment = vad.flush()
+    if segment:
+        segments.append(segment)
+    return segments
+
+
+def test_frame_view_drops_incomplete_frame_without_copy():
+    audio = np.arange(FRAME_BYTES).astype(np.int16).tobytes() + b"\x01\x00" * 10
+    frames = frame_view(audio, SAMPLE_RATE)
+    assert frames.shape == (2, FRAME_BYTES // SAMPLE_WIDTH)
+    assert not frames.flags.owndata
+    assert frame_energies(frame_view(b"", SAMPLE_RATE)).size == 0
+    assert frame_energies(np.full((1, 4), 3, dtype=np.int16))[0] == 3
+
+
+def test_collect_and_feed_give_the_same_segments():
+    audio = bench_vad.synthetic_audio(10, seed=1)
+    collected = list(collector().collect(audio))
+    assert len(collected) >= 3
+    assert collected == streamed(audio)
+
+
+def test_segment_open_at_the_end_is_returned():
+    audio = bench_vad.synthetic_audio(1.5, seed=2)
+    collected = list(collector().collect(audio))
+    assert len(collected) == 1
+    assert collected == streamed(audio)
+    assert len(collected[0]) % FRAME_BYTES == 0
+
+
+def test_energy_gate_skips_quiet_frames():
+    quiet = np.random.default_rng(0).normal(0, 5, SAMPLE_RATE * 2).astype(np.int16).tobytes()
+    vad = collector()
+    assert list(vad.collect(quiet)) == []
+    assert vad.vad_calls == 0
+
+    loud = bench_vad.synthetic_audio(3, seed=3)
+    gated = collector()
+    ungated = collector(energy_gate=0)
+    # El ruido de fondo no llega a webrtcvad, pero la voz se sigue detectando
+    assert len(list(gated.collect(loud))) == len(list(ungated.collect(loud))) == 1
+    assert gated.vad_calls < ungated.vad_calls == len(frame_view(loud, SAMPLE_RATE))
+
+
+
+def test_flush_starts_the_next_command_clean():
+    speech = bench_vad.synthetic_audio(1.5, seed=5)
+    vad = collector()
+    frames = [speech[offset:offset + FRAME_BYTES] for offset in range(0, len(speech) - FRAME_BYTES + 1, FRAME_BYTES)]
+    assert not any(vad.feed(frame) for frame in frames)
+    first = vad.flush()
+    assert first and vad.flush() is None
+    # Un frame silencioso tras flush no arrastra nada del comando anterior
+    assert vad.feed(b"\0" * FRAME_BYTES) is None
+    assert vad.flush() is None
+    assert len(first) % FRAME_BYTES == 0 and len(first) <= len(speech)
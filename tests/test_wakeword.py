@@ -0,0 +1,93 @@
+import json
+
+import pytest
+
+import wakeword
+from wakeword import WakeWordDetector, match_keyword
+
+KEYWORDS = {"Angie": "Angie", "Stop": "stop"}
+
+
+def test_keyword_anywhere_in_the_text():
+    assert match_keyword("Angie, pausa la impresión", KEYWORDS) == ("Angie", "Angie, pausa la impresión")
+    assert match_keyword("oye angie ¿qué temperatura tiene la cama?", KEYWORDS) == (
+        "Angie", "angie ¿qué temperatura tiene la cama?")
+    assert match_keyword("bueno, Angi", KEYWORDS) == ("Angie", "Angi")
+
+
+def test_stop():
+    assert match_keyword("stop por favor", KEYWORDS) == ("Stop", "stop por favor")
+    assert match_keyword("ya para, STOP", KEYWORDS)[0] == "Stop"
+
+
+def test_other_speech_is_not_a_detection():
+    assert match_keyword("La impresión ha finalizado normalmente.", KEYWORDS) is None
+    assert match_keyword("sube el volumen", KEYWORDS) is None
+    assert match_keyword("", KEYWORDS) is None
+
+
+def test_repeated_word_keeps_its_position():
+    assert match_keyword("ángel dijo angie", KEYWORDS) == ("Angie", "angie")
+    assert match_keyword("an angie", KEYWORDS) == ("Angie", "angie")
+
+
+class FakeModel:
+    def __init__(self, words):
+        self.words = words
+
+    def find_word(self, word):
+        return self.words.index(word) if word in self.words else -1
+
+
+class FakeRecognizer:
+    """Devuelve una hipótesis parcial guionada por cada frame."""
+
+    def __init__(self, model, sample_rate, grammar):
+        self.grammar = json.loads(grammar)
+        self.partials = []
+
+    def AcceptWaveform(self, frame):
+        return False
+
+    def PartialResult(self):
+        return json.dumps({"partial": self.partials.pop(0) if self.partials else ""})
+
+    def Reset(self):
+        pass
+
+
+@pytest.fixture
+def detector(monkeypatch):
+    monkeypatch.setattr(wakeword, "KaldiRecognizer", FakeRecognizer, raising=False)
+    detector = WakeWordDetector({"Oye Angie": "oye angie", "Stop": "stop"}, FakeModel(["oye", "angie", "stop"]))
+    detector.partials = detector.recognizer.partials
+    return detector
+
+
+def feed(detector, partials):
+    detector.partials.extend(partials)
+    frame = b"\0" * detector.frame_bytes
+    return [detector.process(frame) for _ in partials]
+
+
+def test_grammar_words_missing_from_the_model(monkeypatch):
+    monkeypatch.setattr(wakeword, "KaldiRecognizer", FakeRecognizer, raising=False)
+    with pytest.raises(ValueError, match="angie"):
+        WakeWordDetector({"Angie": "Angie", "Stop": "stop"}, FakeModel(["stop"]))
+
+
+def test_grammar_has_the_keywords(detector):
+    assert detector.recognizer.grammar == ["angie", "oye", "stop", "[unk]"]
+
+
+def test_phrase_split_across_hypotheses(detector):
+    assert feed(detector, ["oye", "oye", "oye angie"])[-1] == "Oye Angie"
+    assert feed(detector, ["stop"]) == ["Stop"]
+
+
+def test_window_counts_audio_not_wall_time(detector):
+    # 60 frames de 30 ms (1,8 s de audio) entre las dos palabras: fuera de la ventana de 1,5 s,
+    # aunque el reconocedor los procese en unos milisegundos
+    results = feed(detector, ["oye"] + ["[unk]"] * 60 + ["angie"])
+    assert not any(results)
+    assert feed(detector, ["oye"] + ["[unk]"] * 20 + ["angie"])[-1] == "Oye Angie"
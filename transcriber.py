@@ -1,112 +1,214 @@
 import speech_recognition as sr
 import requests
-from pydub import AudioSegment
-from pydub.silence import detect_nonsilent
 import os
 import time
-import queue
-import threading
+from concurrent.futures import ThreadPoolExecutor
 from dotenv import load_dotenv
+
+# Antes de importar los módulos propios: algunos leen su configuración del entorno
+load_dotenv()
+
 from openai import OpenAI
-from rapidfuzz import fuzz  # Reemplazado 'fuzzywuzzy' por 'rapidfuzz'
 import webrtcvad
 import collections
 import subprocess
+from wakeword import WakeWordDetector, load_model, match_keyword
+from audio_stream import AudioStream, frame_rms, SAMPLE_RATE, SAMPLE_WIDTH, FRAME_MS
+from vad import VadCollector, ENERGY_GATE
+import silence
+from stt_backends import STTRouter, build_backends
+from server_session import ServerSession
+from audio_sink import AudioSink
+from recognition_pool import RecognitionPool
 
-load_dotenv()
 OPEN_AI_API_KEY = os.getenv("OPEN_AI_API_KEY")
-GROQ_API_KEY = os.getenv("GROQ_API_KEY")
+# Backends de voz a texto, por orden de preferencia: groq, whisper (local) o google
+STT_BACKENDS = os.getenv("STT_BACKENDS", "groq,whisper")
+KEYWORD_STT_BACKENDS = os.getenv("KEYWORD_STT_BACKENDS", "whisper,google")
 client = OpenAI(api_key=OPEN_AI_API_KEY)
 
 class Transcriber:
-    def __init__(self):
+    def __init__(self, audio_stream=None, server=None, sink=None, stt=None, keyword_stt=None):
+        """
+        Las dependencias se crean aquí salvo que se pasen ya hechas (bench_transcriber.py
+        usa un micrófono simulado, una salida muda y STT locales).
+        """
         self.recognizer = sr.Recognizer()
         self.keyword = os.getenv("ASSISTANT")
         self.stop = "stop"
         self.language = 'es-ES'
-        self.audio_buffer = queue.Queue(maxsize=6)
-        self.cleanup_time = 10  # Tiempo de limpieza en segundos
-        self.time_counter = 0
         self.error_counter = 0
         self.reset_threshold = 20  # Umbral de reinicio en errores consecutivos
+        self.command_start_timeout = 3  # Segundos de audio sin voz tras la palabra clave
+        self.command_end_silence = 0.5  # Silencio tras el último segmento que da el comando por terminado
+        self.stt_pool = ThreadPoolExecutor(max_workers=2)  # Transcripciones de segmentos en paralelo
+        self.http = requests.Session()  # Conexiones HTTP reutilizadas entre peticiones
+        # Sesión WebSocket persistente con el servidor para enviar las órdenes
+        self.server = server
+        if self.server is None:
+            self.server = ServerSession()
+            self.server.start()
+        # Un único stream de micrófono compartido por la palabra clave y el comando
+        self.audio_stream = audio_stream
+        if self.audio_stream is None:
+            self.audio_stream = AudioStream()
+        self.audio_stream.start()
+        self.wake_position = None  # Posición del buffer donde terminó la palabra clave
+        self.sink = sink if sink is not None else self.open_sink()
         self.playsound('sounds/spaceship.wav')
         self.psilencio = False
-        self.buffer_processing_thread = threading.Thread(target=self.process_audio_buffer)
-        self.buffer_processing_thread.start()
+        # Detector local de palabra clave; si no está disponible se usa keyword_stt
+        self.wakeword = None
+        wakeword_model = load_model()
+        if wakeword_model is not None:
+            try:
+                self.wakeword = WakeWordDetector({self.keyword: self.keyword, "Stop": self.stop}, wakeword_model)
+            except ValueError as e:
+                print(f"{e}; la palabra clave se detectará en la nube.")
+        # Cada backend se crea una vez (el modelo local queda cargado) y lo comparten ambos usos;
+        # los de palabra clave solo hacen falta sin el detector local
+        self.stt = stt
+        self.keyword_stt = keyword_stt
+        if self.stt is None or self.keyword_stt is None:
+            names = STT_BACKENDS if self.wakeword is not None else f"{STT_BACKENDS},{KEYWORD_STT_BACKENDS}"
+            backends = {backend.name: backend for backend in build_backends(names, self.http, self.recognizer)}
+            if self.stt is None:
+                self.stt = STTRouter(backends[name] for name in STT_BACKENDS.lower().split(",") if name in backends)
+            if self.keyword_stt is None:
+                self.keyword_stt = STTRouter(backends[name] for name in KEYWORD_STT_BACKENDS.lower().split(",") if name in backends)
+        # Sin detector local, los segmentos se reconocen en segundo plano mientras se sigue escuchando
+        self.recognition = RecognitionPool(self.detect_keyword_in_segment)
+        if self.wakeword is None:
+            self.recognition.start()
         self.vad = webrtcvad.Vad(3)  # Nivel de agresividad aumentado
 
-    def playsound(self, file_path):
-        """Reproduce un sonido dado un archivo de audio usando ffplay."""
-        subprocess.call(['ffplay', '-nodisp', '-autoexit', file_path])
-
-    def adjust_to_ambient_noise(self, source):
-        self.recognizer.adjust_for_ambient_noise(source, duration=1.5)
-
-    def clear_audio_buffer(self):
-        while not self.audio_buffer.empty():
-            self.audio_buffer.get_nowait()
-            print(f"Limpiando buffer")
+    def open_sink(self):
+        """Salida de audio persistente con los avisos de 'sounds/' precargados; None si no hay dispositivo."""
+        try:
+            sink = AudioSink()
+            sink.start()
+            sink.preload('sounds')
+            return sink
+        except Exception as e:
+            print(f"No se pudo abrir la salida de audio persistente ({e}); se usará ffplay.")
+            return None
+
+    def playsound(self, file_path, wait=True):
+        """Reproduce un sonido dado un archivo de audio, desde memoria si está precargado."""
+        if self.sink is None:
+            subprocess.call(['ffplay', '-nodisp', '-autoexit', file_path])
+            return
+        clip = self.sink.play_file(file_path)
+        if wait:
+            clip.wait()
 
     def listen_for_keyword(self):
         keyword_detected = self.detect_keyword_in_buffer()
         return keyword_detected
 
-    def process_audio_buffer(self):
+    def listen_for_wakeword(self):
+        """Lee el stream continuo a 16 kHz y detecta la palabra clave en local, sin red."""
+        reader = self.audio_stream.reader()
+        self.wakeword.reset()
         while True:
-            audio_segment = self.audio_buffer.get()
-            keyword_detected = self.detect_keyword_in_segment(audio_segment)
+            frame = reader.read(timeout=1)
+            if frame is None:
+                continue
+            keyword_detected = self.wakeword.process(frame)
             if keyword_detected:
+                print(f"Palabra clave detectada: {keyword_detected}")
+                self.wake_position = reader.position
+                return keyword_detected
+
+    def listen_phrase(self, reader, timeout=None, phrase_time_limit=None, interrupt=None):
+        """
+        Equivalente a recognizer.listen sobre el buffer compartido: espera a que la
+        energía supere el ruido de fondo y devuelve el PCM de la frase. El tiempo se
+        cuenta en audio leído, no en tiempo real. Si interrupt() devuelve True se
+        abandona la escucha y se devuelve None.
+        """
+        frame_seconds = FRAME_MS / 1000
+        pre_roll = collections.deque(maxlen=int(self.recognizer.non_speaking_duration / frame_seconds))
+        waited = 0.0
+        while True:
+            if interrupt is not None and interrupt():
+                return None
+            frame = reader.read(timeout=1)
+            if frame is None:
+                raise sr.WaitTimeoutError("No llega audio del micrófono")
+            if frame_rms(frame) > self.audio_stream.energy_threshold:
+                break
+            pre_roll.append(frame)
+            waited += frame_seconds
+            if timeout and waited > timeout:
+                raise sr.WaitTimeoutError("Tiempo de espera agotado esperando voz")
+
+        phrase = list(pre_roll) + [frame]
+        length = frame_seconds
+        quiet = 0.0
+        while True:
+            if interrupt is not None and interrupt():
+                return None
+            frame = reader.read(timeout=1)
+            if frame is None:
+                break
+            phrase.append(frame)
+            length += frame_seconds
+            if frame_rms(frame) > self.audio_stream.energy_threshold:
+                quiet = 0.0
+            else:
+                quiet += frame_seconds
+                if quiet >= self.recognizer.pause_threshold:
+                    break
+            if phrase_time_limit and length >= phrase_time_limit:
                 break
+        return b''.join(phrase)
 
     def detect_keyword_in_buffer(self):
-        with sr.Microphone() as source:
-            self.recognizer.adjust_for_ambient_noise(source, duration=1)
-            while True:
-                try:
-                    audio = self.recognizer.listen(source, timeout=3, phrase_time_limit=5)
-                    print("Audio capturado")
-                    if self.audio_buffer.full():
-                        self.audio_buffer.get_nowait()  # Eliminar el elemento más antiguo del buffer
-                    self.audio_buffer.put(audio)
-                    print("Audio capturado en el buffer")
-
-                    self.time_counter += 1
-                    if self.time_counter >= self.cleanup_time:
-                        self.clear_audio_buffer()
-                        self.time_counter = 0
-
-                    keyword_detected = self.detect_keyword_in_segment(audio)
-                    if keyword_detected:
-                        print(f"Palabra clave detectada: {keyword_detected}")
-                        self.clear_audio_buffer()
-                        return keyword_detected
-                except sr.WaitTimeoutError:
-                    print("Tiempo de espera agotado")
-                    self.time_counter += 1
-                    if self.time_counter >= self.cleanup_time:
-                        self.clear_audio_buffer()
-                        self.time_counter = 0
-                    self.error_counter += 1  # Incrementar el contador de errores
-                    if self.error_counter >= self.reset_threshold:
-                        print(f"Reiniciando reconocimiento de voz después de {self.error_counter} errores consecutivos.")
-                        self.recognizer = sr.Recognizer()  # Reiniciar el reconocedor
-                        self.error_counter = 0
+        """
+        Captura frases del stream y las envía al pool de reconocimiento; la captura no
+        espera al STT, así que se sigue escuchando mientras se reconoce. Devuelve la
+        primera detección.
+        """
+        if self.wakeword is not None:
+            return self.listen_for_wakeword()
+        reader = self.audio_stream.reader()
+        self.recognition.clear()  # Lo reconocido en escuchas anteriores ya no cuenta
+        while True:
+            detection = self.recognition.poll()
+            if detection is not None:
+                print(f"Palabra clave detectada: {detection.result}")
+                self.recognition.clear()
+                # El comando empieza donde termina el segmento con la palabra clave
+                self.wake_position = detection.key
+                return detection.result
+            try:
+                phrase = self.listen_phrase(reader, timeout=3, phrase_time_limit=5,
+                                            interrupt=self.recognition.has_detection)
+                if phrase is None:
                     continue
+                self.recognition.submit(sr.AudioData(phrase, SAMPLE_RATE, SAMPLE_WIDTH), reader.position)
+                print("Audio capturado y enviado a reconocer")
+            except sr.WaitTimeoutError:
+                print("Tiempo de espera agotado")
+                self.error_counter += 1  # Incrementar el contador de errores
+                if self.error_counter >= self.reset_threshold:
+                    print(f"Reiniciando reconocimiento de voz después de {self.error_counter} errores consecutivos.")
+                    self.recognizer = sr.Recognizer()  # Reiniciar el reconocedor
+                    self.error_counter = 0
+                continue
 
     def detect_keyword_in_segment(self, audio_segment):
         try:
-            text = self.recognizer.recognize_google(audio_segment, language=self.language)
+            text = self.keyword_stt.transcribe(audio_segment.get_raw_data(), audio_segment.sample_rate)
+            if not text:
+                raise sr.UnknownValueError()
             print(f"Texto reconocido: {text}")
-            words = text.split()
-            for word in words:
-                similarity_reset = fuzz.ratio(word.lower(), self.keyword.lower())
-                similarity_stop = fuzz.ratio(word.lower(), self.stop.lower())
-                if similarity_reset > 80:
-                    return text[text.lower().find(word):].strip()
-                if similarity_stop > 80:
-                    return "Stop"
-                else:
-                    return (f"Texto reconocido: {text}")
+            match = match_keyword(text, {self.keyword: self.keyword, "Stop": self.stop})
+            if match is None:
+                return None  # Habla sin palabra clave: no es una detección
+            name, text_from_keyword = match
+            return "Stop" if name == "Stop" else text_from_keyword
 
         except sr.UnknownValueError:
             print("Error de reconocimiento de voz: Valor desconocido")
@@ -115,175 +217,103 @@ class Transcriber:
         return None
 
     def listen_for_command(self):
-        with sr.Microphone(sample_rate=16000) as source:
-            self.recognizer.adjust_for_ambient_noise(source)
-            self.playsound('sounds/start_sound.mp3')
-            print("Grabación iniciada.")
-            recorded_audio = AudioSegment.empty()
-            start_time = time.time()
-            max_recording_time = 60  # Máximo 1 minuto
-            frame_duration_ms = 30  # Duración de cada frame en milisegundos
-            sample_rate = 16000  # Tasa de muestreo para VAD
-            self.psilencio = False
-
-            while time.time() - start_time < max_recording_time:
-                try:
-                    # Capturar audio
-                    audio = self.recognizer.listen(source, timeout=1, phrase_time_limit=None)
-                    audio_data = audio.get_raw_data(convert_rate=sample_rate, convert_width=2)
-                    frames = self.frame_generator(frame_duration_ms, audio_data, sample_rate)
-                    segments = self.vad_collector(sample_rate, frame_duration_ms, frames)
-
-                    # Reconstruir el audio a partir de los segmentos de voz
-                    for segment in segments:
-                        audio_segment = AudioSegment(
-                            data=segment,
-                            sample_width=2,
-                            frame_rate=sample_rate,
-                            channels=1
-                        )
-                        recorded_audio += audio_segment
-
-                    # Si no se detectó voz, continuar escuchando
-                    if len(recorded_audio) == 0:
-                        print("Silencio detectado, continuando grabación.")
-                        self.psilencio = True
-                        continue
-                    else:
-                        print(f"Duración total grabada: {len(recorded_audio)} ms")
-                        break  # Salir después de obtener el comando
+        """
+        Graba el comando y lo transcribe por segmentos: cada tramo de voz que cierra el
+        VAD se envía al STT mientras el usuario sigue hablando, así al terminar solo
+        queda por transcribir el último tramo.
+        """
+        # Leer desde donde terminó la palabra clave: no se pierde lo dicho mientras suena el aviso,
+        # así que no hace falta esperar a que termine
+        reader = self.audio_stream.reader(self.wake_position)
+        self.wake_position = None
+        self.playsound('sounds/start_sound.mp3', wait=False)
+        print("Grabación iniciada.")
+        max_recording_time = 60  # Máximo 1 minuto
+        frame_duration_ms = 30  # Duración de cada frame en milisegundos
+        sample_rate = 16000  # Tasa de muestreo para VAD
+        frame_seconds = frame_duration_ms / 1000
+        collector = self.vad_stream(sample_rate, frame_duration_ms)
+        pending = []  # Transcripciones en curso, en orden
+        recorded = 0.0
+        waited = 0.0  # Audio sin voz desde el último segmento
+        self.psilencio = False
 
-                except sr.WaitTimeoutError:
+        while recorded < max_recording_time:
+            frame = reader.read(timeout=1)
+            if frame is None:
+                print("No llega audio del micrófono durante la grabación del comando.")
+                break
+            recorded += frame_seconds
+            segment = collector.feed(frame)
+            if segment is not None:
+                self.submit_segment(segment, sample_rate, pending)
+                waited = 0.0
+            elif collector.triggered or collector.last_speech:
+                waited = 0.0
+            else:
+                waited += frame_seconds
+                if not pending and waited >= self.command_start_timeout:
                     print("Tiempo de espera agotado durante la grabación del comando.")
+                    self.psilencio = True
+                    break
+                if pending and waited >= self.command_end_silence:
                     break
 
-            # Implementación de la lógica para detectar silencio
-            detect_silence = True  # Asumir que hay silencio por defecto
-            if len(recorded_audio) > 0:
-                # Configurar el umbral de silencio
-                silence_thresh = recorded_audio.dBFS - 16
-                # Detectar rangos no silenciosos
-                nonsilent_ranges = detect_nonsilent(recorded_audio, min_silence_len=500, silence_thresh=silence_thresh)
-                print(f"Rangos no silenciosos detectados: {nonsilent_ranges}")
-
-                if nonsilent_ranges:
-                    # Calcular la duración total no silenciosa
-                    total_nonsilent_duration = sum((end - start) for start, end in nonsilent_ranges)
-                    total_duration = len(recorded_audio)
-                    nonsilent_proportion = total_nonsilent_duration / total_duration
-                    print(f"Proporción de audio no silencioso: {nonsilent_proportion * 100:.2f}%")
-
-                    # Definir un umbral de proporción para considerar que hay voz
-                    if nonsilent_proportion > 0.3:  # Por ejemplo, más del 30% del audio es no silencioso
-                        detect_silence = False
-                    else:
-                        print("Proporción de audio no suficientemente alta para considerar que hay voz.")
-                else:
-                    print("No se detectaron rangos no silenciosos.")
-
-            else:
-                print("No se grabó ningún audio.")
-
-            if not detect_silence:
-                try:
-                    print("Usando reconocimiento de voz de Groq.")
-                    text = self.transcribe_with_groq(recorded_audio)
-                    return text
-                except Exception as e:
-                    print("Error al transcribir el audio:", e)
-            else:
-                print("No se detectó comando de voz.")
-                self.playsound('sounds/stop_sound.mp3')  # Opcional: notificar al usuario
-
-    def frame_generator(self, frame_duration_ms, audio, sample_rate):
-        """Genera frames de audio de la duración especificada."""
-        frame_size = int(sample_rate * (frame_duration_ms / 1000.0) * 2)  # 2 bytes por muestra (16 bits)
-        offset = 0
-        while offset + frame_size <= len(audio):
-            yield audio[offset:offset + frame_size]
-            offset += frame_size
-
-    def vad_collector(self, sample_rate, frame_duration_ms, frames):
+        speech_end = time.perf_counter()
+        tail = collector.flush()
+        if tail is not None:
+            self.submit_segment(tail, sample_rate, pending)
+
+        if not pending:
+            print("No se detectó comando de voz.")
+            self.playsound('sounds/stop_sound.mp3')  # Opcional: notificar al usuario
+            return None
+
+        texts = []
+        for future in pending:
+            try:
+                text = future.result()
+            except Exception as e:
+                print("Error al transcribir el audio:", e)
+                continue
+            if text and text.strip():
+                texts.append(text.strip())
+        print(f"Comando transcrito en {len(pending)} segmentos; "
+              f"{(time.perf_counter() - speech_end) * 1000:.0f} ms desde el fin de la voz.")
+        return " ".join(texts) or None
+
+    def submit_segment(self, segment, sample_rate, pending):
+        """
+        Comprueba que el segmento tenga voz suficiente y lo envía a transcribir en segundo plano.
+        """
+        # Rangos no silenciosos con umbral dBFS - 16 y silencios de al menos 500 ms, en una pasada
+        nonsilent_ranges, nonsilent_proportion = silence.analyze(segment, sample_rate)
+        duration = len(segment) * 1000 // (sample_rate * SAMPLE_WIDTH)
+        if not nonsilent_ranges or nonsilent_proportion <= silence.VOICED_PROPORTION:  # Hace falta más del 30% no silencioso
+            print(f"Segmento de {duration} ms descartado: {nonsilent_proportion * 100:.2f}% no silencioso.")
+            return
+        print(f"Segmento de {duration} ms enviado a transcribir ({nonsilent_proportion * 100:.2f}% no silencioso).")
+        pending.append(self.stt_pool.submit(self.stt.transcribe, segment, sample_rate))
+
+    def vad_stream(self, sample_rate, frame_duration_ms):
+        """Colector VAD sobre el stream del micrófono."""
+        # Lo que queda por debajo del ruido de fondo es silencio claro: no hace falta webrtcvad
+        energy_gate = max(ENERGY_GATE, self.audio_stream.noise_floor or 0)
+        return VadCollector(self.vad, sample_rate, frame_duration_ms, energy_gate=energy_gate)
+
+    def vad_collector(self, sample_rate, frame_duration_ms, audio):
         """Recoge frames de voz utilizando VAD y devuelve segmentos de voz."""
-        padding_duration_ms = 400  # Duración del padding en milisegundos
-        num_padding_frames = int(padding_duration_ms / frame_duration_ms)
-        ring_buffer = collections.deque(maxlen=num_padding_frames)
-        triggered = False
-        voiced_frames = []
-
-        for frame in frames:
-            is_speech = self.vad.is_speech(frame, sample_rate)
-            print(f"VAD decision for frame: {'Speech' if is_speech else 'Silence'}")  # Información de depuración
-
-            if not triggered:
-                ring_buffer.append((frame, is_speech))
-                num_voiced = len([f for f, speech in ring_buffer if speech])
-                if num_voiced > 0.9 * ring_buffer.maxlen:
-                    triggered = True
-                    print("Inicio de voz detectado")
-                    for f, s in ring_buffer:
-                        voiced_frames.append(f)
-                    ring_buffer.clear()
-            else:
-                voiced_frames.append(frame)
-                ring_buffer.append((frame, is_speech))
-                num_unvoiced = len([f for f, speech in ring_buffer if not speech])
-                if num_unvoiced > ring_buffer.maxlen:
-                    triggered = False
-                    print("Fin de voz detectado")
-                    yield b''.join(voiced_frames)
-                    ring_buffer.clear()
-                    voiced_frames = []
-
-        if voiced_frames:
-            yield b''.join(voiced_frames)
-
-    def transcribe_with_groq(self, audio_segment):
-        """Transcribe el audio utilizando el servicio de Groq."""
-        # Exportar AudioSegment a un archivo temporal
-        temp_file = "temp_audio.wav"
-        audio_segment.export(temp_file, format="wav")
-
-        # Leer el archivo temporal
-        with open(temp_file, "rb") as file:
-            files = {
-                'file': (temp_file, file, 'audio/wav')
-            }
-            data = {
-                'model': 'whisper-large-v3-turbo',
-                'temperature': '0',
-                'response_format': 'json',
-                'language': 'es'
-            }
-            headers = {
-                'Authorization': f'Bearer {GROQ_API_KEY}'
-            }
-            response = requests.post(
-                'https://api.groq.com/openai/v1/audio/transcriptions',
-                headers=headers,
-                files=files,
-                data=data
-            )
-            if response.status_code == 200:
-                transcription = response.json()
-                print(f"Transcripción: {transcription['text']}")
-                return transcription['text']
-            else:
-                print(f"Error al transcribir el audio: {response.status_code}")
-                print(f"Respuesta: {response.text}")
-                raise Exception(f"Error al transcribir el audio: {response.status_code}")
+        return self.vad_stream(sample_rate, frame_duration_ms).collect(audio)
 
     def transcribe(self):
         """Método principal para iniciar la transcripción."""
-        Server = os.getenv("SERVER_URL")
-        FASTAPI_SERVER_URL = f"http://{Server}:6996/process"
-
-        headers = {"Content-Type": "application/json"}
-
         while True:
             text_after_keyword = self.listen_for_keyword()
 
             if text_after_keyword is not None:
+                # Barge-in: solo llega aquí la palabra clave o "stop" (ver match_keyword), no el eco de la
+                # respuesta ni cualquier otra frase; el servidor deja de reproducir la respuesta anterior
+                self.server.send("stop_playback")
                 if text_after_keyword.lower().strip() == "stop":
                     print("Stop")
                     data = {"text": "Stop"}
@@ -295,13 +325,18 @@ class Transcriber:
                     else:
                         self.playsound('sounds/stop_sound.mp3')
                         continue
-                self.playsound('sounds/stop_sound.mp3')        
-                response = requests.post(FASTAPI_SERVER_URL, json=data, headers=headers)
-                if response.status_code == 200:
-                    response_data = response.json()
-                    print(f"Respuesta del servidor: {response_data}")
+                self.playsound('sounds/stop_sound.mp3')
+                try:
+                    response_data = self.server.process_text(data["text"])
+                except (ConnectionError, TimeoutError) as e:
+                    print(f"Error al enviar datos al servidor: {e}")
+                    continue
+                if "error" in response_data:
+                    print(f"Error del servidor: {response_data['error']}")
                 else:
-                    print(f"Error al enviar datos al servidor: {response.status_code}")
+                    print(f"Respuesta del servidor: {response_data.get('message')}")
+                    if response_data.get("audio_path"):
+                        print(f"Audio de la respuesta: {response_data['audio_path']}")
 
 if __name__ == '__main__':
     transcriber = Transcriber()
@@ -6,6 +6,78 @@ import threading
 from gtts import gTTS
 import queue
 import subprocess
+from metrics import Histogram, Gauge, Counter
+from audio_sink import AudioSink
+
+# Métricas de síntesis y reproducción
+TTS_SYNTHESIS_SECONDS = Histogram("sayfi_tts_synthesis_seconds", "Duración de la síntesis con gTTS en TTS.speak.")
+TTS_QUEUE_WAIT_SECONDS = Histogram("sayfi_tts_queue_wait_seconds", "Tiempo que un audio espera en la cola de reproducción.")
+TTS_PLAYBACK_SECONDS = Histogram("sayfi_tts_playback_seconds", "Duración de la reproducción de cada audio.")
+TTS_PLAY_QUEUE_DEPTH = Gauge("sayfi_tts_play_queue_depth", "Audios pendientes en la cola de reproducción.")
+TTS_INTERRUPTED_TOTAL = Counter("sayfi_tts_interrupted_total", "Audios cortados o descartados por una interrupción.", labels=("reason",))
+
+class PlaybackController:
+    """
+    Controla la reproducción para poder interrumpirla (barge-in).
+
+    Reproduce por la salida persistente de audio_sink (sin un proceso por audio y sin
+    huecos entre audios seguidos); si no se puede abrir, usa ffplay como antes. Cada
+    audio lleva la época en la que se pidió; interrupt() avanza la época y corta lo que
+    está sonando, así lo que se pidió antes y aún no ha sonado se descarta.
+    """
+
+    def __init__(self, sink=None):
+        self.sink = sink
+        self.lock = threading.Lock()
+        self.epoch = 0
+        self.process = None
+        self.interrupted = False
+
+    def is_stale(self, epoch):
+        return epoch < self.epoch
+
+    def play(self, filepath, on_finished):
+        """
+        Reproduce el archivo y llama a on_finished(completado, segundos, empezó) al
+        terminar. Con la salida persistente no bloquea: el audio se encola tras el actual.
+        """
+        if self.sink is not None:
+            def on_done(clip):
+                played = time.perf_counter() - clip.started if clip.started is not None else 0.0
+                on_finished(not clip.interrupted, played, clip.started is not None)
+
+            self.sink.play_file(filepath, on_done=on_done)
+            return
+
+        with self.lock:
+            self.interrupted = False
+            # Reproducir el audio usando ffplay sin mostrar ventana y sin mensajes en consola
+            self.process = subprocess.Popen(['ffplay', '-nodisp', '-autoexit', '-loglevel', 'quiet', filepath])
+        start = time.perf_counter()
+        try:
+            self.process.wait()
+        finally:
+            with self.lock:
+                self.process = None
+        on_finished(not self.interrupted, time.perf_counter() - start, True)
+
+    def interrupt(self, flush=True):
+        """
+        Corta el audio actual; con flush también invalida lo pedido hasta ahora.
+        Devuelve (si había algo sonando, cuántos audios ya entregados a la salida se
+        descartaron sin sonar).
+        """
+        with self.lock:
+            if flush:
+                self.epoch += 1
+            if self.sink is not None:
+                return self.sink.interrupt(flush=flush)
+            if self.process is None or self.process.poll() is not None:
+                return False, 0
+            self.interrupted = True
+            self.process.terminate()
+            return True, 0
+
 
 class TTS:
     def __init__(self, static_folder='static', lang='es', tld='com.mx'):
@@ -25,17 +97,21 @@ class TTS:
             os.makedirs(self.static_folder)
         
         self.play_queue = queue.Queue()
+        self.playback = PlaybackController(self.open_sink())
         self.play_thread = threading.Thread(target=self.play_audio_worker, daemon=True)
         self.play_thread.start()
 
-    def speak(self, text, play_audio=True):
+    def speak(self, text, play_audio=True, on_played=None):
         """
         Convierte el texto proporcionado a audio, lo guarda en la carpeta 'static' y lo reproduce si play_audio es True.
 
         :param text: Texto a convertir a audio.
         :param play_audio: Booleano que determina si se reproduce el audio o no.
+        :param on_played: Función opcional que se llama cuando termina la reproducción del audio.
         :return: Ruta del archivo de audio generado o cadena vacía en caso de error.
         """
+        # Una interrupción posterior a la solicitud descarta este audio aunque aún se esté sintetizando
+        epoch = self.playback.epoch
         # Generar un nombre de archivo único usando la marca de tiempo
         timestamp = int(time.time() * 1000)
         filename = f"audio_{timestamp}.mp3"
@@ -43,8 +119,9 @@ class TTS:
         
         try:
             # Convertir el texto a voz usando gTTS con español de México
-            tts = gTTS(text=text, lang=self.lang, tld=self.tld)
-            tts.save(filepath)
+            with TTS_SYNTHESIS_SECONDS.time(timing="tts_synthesis"):
+                tts = gTTS(text=text, lang=self.lang, tld=self.tld)
+                tts.save(filepath)
             print(f"Audio guardado como: {filename}")
         except Exception as e:
             print(f"Error al generar el audio: {e}")
@@ -52,7 +129,8 @@ class TTS:
         
         # Añadir el archivo a la cola de reproducción si play_audio es True
         if play_audio and filepath:
-            self.play_queue.put(filepath)
+            self.play_queue.put((filepath, on_played, time.perf_counter(), epoch))
+            TTS_PLAY_QUEUE_DEPTH.set(self.play_queue.qsize())
         
         # Gestionar la cantidad de archivos de audio
         self.manage_files()
@@ -61,16 +139,80 @@ class TTS:
 
     def play_audio_worker(self):
         while True:
-            filepath = self.play_queue.get()
-            if filepath:
+            filepath, on_played, queued_at, epoch = self.play_queue.get()
+            TTS_PLAY_QUEUE_DEPTH.set(self.play_queue.qsize())
+            TTS_QUEUE_WAIT_SECONDS.observe(time.perf_counter() - queued_at)
+            if filepath and self.playback.is_stale(epoch):
+                TTS_INTERRUPTED_TOTAL.inc(reason="stale")
+                print(f"Audio descartado por una interrupción: {os.path.basename(filepath)}")
+            elif filepath:
                 try:
-                    # Reproducir el audio usando ffplay sin mostrar ventana y sin mensajes en consola
-                    subprocess.run(['ffplay', '-nodisp', '-autoexit', '-loglevel', 'quiet', filepath])
-                    print(f"Audio reproducido: {os.path.basename(filepath)}")
+                    # Mientras suena este audio el bucle ya decodifica el siguiente
+                    self.playback.play(filepath, lambda completed, played, started, filepath=filepath, on_played=on_played:
+                                       self.on_finished(filepath, on_played, completed, played, started))
+                    self.play_queue.task_done()
+                    continue
                 except Exception as e:
                     print(f"Error al reproducir el audio: {e}")
+            self.finish(on_played)
             self.play_queue.task_done()
 
+    def open_sink(self):
+        """Abre la salida de audio persistente; None si no hay dispositivo (se usará ffplay)."""
+        try:
+            sink = AudioSink()
+            sink.start()
+            return sink
+        except Exception as e:
+            print(f"No se pudo abrir la salida de audio persistente ({e}); se usará ffplay.")
+            return None
+
+    def on_finished(self, filepath, on_played, completed, played, started=True):
+        if completed:
+            TTS_PLAYBACK_SECONDS.observe(played)
+            print(f"Audio reproducido: {os.path.basename(filepath)}")
+        elif not started:
+            # Estaba en la cola de la salida: descartado sin llegar a sonar
+            TTS_INTERRUPTED_TOTAL.inc(reason="stale")
+            print(f"Audio descartado por una interrupción: {os.path.basename(filepath)}")
+        else:
+            TTS_PLAYBACK_SECONDS.observe(played)
+            TTS_INTERRUPTED_TOTAL.inc(reason="interrupted")
+            print(f"Audio interrumpido: {os.path.basename(filepath)}")
+        self.finish(on_played)
+
+    def finish(self, on_played):
+        # Avisar que terminó la reproducción, aunque haya fallado o se descartara, para no bloquear a quien espera
+        if on_played:
+            try:
+                on_played()
+            except Exception as e:
+                print(f"Error al notificar el fin de la reproducción: {e}")
+
+    def interrupt(self, flush=True):
+        """
+        Interrumpe la reproducción (barge-in).
+
+        :param flush: Si es True, también se descartan los audios en cola y los que se estén sintetizando.
+        :return: Diccionario con si se cortó un audio y cuántos se descartaron de la cola.
+        """
+        # Con la salida persistente los audios pasan enseguida a su cola: los descartados
+        # allí cuentan igual que los que seguían en play_queue
+        interrupted, dropped = self.playback.interrupt(flush=flush)
+        if flush:
+            while True:
+                try:
+                    filepath, on_played, _, _ = self.play_queue.get_nowait()
+                except queue.Empty:
+                    break
+                dropped += 1
+                TTS_INTERRUPTED_TOTAL.inc(reason="stale")
+                self.finish(on_played)
+                self.play_queue.task_done()
+            TTS_PLAY_QUEUE_DEPTH.set(self.play_queue.qsize())
+        print(f"Reproducción interrumpida (audio cortado: {interrupted}, descartados: {dropped}).")
+        return {"interrupted": interrupted, "dropped": dropped}
+
     def manage_files(self):
         """
         Asegura que solo existan un máximo de 3 archivos de audio en la carpeta 'static'.
@@ -0,0 +1,161 @@
+# vad.py
+
+import collections
+import numpy as np
+
+SAMPLE_WIDTH = 2  # int16
+FRAME_MS = 30
+PADDING_MS = 400  # Duración del padding en milisegundos
+TRIGGER_RATIO = 0.9  # Proporción de frames de voz (o de silencio) en el padding para abrir (o cerrar) un segmento
+ENERGY_GATE = 50  # RMS por debajo del cual un frame es silencio sin consultar a webrtcvad (~ -56 dBFS)
+
+# Eventos de la máquina de estados
+START = "start"
+END = "end"
+
+
+def frame_view(audio, sample_rate, frame_ms=FRAME_MS):
+    """
+    Divide el PCM en frames sin copiarlo: devuelve una vista numpy (frames, muestras).
+    El resto que no completa un frame se ignora, igual que el antiguo frame_generator.
+    """
+    frame_samples = int(sample_rate * frame_ms / 1000)
+    count = len(audio) // (frame_samples * SAMPLE_WIDTH)
+    samples = np.frombuffer(audio, dtype=np.int16, count=count * frame_samples)
+    return samples.reshape(count, frame_samples)
+
+
+def frame_energies(frames):
+    """RMS de cada frame en una sola pasada."""
+    if not len(frames):
+        return np.zeros(0)
+    squares = np.einsum("ij,ij->i", frames, frames, dtype=np.float64)
+    return np.sqrt(squares / frames.shape[1])
+
+
+class VadCollector:
+    """
+    Agrupa frames de voz con webrtcvad y devuelve los segmentos hablados.
+
+    Mantiene contadores de frames con y sin voz en la ventana de padding, así cada
+    frame cuesta O(1) en vez de recorrer la ventana entera. Los frames con energía
+    por debajo de energy_gate se marcan como silencio sin llamar a webrtcvad.
+    collect() recorta los segmentos directamente del buffer original (una sola copia
+    por segmento); feed() hace lo mismo frame a frame para el audio en vivo.
+    """
+
+    def __init__(self, vad, sample_rate, frame_ms=FRAME_MS, padding_ms=PADDING_MS, energy_gate=ENERGY_GATE):
+        self.vad = vad
+        self.sample_rate = sample_rate
+        self.frame_ms = frame_ms
+        self.frame_bytes = int(sample_rate * frame_ms / 1000) * SAMPLE_WIDTH
+        self.num_padding_frames = int(padding_ms / frame_ms)
+        self.threshold = TRIGGER_RATIO * self.num_padding_frames
+        self.energy_gate = energy_gate
+        self.vad_calls = 0  # Frames que llegaron a webrtcvad (para el benchmark)
+        # Modo streaming: frames recientes (padding previo) y frames del segmento abierto
+        self.recent = collections.deque(maxlen=self.num_padding_frames)
+        self.voiced_frames = []
+        self.last_speech = False
+        self.reset()
+
+    def reset(self):
+        self.window = collections.deque()
+        self.num_voiced = 0
+        self.triggered = False
+        self.start_padding = 0
+        self.recent.clear()
+        self.voiced_frames = []
+
+    def _advance(self, is_speech):
+        """
+        Avanza la máquina de estados un frame. Devuelve START al abrir un segmento
+        (start_padding indica cuántos frames previos, incluido este, le pertenecen),
+        END al cerrarlo (incluye este frame) o None.
+        """
+        self.window.append(is_speech)
+        self.num_voiced += is_speech
+        if len(self.window) > self.num_padding_frames:
+            self.num_voiced -= self.window.popleft()
+
+        if not self.triggered:
+            if self.num_voiced > self.threshold:
+                self.triggered = True
+                self.start_padding = len(self.window)
+                self.window.clear()
+                self.num_voiced = 0
+                return START
+        elif len(self.window) - self.num_voiced > self.threshold:
+            self.triggered = False
+            self.window.clear()
+            self.num_voiced = 0
+            return END
+        return None
+
+    def speech_flags(self, audio):
+        """
+        Decide frame a frame si hay voz. Devuelve una lista de booleanos.
+        """
+        frames = frame_view(audio, self.sample_rate, self.frame_ms)
+        loud = frame_energies(frames) >= self.energy_gate
+        view = memoryview(audio).cast("B").toreadonly()
+        flags = [False] * len(frames)
+        for index in np.flatnonzero(loud).tolist():
+            start = index * self.frame_bytes
+            flags[index] = self.vad.is_speech(view[start:start + self.frame_bytes], self.sample_rate)
+        self.vad_calls += int(loud.sum())
+        return flags
+
+    def is_speech(self, frame):
+        if frame_energies(frame_view(frame, self.sample_rate, self.frame_ms))[0] < self.energy_gate:
+            return False
+        self.vad_calls += 1
+        return self.vad.is_speech(frame, self.sample_rate)
+
+    def collect(self, audio):
+        """
+        Recorre el audio y va devolviendo cada segmento de voz (bytes) en cuanto se cierra.
+        """
+        view = memoryview(audio).cast("B")
+        self.reset()
+        segment_start = None
+        for index, is_speech in enumerate(self.speech_flags(audio)):
+            event = self._advance(is_speech)
+            if event == START:
+                # El segmento incluye el padding previo que disparó la detección
+                segment_start = index - self.start_padding + 1
+            elif event == END:
+                yield bytes(view[segment_start * self.frame_bytes:(index + 1) * self.frame_bytes])
+
+        if self.triggered:
+            end = len(view) - len(view) % self.frame_bytes
+            yield bytes(view[segment_start * self.frame_bytes:end])
+        self.reset()
+
+    def feed(self, frame):
+        """
+        Modo streaming: entrega un frame y devuelve el segmento de voz (bytes) si se
+        cerró con él, o None.
+        """
+        frame = bytes(frame)
+        self.recent.append(frame)
+        self.last_speech = self.is_speech(frame)
+        event = self._advance(self.last_speech)
+        if event == START:
+            self.voiced_frames = list(self.recent)[-self.start_padding:]
+        elif event == END:
+            self.voiced_frames.append(frame)
+            segment = b''.join(self.voiced_frames)
+            self.voiced_frames = []
+            return segment
+        elif self.triggered:
+            self.voiced_frames.append(frame)
+        return None
+
+    def flush(self):
+        """
+        Cierra el segmento abierto (si lo hay) y lo devuelve.
+        """
+        segment = b''.join(self.voiced_frames) if self.triggered else None
+        self.reset()
+        return segment
@@ -0,0 +1,148 @@
+# wakeword.py
+
+import os
+import json
+import collections
+from rapidfuzz import fuzz
+
+try:
+    from vosk import Model, KaldiRecognizer, SetLogLevel
+except ImportError:  # El motor local es opcional: sin él se usa el reconocimiento en la nube
+    Model = None
+
+SAMPLE_RATE = 16000
+FRAME_MS = 30  # Duración de cada frame que se entrega al reconocedor
+WINDOW_MS = 1500  # Ventana deslizante sobre la que se puntúan las palabras clave
+MATCH_THRESHOLD = 80  # Mismo umbral de similitud que usaba detect_keyword_in_segment
+VOSK_MODEL_PATH = os.getenv("VOSK_MODEL_PATH", "models/vosk-model-small-es-0.42")
+
+_models = {}
+
+
+def match_keyword(text, keywords, threshold=MATCH_THRESHOLD):
+    """
+    Busca en un texto reconocido (STT en la nube) la primera palabra parecida a una
+    palabra clave. Devuelve (nombre, texto desde esa palabra) o None si no hay ninguna:
+    cualquier otra frase, incluida la voz del propio asistente, no es una detección.
+
+    :param keywords: Diccionario resultado -> palabra clave, como en WakeWordDetector.
+    """
+    lowered = text.lower()
+    position = 0
+    for word in lowered.split():
+        position = lowered.find(word, position)
+        for name, keyword in keywords.items():
+            if keyword and fuzz.ratio(word, keyword.lower()) > threshold:
+                return name, text[position:].strip()
+        position += len(word)
+    return None
+
+
+def load_model(path=VOSK_MODEL_PATH):
+    """
+    Carga el modelo de Vosk una sola vez por proceso. Devuelve None si el motor no
+    está instalado o el modelo no existe.
+    """
+    if Model is None:
+        print("Vosk no está instalado; la palabra clave se detectará en la nube.")
+        return None
+    if not os.path.isdir(path):
+        print(f"No se encontró el modelo de Vosk en {path}; la palabra clave se detectará en la nube.")
+        return None
+    if path not in _models:
+        SetLogLevel(-1)
+        _models[path] = Model(path)
+    return _models[path]
+
+
+class WakeWordDetector:
+    """
+    Detecta palabras clave en local (CPU) sobre un flujo continuo de audio a 16 kHz.
+
+    El reconocedor trabaja con una gramática limitada a las palabras clave más '[unk]',
+    así que decodificar cada frame de 30 ms es barato. Las hipótesis parciales se
+    guardan con la posición en el audio en una ventana deslizante de WINDOW_MS y se
+    puntúan con rapidfuzz contra cada palabra clave (también nombres de varias palabras).
+    La ventana se mide en audio procesado y no en tiempo real: si el reconocedor se
+    atrasa y procesa varios frames de golpe, la ventana sigue abarcando WINDOW_MS de voz.
+
+    Vosk descarta sin avisar las palabras de la gramática que no están en el
+    vocabulario del modelo; si falta alguna palabra clave se lanza ValueError para que
+    el llamador use el reconocimiento en la nube.
+    """
+
+    def __init__(self, keywords, model, sample_rate=SAMPLE_RATE, window_ms=WINDOW_MS,
+                 threshold=MATCH_THRESHOLD):
+        """
+        :param keywords: Diccionario resultado -> frase clave, p. ej. {"Asistente": "asistente", "Stop": "stop"}.
+        :param model: Modelo devuelto por load_model().
+        """
+        self.keywords = {name: phrase.lower().split() for name, phrase in keywords.items() if phrase}
+        self.sample_rate = sample_rate
+        self.frame_bytes = int(sample_rate * FRAME_MS / 1000) * 2  # int16 mono
+        self.window = window_ms / 1000.0
+        self.threshold = threshold
+        self.audio_time = 0.0  # Segundos de audio procesados
+        vocabulary = sorted({word for words in self.keywords.values() for word in words})
+        missing = [word for word in vocabulary if model.find_word(word) == -1]
+        if missing:
+            raise ValueError(f"El modelo de Vosk no conoce {', '.join(repr(word) for word in missing)}: "
+                             f"la palabra clave no se detectaría en local")
+        self.recognizer = KaldiRecognizer(model, sample_rate, json.dumps(vocabulary + ["[unk]"]))
+        self.recent = collections.deque()  # (hora, palabras de la hipótesis)
+        self.last_hypothesis = None
+
+    def reset(self):
+        self.recognizer.Reset()
+        self.recent.clear()
+        self.last_hypothesis = None
+
+    def process(self, frame):
+        """
+        Entrega un frame PCM int16 y devuelve el nombre de la palabra clave detectada
+        o None.
+        """
+        frame = bytes(frame)
+        self.audio_time += len(frame) / (2 * self.sample_rate)
+        if self.recognizer.AcceptWaveform(frame):
+            hypothesis = json.loads(self.recognizer.Result()).get("text", "")
+            self.last_hypothesis = None
+        else:
+            hypothesis = json.loads(self.recognizer.PartialResult()).get("partial", "")
+            # Las parciales se repiten frame a frame mientras no cambian
+            if hypothesis == self.last_hypothesis:
+                return None
+            self.last_hypothesis = hypothesis
+
+        now = self.audio_time
+        while self.recent and now - self.recent[0][0] > self.window:
+            self.recent.popleft()
+        words = [word for word in hypothesis.split() if word != "[unk]"]
+        if not words:
+            return None
+        self.recent.append((now, words))
+
+        detected = self.score()
+        if detected:
+            self.reset()
+        return detected
+
+    def score(self):
+        """
+        Compara cada n-grama de la ventana con las palabras clave y devuelve la mejor
+        por encima del umbral.
+        """
+        window_words = [word for _, words in self.recent for word in words]
+        best_name, best_score = None, 0
+        for name, phrase in self.keywords.items():
+            size = len(phrase)
+            target = " ".join(phrase)
+            for start in range(max(1, len(window_words) - size + 1)):
+                candidate = " ".join(window_words[start:start + size])
+                similarity = fuzz.ratio(candidate, target)
+                if similarity > best_score:
+                    best_name, best_score = name, similarity
+        if best_score > self.threshold:
+            print(f"Palabra clave '{best_name}' detectada en local ({best_score:.0f}%).")
+            return best_name
+        return None